@@ -6,10 +6,16 @@ Debugger v2 - 智能自修复系统
 
 import re
 import json
+import time
 import asyncio
-from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
 from enum import Enum
 from datetime import datetime
+
+from fix_memory import FixMemoryStore, sql_fingerprint
+from schema_catalog import SchemaCatalog
+from sql_guardian import analyze_sql
 # 简化日志
 class SimpleLogger:
     def info(self, msg, **kwargs): print(f"INFO: {msg}")
@@ -18,6 +24,36 @@ class SimpleLogger:
 
 logger = SimpleLogger()
 
+# 错误签名归一化：去掉SQLAlchemy附带的SQL/参数/说明链接，引号内字面量、对象名与数字替换为占位符
+_SQLALCHEMY_TAIL_MARKERS = ('\n[SQL: ', '\n[parameters: ', '\n(Background on this error at:')
+_QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"")
+_OBJECT_NAME_RE = re.compile(
+    r'(table|relation|column|function|schema|database|role|type|index|constraint)(:?\s+)(?!does\b)[a-z_][\w.$]*'
+)
+_NUMBER_RE = re.compile(r'[0-9]+')
+_REGEX_META = frozenset('\\.^$*+?{}[]()|')
+
+# 缺失的表/列名：PostgreSQL（relation "x" / column t.x does not exist）与SQLite（no such table: x）
+_MISSING_TABLE_RE = re.compile(r"(?:table|relation) ['\"]?([\w.]+?)['\"]? does not exist|no such table: ([\w.]+)")
+_MISSING_COLUMN_RE = re.compile(r"column ['\"]?(?:\w+\.)?(\w+)['\"]? does not exist|no such column: (?:\w+\.)?(\w+)")
+
+
+def error_head(error_message: str) -> str:
+    """数据库返回的错误正文（小写），不含SQLAlchemy附带的SQL语句、参数与说明链接"""
+    cut = len(error_message)
+    for marker in _SQLALCHEMY_TAIL_MARKERS:
+        index = error_message.find(marker)
+        if 0 <= index < cut:
+            cut = index
+    return error_message[:cut].lower()
+
+
+def error_signature(error_message: str) -> str:
+    """同类错误（仅表名、列名、字面量、行号不同）归一化为同一签名"""
+    lowered = _QUOTED_RE.sub("'?'", error_head(error_message))
+    lowered = _OBJECT_NAME_RE.sub(r'\1\2?', lowered)
+    return _NUMBER_RE.sub('0', lowered).strip()
+
 class ErrorType(Enum):
     """错误类型枚举"""
     SCHEMA_ERROR = "schema_error"           # Schema相关错误
@@ -29,11 +65,41 @@ class ErrorType(Enum):
 class DebuggerV2:
     """自修复调试器 v2"""
     
-    def __init__(self, max_retries: int = 3):
+    def __init__(self,
+                 max_retries: int = 3,
+                 classification_cache_size: int = 1024,
+                 error_head_cache_size: int = 256,
+                 probe: Optional[Callable[[str], Awaitable[Optional[float]]]] = None,
+                 probe_timeout: float = 0.5,
+                 max_parallel_fixes: int = 4,
+                 fix_memory: Optional[FixMemoryStore] = None,
+                 history_size: int = 1000,
+                 schema_catalog: Optional[SchemaCatalog] = None):
         self.max_retries = max_retries
+        # 计划期校验：probe对候选SQL执行EXPLAIN（不执行查询），返回规划器估算成本，计划失败时抛出异常
+        self.probe = probe
+        self.probe_timeout = probe_timeout
+        # 同一错误匹配多个类型时并发执行的修复策略/校验数上限（1表示只用主类型策略）
+        self.max_parallel_fixes = max(1, max_parallel_fixes)
         self.error_patterns = self._load_error_patterns()
+        self.error_classifier = self._compile_error_classifier(self.error_patterns)
+        # 分类缓存只以归一化签名为键；错误原文的快捷缓存单独限长，大量唯一原文不会挤掉签名条目
+        self.classification_cache_size = classification_cache_size
+        self._classification_cache: "OrderedDict[str, ErrorType]" = OrderedDict()
+        self.error_head_cache_size = error_head_cache_size
+        self._error_head_cache: "OrderedDict[str, ErrorType]" = OrderedDict()
         self.fix_strategies = self._load_fix_strategies()
-        self.fixes_history = []
+        # 线上schema目录（表/列模糊索引），由引擎在schema变更时整体替换
+        self.schema_catalog = schema_catalog
+        # 已验证修复的持久化记忆：同一SQL遇到同类错误时直接重放，不再执行修复策略
+        self.fix_memory = fix_memory
+        # 最近的修复会话（环形缓冲），统计由计数器增量维护
+        self.fixes_history: "deque[Dict[str, Any]]" = deque(maxlen=history_size)
+        self._total_sessions = 0
+        self._successful_sessions = 0
+        self._replayed_sessions = 0
+        self._attempt_rounds = 0
+        self._error_type_counts: Dict[str, int] = {}
         
     def _load_error_patterns(self) -> Dict[ErrorType, List[str]]:
         """加载错误模式"""
@@ -43,6 +109,7 @@ class DebuggerV2:
                 r"column.*does not exist", 
                 r"relation.*does not exist",
                 r"no such table",
+                r"no such column",
                 r"unknown column"
             ],
             ErrorType.SQL_SYNTAX_ERROR: [
@@ -65,6 +132,36 @@ class DebuggerV2:
             ]
         }
     
+    @staticmethod
+    def _required_literal(pattern: str) -> str:
+        """模式匹配时必然出现的最长字面片段；仅支持以.*/.+连接的字面模式，其余返回''（不做预筛）"""
+        pieces = re.split(r'\.[*+]', pattern)
+        if any(_REGEX_META.intersection(piece) for piece in pieces):
+            return ''
+        return max(pieces, key=len)
+    
+    @classmethod
+    def _compile_error_classifier(cls, error_patterns: Dict[ErrorType, List[str]]) -> List[Tuple[ErrorType, Optional[Tuple[str, ...]], "re.Pattern"]]:
+        """每种错误类型的模式编译为一个交替正则，并附关键字预筛：文本不含任一必需字面片段时跳过该类型"""
+        classifier = []
+        for error_type, patterns in error_patterns.items():
+            literals = tuple(cls._required_literal(pattern) for pattern in patterns)
+            classifier.append((
+                error_type,
+                None if '' in literals else literals,
+                re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+            ))
+        return classifier
+    
+    def _classify(self, text: str) -> ErrorType:
+        """按ErrorType顺序返回首个匹配的类型，与逐类型逐模式re.search的优先级一致"""
+        for error_type, literals, pattern in self.error_classifier:
+            if literals is not None and not any(literal in text for literal in literals):
+                continue
+            if pattern.search(text):
+                return error_type
+        return ErrorType.UNKNOWN_ERROR
+    
     def _load_fix_strategies(self) -> Dict[ErrorType, callable]:
         """加载修复策略"""
         return {
@@ -76,23 +173,43 @@ class DebuggerV2:
         }
     
     def detect_error_type(self, error_message: str) -> ErrorType:
-        """检测错误类型"""
-        error_lower = error_message.lower()
-        
-        for error_type, patterns in self.error_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, error_lower):
-                    logger.info(f"检测到错误类型: {error_type.value}", 
-                               pattern=pattern, error=error_message[:100])
-                    return error_type
-        
-        return ErrorType.UNKNOWN_ERROR
+        """检测错误类型：按归一化签名缓存分类结果（有界LRU），错误正文原文另有小缓存作为免归一化的快捷键"""
+        head = error_head(error_message)
+        error_type = self._cached_error_type(self._error_head_cache, head)
+        if error_type is not None:
+            return error_type
+        
+        signature = error_signature(error_message)
+        error_type = self._cached_error_type(self._classification_cache, signature)
+        if error_type is None:
+            error_type = self._classify(signature)
+            if error_type is not ErrorType.UNKNOWN_ERROR:
+                logger.info(f"检测到错误类型: {error_type.value}", error=error_message[:100])
+            self._remember_error_type(self._classification_cache, self.classification_cache_size,
+                                      signature, error_type)
+        
+        self._remember_error_type(self._error_head_cache, self.error_head_cache_size, head, error_type)
+        return error_type
+    
+    @staticmethod
+    def _cached_error_type(cache: "OrderedDict[str, ErrorType]", key: str) -> Optional[ErrorType]:
+        error_type = cache.get(key)
+        if error_type is not None:
+            cache.move_to_end(key)
+        return error_type
+    
+    @staticmethod
+    def _remember_error_type(cache: "OrderedDict[str, ErrorType]", size: int, key: str, error_type: ErrorType):
+        cache[key] = error_type
+        if len(cache) > size:
+            cache.popitem(last=False)
     
     async def auto_fix_sql(self, 
                           original_sql: str, 
                           error_message: str,
-                          context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """自动修复SQL - 主入口"""
+                          context: Optional[Dict[str, Any]] = None,
+                          deadline: Optional[float] = None) -> Dict[str, Any]:
+        """自动修复SQL - 主入口（deadline为time.monotonic()截止时刻，预算耗尽即停止尝试）"""
         fix_session = {
             'original_sql': original_sql,
             'error_message': error_message,
@@ -107,98 +224,293 @@ class DebuggerV2:
         # 检测错误类型
         error_type = self.detect_error_type(error_message)
         
-        # 获取修复策略
-        fix_strategy = self.fix_strategies.get(error_type, self._fix_unknown_error)
+        memory_key = (sql_fingerprint(original_sql), error_signature(error_message))
+        if self.fix_memory is not None:
+            replayed = await self._replay_known_fix(fix_session, memory_key, error_type, deadline)
+            if replayed is not None:
+                return replayed
         
         current_sql = original_sql
+        attempts_made = 0
+        deadline_exceeded = False
         
         for attempt in range(1, self.max_retries + 1):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                deadline_exceeded = True
+                break
+            
+            # 错误同时匹配多个类型时，各类型的修复策略并发生成候选
+            error_types = self._candidate_error_types(error_type, error_message)
             logger.info(f"尝试修复 {attempt}/{self.max_retries}", 
-                       error_type=error_type.value)
+                       error_type=error_type.value,
+                       candidates=len(error_types))
+            attempts_made = attempt
             
             try:
-                # 执行修复策略
-                fix_result = await fix_strategy(
-                    current_sql, 
-                    error_message, 
-                    context, 
-                    attempt
+                # 生成与校验候选（有截止时间时限定在剩余预算内）
+                records, winner = await asyncio.wait_for(
+                    self._run_fix_candidates(
+                        error_types,
+                        current_sql,
+                        error_message,
+                        context,
+                        attempt,
+                        deadline
+                    ),
+                    timeout=remaining
                 )
-                
-                attempt_record = {
+            except asyncio.TimeoutError:
+                logger.warning("修复尝试超出时间预算", attempt=attempt)
+                fix_session['attempts'].append({
                     'attempt': attempt,
                     'error_type': error_type.value,
-                    'fix_strategy': fix_strategy.__name__,
+                    'fix_strategy': self.fix_strategies.get(error_type, self._fix_unknown_error).__name__,
                     'input_sql': current_sql,
-                    'output_sql': fix_result.get('fixed_sql'),
-                    'fix_reason': fix_result.get('fix_reason'),
-                    'confidence': fix_result.get('confidence', 0.5),
+                    'error': 'deadline exceeded',
                     'timestamp': datetime.utcnow().isoformat()
-                }
-                
-                fix_session['attempts'].append(attempt_record)
+                })
+                deadline_exceeded = True
+                break
+            
+            fix_session['attempts'].extend(records)
+            
+            if winner is not None:
+                # 修复成功
+                fix_session['status'] = 'SUCCESS'
+                fix_session['final_sql'] = winner['output_sql']
+                fix_session['end_time'] = datetime.utcnow().isoformat()
                 
-                if fix_result.get('success'):
-                    # 修复成功
-                    fix_session['status'] = 'SUCCESS'
-                    fix_session['final_sql'] = fix_result['fixed_sql']
-                    fix_session['end_time'] = datetime.utcnow().isoformat()
-                    
-                    # 记录到历史
-                    self.fixes_history.append(fix_session)
-                    
-                    logger.info("自修复成功", 
-                               session_id=fix_session['session_id'],
-                               attempts=attempt,
-                               final_sql=fix_result['fixed_sql'][:100])
-                    
-                    return {
-                        'success': True,
-                        'fixed_sql': fix_result['fixed_sql'],
-                        'fix_reason': fix_result['fix_reason'],
-                        'attempts': attempt,
-                        'session_id': fix_session['session_id'],
-                        'error_type': error_type.value
-                    }
-                else:
-                    # 修复失败，准备下次尝试
-                    if fix_result.get('fixed_sql'):
-                        current_sql = fix_result['fixed_sql']
-                    
-                    logger.warning(f"修复尝试{attempt}失败", 
-                                 reason=fix_result.get('fix_reason'))
+                # 记录到历史
+                self._record_session(fix_session)
+                # 只持久化通过计划校验的修复，未经验证的改写不会被反复重放
+                if self.fix_memory is not None and winner.get('probe_status') == 'clean':
+                    await asyncio.to_thread(self.fix_memory.remember, *memory_key,
+                                            winner['output_sql'], winner['fix_reason'], winner['error_type'])
                 
-            except Exception as e:
-                logger.error(f"修复策略执行异常: {e}", attempt=attempt)
+                logger.info("自修复成功", 
+                           session_id=fix_session['session_id'],
+                           attempts=attempt,
+                           final_sql=winner['output_sql'][:100])
                 
-                attempt_record = {
-                    'attempt': attempt,
-                    'error_type': error_type.value,
-                    'fix_strategy': fix_strategy.__name__,
-                    'input_sql': current_sql,
-                    'error': str(e),
-                    'timestamp': datetime.utcnow().isoformat()
+                return {
+                    'success': True,
+                    'fixed_sql': winner['output_sql'],
+                    'fix_reason': winner['fix_reason'],
+                    'attempts': attempt,
+                    'session_id': fix_session['session_id'],
+                    'error_type': winner['error_type'],
+                    'plan_cost': winner.get('plan_cost')
                 }
-                fix_session['attempts'].append(attempt_record)
+            
+            # 修复失败，以置信度最高的候选为基础准备下次尝试
+            carried = next((record for record in records if record.get('output_sql')), None)
+            if carried is not None:
+                current_sql = carried['output_sql']
+                if carried.get('probe_error_message'):
+                    # 候选SQL无法生成执行计划：以计划错误作为新的错误继续
+                    error_message = carried['probe_error_message']
+                    error_type = self.detect_error_type(error_message)
+            
+            for record in records:
+                logger.warning(f"修复尝试{attempt}失败", 
+                             strategy=record['fix_strategy'],
+                             reason=record.get('fix_reason', record.get('error')))
         
-        # 所有尝试都失败
-        fix_session['status'] = 'FAILED'
+        # 所有尝试都失败（或时间预算耗尽）
+        fix_session['status'] = 'DEADLINE_EXCEEDED' if deadline_exceeded else 'FAILED'
         fix_session['end_time'] = datetime.utcnow().isoformat()
-        self.fixes_history.append(fix_session)
+        self._record_session(fix_session)
         
         logger.error("自修复失败", 
                     session_id=fix_session['session_id'],
-                    total_attempts=self.max_retries)
+                    total_attempts=attempts_made,
+                    deadline_exceeded=deadline_exceeded)
         
         return {
             'success': False,
             'original_sql': original_sql,
             'error_message': error_message,
-            'attempts': self.max_retries,
+            'attempts': attempts_made,
+            'deadline_exceeded': deadline_exceeded,
             'session_id': fix_session['session_id'],
             'error_type': error_type.value
         }
     
+    async def _replay_known_fix(self,
+                                fix_session: Dict[str, Any],
+                                memory_key: Tuple[str, str],
+                                error_type: ErrorType,
+                                deadline: Optional[float]) -> Optional[Dict[str, Any]]:
+        """修复记忆命中时重放已验证的修复（配置了probe时仍先做计划校验，失效的记忆被删除）"""
+        known = await asyncio.to_thread(self.fix_memory.lookup, *memory_key)
+        if known is None:
+            return None
+        
+        record = {
+            'attempt': 0,
+            'error_type': known['error_type'] or error_type.value,
+            'fix_strategy': 'fix_memory_replay',
+            'input_sql': fix_session['original_sql'],
+            'output_sql': known['fixed_sql'],
+            'fix_reason': known['fix_reason'],
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        fix_session['attempts'].append(record)
+        
+        if self.probe is not None:
+            probe_error = await self._probe_candidate(known['fixed_sql'], record, deadline)
+            if probe_error is not None:
+                logger.warning("修复记忆已失效，重新修复", error=probe_error[:100])
+                await asyncio.to_thread(self.fix_memory.forget, *memory_key)
+                return None
+        
+        fix_session['status'] = 'SUCCESS'
+        fix_session['replayed'] = True
+        fix_session['final_sql'] = known['fixed_sql']
+        fix_session['end_time'] = datetime.utcnow().isoformat()
+        self._record_session(fix_session)
+        
+        logger.info("重放已知修复", session_id=fix_session['session_id'], hits=known['hits'])
+        
+        return {
+            'success': True,
+            'fixed_sql': known['fixed_sql'],
+            'fix_reason': known['fix_reason'],
+            'attempts': 0,
+            'session_id': fix_session['session_id'],
+            'error_type': record['error_type'],
+            'plan_cost': record.get('plan_cost'),
+            'replayed': True
+        }
+    
+    def _record_session(self, fix_session: Dict[str, Any]):
+        """写入环形历史并增量更新统计计数"""
+        self.fixes_history.append(fix_session)
+        self._total_sessions += 1
+        if fix_session.get('status') == 'SUCCESS':
+            self._successful_sessions += 1
+        if fix_session.get('replayed'):
+            self._replayed_sessions += 1
+        
+        # 同一轮内并发的多个候选只算一次尝试
+        rounds = set()
+        for attempt in fix_session['attempts']:
+            rounds.add(attempt['attempt'])
+            error_type = attempt.get('error_type')
+            if error_type:
+                self._error_type_counts[error_type] = self._error_type_counts.get(error_type, 0) + 1
+        self._attempt_rounds += len(rounds)
+    
+    def _candidate_error_types(self, error_type: ErrorType, error_message: str) -> List[ErrorType]:
+        """主类型在前，其余同时匹配该错误的类型按优先级在后"""
+        error_types = [error_type]
+        if self.max_parallel_fixes > 1:
+            signature = error_signature(error_message)
+            for candidate_type, literals, pattern in self.error_classifier:
+                if candidate_type is error_type:
+                    continue
+                if literals is not None and not any(literal in signature for literal in literals):
+                    continue
+                if pattern.search(signature):
+                    error_types.append(candidate_type)
+        return error_types
+    
+    async def _run_fix_candidates(self,
+                                  error_types: List[ErrorType],
+                                  sql: str,
+                                  error_message: str,
+                                  context: Optional[Dict[str, Any]],
+                                  attempt: int,
+                                  deadline: Optional[float]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """并发执行各修复策略并校验候选，返回(按置信度排序的尝试记录, 胜出记录)
+        
+        置信度高于它的候选都未通过校验时，首个通过校验的候选胜出，其余仍在校验的候选被取消。
+        """
+        semaphore = asyncio.Semaphore(self.max_parallel_fixes)
+        
+        async def generate(error_type: ErrorType) -> Dict[str, Any]:
+            fix_strategy = self.fix_strategies.get(error_type, self._fix_unknown_error)
+            record = {
+                'attempt': attempt,
+                'error_type': error_type.value,
+                'fix_strategy': fix_strategy.__name__,
+                'input_sql': sql,
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            async with semaphore:
+                try:
+                    fix_result = await fix_strategy(sql, error_message, context, attempt)
+                except Exception as e:
+                    logger.error(f"修复策略执行异常: {e}", attempt=attempt)
+                    record['error'] = str(e)
+                    return record
+            record.update({
+                'output_sql': fix_result.get('fixed_sql'),
+                'fix_reason': fix_result.get('fix_reason'),
+                'confidence': fix_result.get('confidence', 0.5),
+                'success': bool(fix_result.get('success'))
+            })
+            return record
+        
+        async def verify(record: Dict[str, Any]) -> bool:
+            async with semaphore:
+                probe_error = await self._probe_candidate(record['output_sql'], record, deadline)
+            if probe_error is None:
+                return True
+            record['success'] = False
+            record['probe_error_message'] = probe_error
+            record['fix_reason'] = f"Plan check failed: {probe_error[:200]}"
+            return False
+        
+        tasks = []
+        try:
+            tasks = [asyncio.create_task(generate(error_type)) for error_type in error_types]
+            records = list(await asyncio.gather(*tasks))
+            # 稳定排序：置信度相同时保持错误类型优先级
+            records.sort(key=lambda record: record.get('confidence', 0.0), reverse=True)
+            ranked = [record for record in records if record.get('success')]
+            if self.probe is None:
+                return records, (ranked[0] if ranked else None)
+            
+            tasks = [asyncio.create_task(verify(record)) for record in ranked]
+            for index, task in enumerate(tasks):
+                if await task:
+                    for record, pending in zip(ranked[index + 1:], tasks[index + 1:]):
+                        if not pending.done():
+                            pending.cancel()
+                            record['probe_status'] = 'cancelled'
+                    return records, ranked[index]
+            return records, None
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _probe_candidate(self,
+                               sql: str,
+                               attempt_record: Dict[str, Any],
+                               deadline: Optional[float]) -> Optional[str]:
+        """在短超时内EXPLAIN候选SQL，结果记入attempt_record；计划正常返回None，否则返回错误信息"""
+        timeout = self.probe_timeout
+        if deadline is not None:
+            timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+        
+        started = time.perf_counter()
+        try:
+            plan_cost = await asyncio.wait_for(self.probe(sql), timeout=timeout)
+            attempt_record['probe_status'] = 'clean'
+            attempt_record['plan_cost'] = plan_cost
+            return None
+        except asyncio.TimeoutError:
+            attempt_record['probe_status'] = 'timeout'
+            return f"EXPLAIN timeout after {timeout:.3f}s"
+        except Exception as e:
+            attempt_record['probe_status'] = 'error'
+            attempt_record['probe_error'] = str(e)[:500]
+            return str(e)
+        finally:
+            attempt_record['probe_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    
     async def _fix_schema_error(self, 
                                sql: str, 
                                error: str, 
@@ -208,19 +520,20 @@ class DebuggerV2:
         logger.info("执行Schema错误修复策略")
         
         # 提取错误的表名或列名
-        table_match = re.search(r"table ['\"]?(\w+)['\"]? does not exist", error.lower())
-        column_match = re.search(r"column ['\"]?(\w+)['\"]? does not exist", error.lower())
+        head = error_head(error)
+        table_match = _MISSING_TABLE_RE.search(head)
+        column_match = _MISSING_COLUMN_RE.search(head)
         
         if table_match:
-            missing_table = table_match.group(1)
+            missing_table = table_match.group(1) or table_match.group(2)
             
-            # 模拟RAG检索 - 查找相似表名
+            # 在schema目录中检索相似表名
             similar_tables = await self._rag_search_tables(missing_table)
             
             if similar_tables:
                 # 替换表名
                 fixed_sql = re.sub(
-                    rf'\b{missing_table}\b', 
+                    rf'\b{re.escape(missing_table)}\b', 
                     similar_tables[0], 
                     sql, 
                     flags=re.IGNORECASE
@@ -234,9 +547,9 @@ class DebuggerV2:
                 }
         
         elif column_match:
-            missing_column = column_match.group(1)
+            missing_column = column_match.group(1) or column_match.group(2)
             
-            # 模拟列名修复
+            # 在SQL引用的表中检索相似列名
             similar_columns = await self._rag_search_columns(missing_column, sql)
             
             if similar_columns:
@@ -440,73 +753,58 @@ class DebuggerV2:
         return simplified
     
     async def _rag_search_tables(self, missing_table: str) -> List[str]:
-        """RAG检索相似表名"""
-        # 模拟RAG检索
-        available_tables = [
-            'users', 'user_profiles', 'customers',
-            'products', 'product_catalog', 'items',
-            'orders', 'order_items', 'transactions',
-            'categories', 'tags', 'labels'
-        ]
-        
-        # 简单的相似度匹配
-        similar = []
-        missing_lower = missing_table.lower()
-        
-        for table in available_tables:
-            if missing_lower in table.lower() or table.lower() in missing_lower:
-                similar.append(table)
-        
-        return similar[:3]  # 返回最多3个相似表
+        """在schema目录中检索相似表名（编辑距离优先）；未加载目录时不做猜测"""
+        if self.schema_catalog is None:
+            return []
+        return self.schema_catalog.similar_tables(missing_table)
     
     async def _rag_search_columns(self, missing_column: str, sql: str) -> List[str]:
-        """RAG检索相似列名"""
-        # 模拟列名映射
-        column_mapping = {
-            'name': ['username', 'full_name', 'display_name'],
-            'email': ['email_address', 'contact_email', 'user_email'],
-            'id': ['user_id', 'product_id', 'order_id'],
-            'price': ['cost', 'amount', 'total'],
-            'date': ['created_at', 'updated_at', 'timestamp']
-        }
-        
+        """只在SQL实际引用的表中检索相似列名，缺失列所属的表（按别名/限定名解析）优先"""
+        if self.schema_catalog is None:
+            return []
+        analysis = analyze_sql(sql)
         missing_lower = missing_column.lower()
-        
-        for key, alternatives in column_mapping.items():
-            if key in missing_lower or missing_lower in key:
-                return alternatives[:2]
-        
-        return []
+        owners = [table for table, columns in analysis['columns'].items() if missing_lower in columns]
+        return self.schema_catalog.similar_columns(missing_column, analysis['tables'], owners)
     
     def get_fix_statistics(self) -> Dict[str, Any]:
         """获取修复统计信息"""
-        if not self.fixes_history:
+        if not self._total_sessions:
             return {'total_sessions': 0}
         
-        total_sessions = len(self.fixes_history)
-        successful_sessions = len([s for s in self.fixes_history if s.get('status') == 'SUCCESS'])
-        
-        error_type_counts = {}
-        for session in self.fixes_history:
-            for attempt in session.get('attempts', []):
-                error_type = attempt.get('error_type')
-                if error_type:
-                    error_type_counts[error_type] = error_type_counts.get(error_type, 0) + 1
-        
         return {
-            'total_sessions': total_sessions,
-            'successful_sessions': successful_sessions,
-            'success_rate': successful_sessions / total_sessions if total_sessions > 0 else 0,
-            'error_type_distribution': error_type_counts,
-            'average_attempts': sum(len(s.get('attempts', [])) for s in self.fixes_history) / total_sessions if total_sessions > 0 else 0
+            'total_sessions': self._total_sessions,
+            'successful_sessions': self._successful_sessions,
+            'replayed_sessions': self._replayed_sessions,
+            'success_rate': self._successful_sessions / self._total_sessions,
+            'error_type_distribution': dict(self._error_type_counts),
+            'average_attempts': self._attempt_rounds / self._total_sessions,
+            'fix_memory_entries': len(self.fix_memory) if self.fix_memory is not None else 0
         }
 
 # 全局实例
 _debugger_instance = None
 
-def get_debugger(max_retries: int = 3) -> DebuggerV2:
+def get_debugger(max_retries: int = 3,
+                 probe: Optional[Callable[[str], Awaitable[Optional[float]]]] = None,
+                 probe_timeout: float = 0.5,
+                 max_parallel_fixes: int = 4,
+                 fix_memory: Optional[FixMemoryStore] = None,
+                 history_size: int = 1000,
+                 schema_catalog: Optional[SchemaCatalog] = None) -> DebuggerV2:
     """获取全局Debugger实例"""
     global _debugger_instance
     if _debugger_instance is None:
-        _debugger_instance = DebuggerV2(max_retries)
+        _debugger_instance = DebuggerV2(max_retries, probe=probe, probe_timeout=probe_timeout,
+                                        max_parallel_fixes=max_parallel_fixes,
+                                        fix_memory=fix_memory, history_size=history_size,
+                                        schema_catalog=schema_catalog)
+    else:
+        if probe is not None:
+            _debugger_instance.probe = probe
+            _debugger_instance.probe_timeout = probe_timeout
+        if fix_memory is not None:
+            _debugger_instance.fix_memory = fix_memory
+        if schema_catalog is not None:
+            _debugger_instance.schema_catalog = schema_catalog
     return _debugger_instance
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+Debugger修复记忆：已验证的修复持久化到SQLite（WAL），同一SQL遇到同类错误时直接重放
+女娲造物：前事不忘，后事之师
+"""
+
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fix_memory (
+    sql_fingerprint TEXT NOT NULL,
+    error_signature TEXT NOT NULL,
+    fixed_sql TEXT NOT NULL,
+    fix_reason TEXT,
+    error_type TEXT,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    PRIMARY KEY (sql_fingerprint, error_signature)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fix_memory_last_used ON fix_memory (last_used_at);
+"""
+
+
+def sql_fingerprint(sql: str) -> str:
+    """SQL指纹：合并空白、去掉结尾分号；字面量保留（重放的是完整的修复后SQL，字面量不同即不同查询）"""
+    normalized = _WHITESPACE_RE.sub(' ', sql.strip()).rstrip(';').rstrip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class FixMemoryStore:
+    """(SQL指纹, 错误签名) → 修复后SQL，主键索引查询；条目数超上限时淘汰最久未用的条目"""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # 连接在线程池线程间共享，由锁串行化
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._entries = self._conn.execute("SELECT count(*) FROM fix_memory").fetchone()[0]
+        logger.info("修复记忆已加载", path=path, entries=self._entries)
+
+    def __len__(self) -> int:
+        return self._entries
+
+    def lookup(self, fingerprint: str, signature: str) -> Optional[Dict[str, Any]]:
+        """命中时更新命中次数与最近使用时间"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fixed_sql, fix_reason, error_type, hits FROM fix_memory "
+                "WHERE sql_fingerprint = ? AND error_signature = ?",
+                (fingerprint, signature)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE fix_memory SET hits = hits + 1, last_used_at = ? "
+                "WHERE sql_fingerprint = ? AND error_signature = ?",
+                (time.time(), fingerprint, signature)
+            )
+        return {'fixed_sql': row[0], 'fix_reason': row[1], 'error_type': row[2], 'hits': row[3] + 1}
+
+    def remember(self,
+                 fingerprint: str,
+                 signature: str,
+                 fixed_sql: str,
+                 fix_reason: Optional[str] = None,
+                 error_type: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO fix_memory (sql_fingerprint, error_signature, fixed_sql, fix_reason, error_type, "
+                "created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (sql_fingerprint, error_signature) DO NOTHING",
+                (fingerprint, signature, fixed_sql, fix_reason, error_type, now, now)
+            )
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    "UPDATE fix_memory SET fixed_sql = ?, fix_reason = ?, error_type = ?, last_used_at = ? "
+                    "WHERE sql_fingerprint = ? AND error_signature = ?",
+                    (fixed_sql, fix_reason, error_type, now, fingerprint, signature)
+                )
+                return
+
+            self._entries += 1
+            if self._entries > self.max_entries:
+                cursor = self._conn.execute(
+                    "DELETE FROM fix_memory WHERE (sql_fingerprint, error_signature) IN ("
+                    "SELECT sql_fingerprint, error_signature FROM fix_memory ORDER BY last_used_at LIMIT ?)",
+                    (self._entries - self.max_entries,)
+                )
+                self._entries -= cursor.rowcount
+
+    def forget(self, fingerprint: str, signature: str):
+        """重放的修复已失效（如schema变更后计划校验失败）时删除"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM fix_memory WHERE sql_fingerprint = ? AND error_signature = ?",
+                (fingerprint, signature)
+            )
+            self._entries -= cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,127 @@
+"""
+LLM调用的定向重试：仅重试瞬时错误，遵循retry-after，受截止时间与全局重试预算约束
+女娲造物：知止而后有定
+"""
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+import structlog
+
+try:
+    import anthropic
+except ImportError:
+    anthropic = None
+
+logger = structlog.get_logger()
+
+# 可重试的HTTP状态：请求超时、冲突、限流与服务端错误（含529 overloaded）
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+
+
+class RetryBudget:
+    """全局重试令牌桶：按固定速率补充，上游故障期间重试总量有上限，不会成倍放大负载"""
+
+    def __init__(self, capacity: float = 10, refill_per_second: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.clock = clock
+        self.tokens = capacity
+        self._updated = clock()
+
+    def try_acquire(self) -> bool:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def is_transient(error: Exception) -> bool:
+    """连接/超时错误与可重试状态码视为瞬时错误；业务错误（如SQLGuardian拦截的ValueError）不重试"""
+    if anthropic is not None:
+        if isinstance(error, anthropic.APIConnectionError):
+            return True
+        if isinstance(error, anthropic.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+        return False
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """从错误响应的retry-after-ms / retry-after头读取服务端建议的等待时间"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def call_with_retry(attempt: Callable[[], Awaitable[Any]],
+                          deadline: Optional[float],
+                          budget: Optional[RetryBudget],
+                          max_attempts: int = 3,
+                          base_delay: float = 0.5,
+                          max_delay: float = 8.0,
+                          on_retry: Optional[Callable[[str], None]] = None,
+                          clock: Callable[[], float] = time.monotonic,
+                          sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep) -> Any:
+    """执行attempt，瞬时错误时按retry-after或带抖动的指数退避重试
+
+    deadline为clock()时间轴上的截止时刻：等待后会超过截止时间则不再重试。
+    on_retry接收结果标签：retried / attempts_exhausted / deadline_exceeded / budget_exhausted。
+    """
+    def report(outcome: str):
+        if on_retry is not None:
+            on_retry(outcome)
+
+    for attempt_number in range(1, max_attempts + 1):
+        try:
+            return await attempt()
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            if attempt_number == max_attempts:
+                report('attempts_exhausted')
+                raise
+
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt_number - 1)))
+            if deadline is not None and clock() + delay >= deadline:
+                report('deadline_exceeded')
+                raise
+            if budget is not None and not budget.try_acquire():
+                report('budget_exhausted')
+                raise
+
+            report('retried')
+            logger.warning("LLM调用瞬时失败，准备重试",
+                           attempt=attempt_number,
+                           delay_seconds=round(delay, 3),
+                           error=str(e)[:200])
+            await sleep(delay)
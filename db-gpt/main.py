@@ -6,31 +6,113 @@ DB-GPT Text2SQL 主服务
 import os
 import json
 import asyncio
+import time
+import hashlib
+import functools
 import yaml
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 import structlog
-from prometheus_client import Counter, Histogram, generate_latest
+from prometheus_client import Counter, Histogram, Gauge, generate_latest
+from sqlalchemy import text, event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from anthropic import AsyncAnthropic
-import chromadb
-from tenacity import retry, stop_after_attempt, wait_exponential
+
+from sql_guardian import SQLGuardian, analyze_sql, is_query, probe_sql, scan_partial_sql, statement_end
+from prompt_builder import PromptBuilder, StableSchemaPrefix
+from model_router import ModelRouter
+from llm_retry import RetryBudget, call_with_retry
 
 # 配置结构化日志
 logger = structlog.get_logger()
 
+# 请求级截止时间（time.monotonic()时间轴）：端点设置后沿调用链以剩余预算下传给LLM、数据库与自动修复
+request_deadline: ContextVar[Optional[float]] = ContextVar('request_deadline', default=None)
+
+SQL_SYSTEM_PROMPT = "你是一个SQL专家。基于提供的数据库schema，将自然语言查询转换为正确的SQL语句。只返回SQL语句，不要包含其他解释。"
+
 # Prometheus指标
 sql_generation_counter = Counter('text2sql_generation_total', 'Total SQL generation requests')
 sql_execution_counter = Counter('text2sql_execution_total', 'Total SQL executions', ['status'])
 response_time_histogram = Histogram('text2sql_response_seconds', 'Response time in seconds')
 token_usage_counter = Counter('text2sql_tokens_total', 'Total tokens used', ['type'])
+model_route_counter = Counter('text2sql_model_route_total', 'LLM generation calls by model', ['model', 'reason'])
+model_escalation_counter = Counter('text2sql_model_escalations_total', 'Escalations from the fast model to the strong model', ['reason'])
+llm_latency_histogram = Histogram(
+    'text2sql_llm_latency_seconds',
+    'LLM generation latency',
+    ['model'],
+    buckets=[0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0]
+)
+llm_ttft_histogram = Histogram(
+    'text2sql_llm_time_to_first_token_seconds',
+    'Time from request to first streamed LLM token',
+    ['model'],
+    buckets=[0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0]
+)
+request_deadline_exceeded_counter = Counter('text2sql_request_deadline_exceeded_total', 'Requests cancelled at their deadline', ['endpoint'])
+llm_retry_counter = Counter('text2sql_llm_retries_total', 'LLM retry decisions on transient errors', ['outcome'])
+autofix_probe_counter = Counter('text2sql_autofix_probe_total', 'EXPLAIN plan checks of auto-fix candidates', ['outcome'])
+llm_stream_stop_counter = Counter('text2sql_llm_stream_early_stops_total', 'LLM streams stopped before the model finished', ['reason'])
+response_format_counter = Counter('text2sql_response_format_total', 'Responses by negotiated format', ['format'])
+batch_item_counter = Counter('text2sql_batch_items_total', 'Batch text2sql items', ['status'])
+cache_hit_counter = Counter('text2sql_cache_hits_total', 'Text2SQL cache hits', ['tier'])
+cache_miss_counter = Counter('text2sql_cache_misses_total', 'Text2SQL cache misses')
+cache_eviction_counter = Counter('text2sql_cache_evictions_total', 'Text2SQL cache evictions', ['reason'])
+semantic_cache_counter = Counter('text2sql_semantic_cache_total', 'Semantic cache lookups', ['outcome'])
+db_pool_in_use_gauge = Gauge('text2sql_db_pool_connections_in_use', 'Connections checked out of the pool', ['pool'])
+db_pool_size_gauge = Gauge('text2sql_db_pool_size', 'Configured pool size (excluding overflow)', ['pool'])
+# 取得连接耗时：池排队等待 + 新建连接 + pre_ping，不单指排队等待
+db_connection_acquire_gauge = Gauge(
+    'text2sql_db_connection_acquire_seconds',
+    'Most recent connection acquire time (pool wait, connect and pre-ping)',
+    ['pool']
+)
+db_connection_acquire_histogram = Histogram(
+    'text2sql_db_connection_acquire_seconds_distribution',
+    'Connection acquire time (pool wait, connect and pre-ping)',
+    ['pool'],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+db_route_counter = Counter('text2sql_db_route_total', 'SELECT routing decisions', ['target'])
+db_replica_healthy_gauge = Gauge('text2sql_db_replica_healthy', 'Read replica health (1 healthy, 0 down)', ['replica'])
+result_truncated_counter = Counter('text2sql_result_truncated_total', 'Results truncated at the row cap')
+schema_retrieval_histogram = Histogram(
+    'text2sql_schema_retrieval_seconds',
+    'Schema retrieval latency',
+    ['mode', 'source', 'status'],
+    buckets=[0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+)
+prompt_tokens_histogram = Histogram(
+    'text2sql_prompt_tokens',
+    'Prompt input tokens before/after schema compression (local count)',
+    ['stage'],
+    buckets=[250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000]
+)
+prompt_pruning_counter = Counter('text2sql_prompt_pruning_total', 'Schema elements removed to fit the prompt budget', ['kind'])
+schema_bridge_table_counter = Counter('text2sql_schema_bridge_tables_total', 'Bridge tables added by FK graph expansion')
+schema_ingest_chunk_counter = Counter('text2sql_schema_ingest_chunks_total', 'Schema chunks per ingestion run', ['outcome'])
+semantic_similarity_histogram = Histogram(
+    'text2sql_semantic_cache_similarity',
+    'Best cosine similarity per semantic cache lookup',
+    ['outcome'],
+    buckets=[0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.95, 0.98, 1.0]
+)
+
+# 列式结果的内容协商类型
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.text2sql.columnar+json"
 
 # 请求/响应模型
 class Text2SQLRequest(BaseModel):
@@ -38,6 +120,16 @@ class Text2SQLRequest(BaseModel):
     context: Optional[Dict[str, Any]] = None
     session_id: Optional[str] = None
 
+class Text2SQLBatchItem(BaseModel):
+    query: str
+    context: Optional[Dict[str, Any]] = None
+
+class Text2SQLBatchRequest(BaseModel):
+    queries: List[Text2SQLBatchItem]
+    execute: bool = True
+    max_concurrency: Optional[int] = None
+    session_id: Optional[str] = None
+
 class Text2SQLResponse(BaseModel):
     sql: str
     result: Optional[List[Dict[str, Any]]] = None
@@ -45,6 +137,7 @@ class Text2SQLResponse(BaseModel):
     confidence: float
     execution_time_ms: float
     tokens_used: Dict[str, int]
+    truncated: bool = False
 
 # 初始化FastAPI应用
 app = FastAPI(
@@ -68,12 +161,60 @@ class Text2SQLEngine:
     def __init__(self):
         self.db_engine = None
         self.async_session = None
+        self.replica_router = None
+        self.statement_timeout_ms = 30000
         self.anthropic_client = None
         self.vector_db = None
+        self.schema_collection = None
+        self.schema_index = None
+        self.schema_graph = None
+        self.schema_token_budget = int(os.getenv('SCHEMA_TOKEN_BUDGET', '2000'))
+        # 提示缓存：高频表schema组成稳定前缀放入system并标记cache_control
+        self.prompt_cache_enabled = os.getenv('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+        self.prompt_builder = PromptBuilder(
+            token_budget=int(os.getenv('PROMPT_TOKEN_BUDGET', '4000')),
+            prefix=StableSchemaPrefix(
+                token_budget=int(os.getenv('PROMPT_PREFIX_TOKEN_BUDGET', '2000')),
+                refresh_seconds=float(os.getenv('PROMPT_PREFIX_REFRESH_SECONDS', '3600'))
+            ) if self.prompt_cache_enabled else None
+        )
+        self.llm_streaming = os.getenv('LLM_STREAMING_ENABLED', 'true').lower() == 'true'
+        # 只重试瞬时LLM错误：单请求截止时间 + 全局重试令牌桶
+        self.llm_request_deadline_seconds = float(os.getenv('LLM_REQUEST_DEADLINE_SECONDS', '60'))
+        self.llm_max_attempts = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+        self.llm_retry_budget = RetryBudget(
+            capacity=float(os.getenv('LLM_RETRY_BUDGET_CAPACITY', '10')),
+            refill_per_second=float(os.getenv('LLM_RETRY_BUDGET_REFILL_PER_SECOND', '0.5'))
+        )
+        self.model_router = ModelRouter(
+            fast_model=os.getenv('MODEL_ROUTER_FAST_MODEL', 'claude-3-haiku-20240307'),
+            strong_model=os.getenv('MODEL_ROUTER_STRONG_MODEL', 'claude-3-opus-20240229'),
+            max_query_chars=int(os.getenv('MODEL_ROUTER_MAX_QUERY_CHARS', '80')),
+            max_tables=int(os.getenv('MODEL_ROUTER_MAX_TABLES', '1')),
+            near_miss_similarity=float(os.getenv('MODEL_ROUTER_NEAR_MISS_SIMILARITY', '0.85')),
+            min_confidence=float(os.getenv('MODEL_ROUTER_MIN_CONFIDENCE', '0.8')),
+            enabled=os.getenv('MODEL_ROUTER_ENABLED', 'true').lower() == 'true'
+        )
+        self.schema_refresh_task = None
+        # chromadb.HttpClient是同步客户端，所有调用在专用有界线程池中执行
+        self.vector_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('VECTOR_DB_MAX_WORKERS', '8')),
+            thread_name_prefix='chroma'
+        )
         self.promptx_agents = {}
         self.security_config = {}
         self.config_file_path = Path(__file__).parent.parent / "config" / "security" / "allowed_tables.yml"
         self.config_last_modified = 0
+        self.sql_guardian = SQLGuardian(self.security_config)
+        self.config_watcher_task = None
+        self.whitelist_version = "default"
+        self.schema_fingerprint = "unknown"
+        self.query_cache = None
+        self.cache_results = False
+        self.semantic_cache = None
+        # 与llm-proxy速率限制对齐的全局LLM并发上限
+        self.llm_max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+        self.llm_semaphore = asyncio.Semaphore(self.llm_max_concurrency)
         
     async def initialize(self):
         """初始化所有组件"""
@@ -81,23 +222,38 @@ class Text2SQLEngine:
         
         # 数据库连接
         db_url = f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-        self.db_engine = create_async_engine(db_url, echo=True)
+        self.db_engine = self._create_db_engine(db_url, pool_label='primary')
         self.async_session = sessionmaker(self.db_engine, class_=AsyncSession, expire_on_commit=False)
+        self._init_read_replicas()
         
         # Claude客户端（通过代理）
         self.anthropic_client = AsyncAnthropic(
             api_key=os.getenv('ANTHROPIC_API_KEY'),
-            base_url=os.getenv('LLM_PROXY_URL', 'http://llm-proxy:8080')
+            base_url=os.getenv('LLM_PROXY_URL', 'http://llm-proxy:8080'),
+            # 重试由_call_llm统一控制，关闭SDK内置重试以免叠加
+            max_retries=0
         )
         
-        # 向量数据库
+        # 向量数据库（延迟导入，测试与离线工具无需安装chromadb）
+        import chromadb
         self.vector_db = chromadb.HttpClient(host=os.getenv('VECTOR_DB_URL', 'http://chromadb:8000'))
+        try:
+            await self._get_schema_collection()
+        except Exception:
+            pass
         
         # 加载Promptx智能体
         await self._load_promptx_agents()
         
-        # 加载安全配置
+        # 加载安全配置并监听变更
         await self._load_security_config()
+        self._start_security_config_watcher()
+        
+        # 查询缓存
+        await self._init_query_cache()
+        await self._refresh_schema_fingerprint()
+        await self._init_schema_index()
+        await self._init_semantic_cache()
         
         # 启动Token指标导出器
         await self._start_metrics_exporter()
@@ -107,6 +263,97 @@ class Text2SQLEngine:
         
         logger.info("Text2SQL引擎初始化完成")
     
+    def _create_db_engine(self, db_url: str, pool_label: str):
+        """按环境变量配置连接池与asyncpg语句缓存，并挂载池指标"""
+        pool_size = int(os.getenv('DB_POOL_SIZE', '20'))
+        max_overflow = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+        statement_cache_size = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '500'))
+        db_engine = create_async_engine(
+            # SQLAlchemy侧的预编译语句缓存（pgbouncer事务模式下需设为0）
+            f"{db_url}?prepared_statement_cache_size={statement_cache_size}",
+            echo=os.getenv('DB_ECHO', 'false').lower() == 'true',
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '10')),
+            pool_recycle=int(os.getenv('DB_POOL_RECYCLE_SECONDS', '1800')),
+            pool_pre_ping=os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+            connect_args={'statement_cache_size': statement_cache_size}
+        )
+        
+        pool = db_engine.sync_engine.pool
+        db_pool_size_gauge.labels(pool=pool_label).set(pool_size)
+        
+        # checkin事件在连接放回池之前触发，此时pool.checkedout()仍计入该连接，故按事件增减
+        in_use = db_pool_in_use_gauge.labels(pool=pool_label)
+        event.listen(pool, 'checkout', lambda *_: in_use.inc())
+        event.listen(pool, 'checkin', lambda *_: in_use.dec())
+        
+        logger.info("数据库连接池已配置", pool=pool_label, pool_size=pool_size, max_overflow=max_overflow)
+        return db_engine
+    
+    def _init_read_replicas(self):
+        """按DB_READ_REPLICAS（host:port,逗号分隔，凭据与主库一致）创建只读副本路由"""
+        hosts = [host.strip() for host in os.getenv('DB_READ_REPLICAS', '').split(',') if host.strip()]
+        if not hosts:
+            return
+        
+        from replica_router import ReadReplicaRouter
+        
+        replicas = []
+        for host in hosts:
+            if ':' not in host:
+                host = f"{host}:{os.getenv('DB_PORT', '5432')}"
+            replica_url = f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{host}/{os.getenv('DB_NAME')}"
+            replicas.append((host, self._create_db_engine(replica_url, pool_label=host)))
+        
+        self.replica_router = ReadReplicaRouter(
+            replicas,
+            health_interval_seconds=float(os.getenv('DB_REPLICA_HEALTH_INTERVAL_SECONDS', '5')),
+            on_health_change=lambda name, healthy: db_replica_healthy_gauge.labels(replica=name).set(1 if healthy else 0)
+        )
+        self.replica_router.start()
+        logger.info("只读副本路由已启用", replicas=hosts)
+    
+    @asynccontextmanager
+    async def _db_session(self, session_factory=None, pool_label: str = 'primary'):
+        """取得会话并立即签出连接（记录取得连接耗时，含池等待、新建连接与pre_ping），事务内设置语句超时"""
+        async with (session_factory or self.async_session)() as session:
+            started = time.perf_counter()
+            await session.connection()
+            acquired = time.perf_counter() - started
+            db_connection_acquire_gauge.labels(pool=pool_label).set(acquired)
+            db_connection_acquire_histogram.labels(pool=pool_label).observe(acquired)
+            
+            await self._apply_statement_timeout(session)
+            yield session
+    
+    async def _apply_statement_timeout(self, session: AsyncSession):
+        """SET LOCAL仅作用于当前事务，回滚后需重新设置；有请求截止时间时取其剩余预算与配置的较小值"""
+        if session.bind.dialect.name != 'postgresql':
+            return
+        timeout_ms = self.statement_timeout_ms
+        remaining = _remaining_seconds()
+        if remaining is not None:
+            remaining_ms = max(1, int(remaining * 1000))
+            timeout_ms = min(timeout_ms, remaining_ms) if timeout_ms > 0 else remaining_ms
+        if timeout_ms > 0:
+            await session.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+    
+    async def _run_vector(self, func, *args, **kwargs):
+        """在Chroma线程池中执行同步调用，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.vector_executor, functools.partial(func, *args, **kwargs))
+    
+    async def _get_schema_collection(self):
+        """db_schema集合句柄只解析一次；启动时Chroma不可用则在下次检索时重试"""
+        if self.schema_collection is None:
+            try:
+                self.schema_collection = await self._run_vector(self.vector_db.get_or_create_collection, "db_schema")
+            except Exception as e:
+                logger.warning(f"db_schema集合获取失败: {str(e)}")
+                raise
+        return self.schema_collection
+    
     async def _load_promptx_agents(self):
         """加载Promptx智能体配置"""
         agents_dir = "/app/promptx/agents"
@@ -122,62 +369,413 @@ class Text2SQLEngine:
         logger.info("PromptX智能体配置加载完成", agents=list(self.promptx_agents.keys()))
     
     async def _load_security_config(self):
-        """加载安全配置"""
+        """加载安全配置（文件读取与解析在线程中完成）"""
         try:
-            if self.config_file_path.exists():
-                with open(self.config_file_path, 'r', encoding='utf-8') as f:
-                    self.security_config = yaml.safe_load(f)
-                self.config_last_modified = self.config_file_path.stat().st_mtime
+            loaded = await asyncio.to_thread(self._read_security_config)
+            if loaded is not None:
+                self._apply_security_config(*loaded)
                 logger.info("安全配置加载成功", tables_count=len(self.security_config.get('allowed_tables', [])))
             else:
                 # 默认配置
-                self.security_config = {
+                default_config = {
                     'allowed_tables': ['users', 'products', 'orders', 'categories', 'inventory'],
                     'query_limits': {'max_joins': 5, 'max_subqueries': 3}
                 }
+                self._apply_security_config(default_config, SQLGuardian(default_config), 0)
                 logger.warning("安全配置文件不存在，使用默认配置")
         except Exception as e:
             logger.error(f"安全配置加载失败: {str(e)}")
-            self.security_config = {'allowed_tables': []}
+            empty_config = {'allowed_tables': []}
+            self._apply_security_config(empty_config, SQLGuardian(empty_config), 0)
     
-    async def _reload_security_config_if_needed(self):
-        """检查并重新加载安全配置（热加载）"""
+    def _read_security_config(self) -> Optional[Tuple[Dict[str, Any], SQLGuardian, float]]:
+        """读取、校验配置并预构建验证器 - 在线程中执行，不阻塞事件循环"""
+        if not self.config_file_path.exists():
+            return None
+        
+        mtime = self.config_file_path.stat().st_mtime
+        with open(self.config_file_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+        
+        if not isinstance(config, dict):
+            raise ValueError("安全配置必须是YAML映射")
+        if not isinstance(config.get('allowed_tables', []), list):
+            raise ValueError("allowed_tables必须是列表")
+        if not isinstance(config.get('table_permissions') or {}, dict):
+            raise ValueError("table_permissions必须是映射")
+        if not isinstance(config.get('query_limits') or {}, dict):
+            raise ValueError("query_limits必须是映射")
+        
+        return config, SQLGuardian(config), mtime
+    
+    def _apply_security_config(self, config: Dict[str, Any], guardian: SQLGuardian, mtime: float):
+        """切换到新的安全策略（同步赋值，请求路径看到的始终是完整的一版）"""
+        self.security_config = config
+        self.sql_guardian = guardian
+        self.whitelist_version = self._compute_whitelist_version(config)
+        self.config_last_modified = mtime
+        max_seconds = (config.get('query_limits') or {}).get('max_execution_time_seconds', 30)
+        self.statement_timeout_ms = int(float(max_seconds) * 1000)
+    
+    @staticmethod
+    def _compute_whitelist_version(security_config: Dict[str, Any]) -> str:
+        """白名单版本 = 配置声明版本 + 内容哈希（热加载改表但未改version时同样失效缓存）"""
+        digest = hashlib.sha1(
+            json.dumps(security_config, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:12]
+        return f"{security_config.get('version', 'none')}:{digest}"
+    
+    async def _reload_security_config(self):
+        """重新加载安全配置（热加载），解析或校验失败时保留当前策略"""
         try:
-            if self.config_file_path.exists():
-                current_mtime = self.config_file_path.stat().st_mtime
-                if current_mtime > self.config_last_modified:
-                    # 记录变更前后差异
-                    old_tables = set(self.security_config.get('allowed_tables', []))
-                    
-                    await self._load_security_config()
-                    
-                    new_tables = set(self.security_config.get('allowed_tables', []))
-                    
-                    # 计算变更
-                    added_tables = new_tables - old_tables
-                    removed_tables = old_tables - new_tables
-                    
-                    tables_diff = {
-                        'added': list(added_tables),
-                        'removed': list(removed_tables),
-                        'total_before': len(old_tables),
-                        'total_after': len(new_tables)
-                    }
-                    
-                    logger.info("安全配置热重载完成", 
-                               tables_diff=tables_diff,
-                               config_file=str(self.config_file_path),
-                               reload_time=datetime.utcnow().isoformat())
-                    
-                    # SQLGuardian事件记录
-                    if added_tables or removed_tables:
-                        logger.warning("SQLGuardian白名单变更检测", 
-                                     security_event="WHITELIST_CHANGED",
-                                     added_tables=list(added_tables),
-                                     removed_tables=list(removed_tables))
-                        
+            loaded = await asyncio.to_thread(self._read_security_config)
         except Exception as e:
             logger.error(f"配置热重载失败: {str(e)}")
+            return
+        
+        if loaded is None:
+            logger.warning("安全配置文件不存在，保留当前配置", config_file=str(self.config_file_path))
+            return
+        
+        # 记录变更前后差异
+        old_tables = set(self.security_config.get('allowed_tables', []))
+        
+        self._apply_security_config(*loaded)
+        
+        new_tables = set(self.security_config.get('allowed_tables', []))
+        
+        # 计算变更
+        added_tables = new_tables - old_tables
+        removed_tables = old_tables - new_tables
+        
+        tables_diff = {
+            'added': list(added_tables),
+            'removed': list(removed_tables),
+            'total_before': len(old_tables),
+            'total_after': len(new_tables)
+        }
+        
+        logger.info("安全配置热重载完成", 
+                   tables_diff=tables_diff,
+                   config_file=str(self.config_file_path),
+                   reload_time=datetime.utcnow().isoformat())
+        
+        # SQLGuardian事件记录
+        if added_tables or removed_tables:
+            logger.warning("SQLGuardian白名单变更检测", 
+                         security_event="WHITELIST_CHANGED",
+                         added_tables=list(added_tables),
+                         removed_tables=list(removed_tables))
+    
+    def _start_security_config_watcher(self):
+        """启动安全配置后台监听任务"""
+        self.config_watcher_task = asyncio.create_task(self._watch_security_config())
+    
+    async def _watch_security_config(self):
+        """文件事件驱动的热加载（watchfiles/inotify），不可用时回退到轮询"""
+        try:
+            from watchfiles import awatch
+            
+            logger.info("安全配置监听启动", mode="inotify", config_file=str(self.config_file_path))
+            # 监听目录以覆盖编辑器"写临时文件再重命名"的保存方式
+            async for changes in awatch(self.config_file_path.parent):
+                if any(Path(path).name == self.config_file_path.name for _, path in changes):
+                    await self._reload_security_config()
+            return
+        except ImportError:
+            logger.warning("watchfiles模块未找到，安全配置改用轮询")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"安全配置文件监听失败，改用轮询: {str(e)}")
+        
+        poll_seconds = float(os.getenv('SECURITY_CONFIG_POLL_SECONDS', '2'))
+        logger.info("安全配置监听启动", mode="polling", interval_seconds=poll_seconds)
+        seen_mtime = self.config_last_modified
+        while True:
+            await asyncio.sleep(poll_seconds)
+            try:
+                current_mtime = await asyncio.to_thread(lambda: self.config_file_path.stat().st_mtime)
+            except OSError:
+                continue
+            # 每个版本只尝试一次，校验失败的文件不会被反复解析
+            if current_mtime != seen_mtime:
+                seen_mtime = current_mtime
+                await self._reload_security_config()
+    
+    async def _init_query_cache(self):
+        """初始化两级查询缓存"""
+        try:
+            from query_cache import QueryCache, build_shared_backend
+            
+            self.query_cache = QueryCache(
+                max_bytes=int(os.getenv('QUERY_CACHE_MAX_BYTES', str(100 * 1024 * 1024))),
+                ttl_seconds=float(os.getenv('QUERY_CACHE_TTL_SECONDS', '300')),
+                shared_backend=build_shared_backend(os.getenv('QUERY_CACHE_BACKEND_URL')),
+                shared_ttl_seconds=float(os.getenv('QUERY_CACHE_SHARED_TTL_SECONDS', '3600')),
+                on_evict=lambda reason: cache_eviction_counter.labels(reason=reason).inc()
+            )
+            self.cache_results = os.getenv('QUERY_CACHE_RESULTS', 'false').lower() == 'true'
+            
+            logger.info("查询缓存初始化成功", cache_results=self.cache_results, **self.query_cache.stats())
+            
+        except ImportError:
+            logger.warning("查询缓存模块未找到，跳过初始化")
+        except Exception as e:
+            logger.error(f"初始化查询缓存失败: {e}")
+    
+    async def _init_semantic_cache(self):
+        """初始化近似问题语义缓存（复用向量数据库客户端）"""
+        if os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() != 'true':
+            logger.info("语义缓存已禁用")
+            return
+        
+        try:
+            from semantic_cache import SemanticQueryCache
+            
+            self.semantic_cache = SemanticQueryCache(
+                self.vector_db,
+                similarity_threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92')),
+                max_entries=int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '5000')),
+                max_age_seconds=float(os.getenv('SEMANTIC_CACHE_MAX_AGE_SECONDS', str(7 * 24 * 3600))),
+                on_evict=lambda reason: cache_eviction_counter.labels(reason=reason).inc()
+            )
+            
+            logger.info("语义缓存初始化成功", threshold=self.semantic_cache.similarity_threshold)
+            
+        except ImportError:
+            logger.warning("语义缓存模块未找到，跳过初始化")
+        except Exception as e:
+            logger.error(f"初始化语义缓存失败: {e}")
+    
+    async def _semantic_cache_lookup(self,
+                                     natural_query: str,
+                                     context: Optional[Dict[str, Any]] = None
+                                     ) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+        """语义缓存查找（限定相同上下文），命中的SQL需重新通过SQLGuardian验证；返回(命中结果, 最近邻相似度)供模型路由判断"""
+        try:
+            candidate = await self._run_vector(
+                self.semantic_cache.lookup, natural_query, self.whitelist_version, self.schema_fingerprint, context
+            )
+        except Exception as e:
+            logger.warning(f"语义缓存查找失败: {str(e)}")
+            return None, None
+        
+        if candidate is None:
+            semantic_cache_counter.labels(outcome='empty').inc()
+            return None, None
+        
+        outcome = 'hit' if candidate['hit'] else 'miss'
+        semantic_similarity_histogram.labels(outcome=outcome).observe(candidate['similarity'])
+        
+        if not candidate['hit']:
+            semantic_cache_counter.labels(outcome='miss').inc()
+            return None, candidate['similarity']
+        
+        validation_result = await self._validate_sql(candidate['sql'])
+        if validation_result['status'] == 'BLOCK':
+            semantic_cache_counter.labels(outcome='rejected').inc()
+            logger.warning("语义缓存命中但SQL未通过验证", similarity=candidate['similarity'])
+            return None, None
+        
+        semantic_cache_counter.labels(outcome='hit').inc()
+        try:
+            await self._run_vector(self.semantic_cache.touch, candidate['id'], candidate['hits'])
+        except Exception as e:
+            logger.warning(f"语义缓存更新失败: {str(e)}")
+        
+        logger.info("语义缓存命中",
+                   similarity=round(candidate['similarity'], 4),
+                   matched_query=candidate['matched_query'][:100])
+        
+        return {
+            'sql': validation_result.get('fixed_sql') or candidate['sql'],
+            'confidence': validation_result.get('confidence', 0.9),
+            'validation': validation_result,
+            'similarity': candidate['similarity']
+        }, candidate['similarity']
+    
+    async def _refresh_schema_fingerprint(self):
+        """根据db_schema集合的规模与元数据计算schema指纹"""
+        try:
+            collection = await self._get_schema_collection()
+            # 句柄的元数据是获取时的快照，入库任务可能在其他进程中更新了schema_hash，故只读获取最新元数据（不替换缓存的句柄）
+            current = await self._run_vector(self.vector_db.get_collection, "db_schema")
+            payload = json.dumps(
+                {'count': await self._run_vector(collection.count), 'metadata': current.metadata},
+                sort_keys=True,
+                default=str
+            )
+            fingerprint = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+        except Exception as e:
+            logger.warning(f"Schema指纹计算失败: {str(e)}")
+            return
+        
+        if fingerprint != self.schema_fingerprint:
+            self.schema_fingerprint = fingerprint
+            logger.info("Schema指纹已更新", schema_fingerprint=self.schema_fingerprint)
+            await self._sync_schema_index()
+            await self._sync_schema_graph()
+            await self._sync_schema_catalog()
+            if self.prompt_builder.prefix is not None:
+                self.prompt_builder.prefix.reset()
+    
+    async def ingest_schema(self, schemas: List[str], dry_run: bool = False) -> Dict[str, Any]:
+        """采集PostgreSQL schema并增量更新db_schema集合，完成后刷新指纹与本地索引"""
+        from schema_ingest import ingest_schema
+        
+        collection = await self._get_schema_collection()
+        stats = await ingest_schema(
+            self.db_engine,
+            collection,
+            schemas,
+            run_sync=self._run_vector,
+            on_chunk=lambda outcome, count: schema_ingest_chunk_counter.labels(outcome=outcome).inc(count),
+            dry_run=dry_run
+        )
+        if not dry_run and (stats['changed'] or stats['deleted']):
+            await self._refresh_schema_fingerprint()
+        return stats
+    
+    async def _init_schema_index(self):
+        """初始化本地Schema索引：先加载磁盘mmap文件，再按当前指纹与Chroma对齐"""
+        if os.getenv('SCHEMA_INDEX_ENABLED', 'true').lower() != 'true':
+            logger.info("本地Schema索引已禁用")
+            return
+        
+        try:
+            from schema_index import LocalSchemaIndex
+            from chromadb.utils import embedding_functions
+            
+            # 与db_schema集合默认使用的embedding函数一致，保证向量空间相同
+            self.schema_index = LocalSchemaIndex(
+                os.getenv('SCHEMA_INDEX_DIR', '/app/data/schema_index'),
+                embed_fn=embedding_functions.DefaultEmbeddingFunction()
+            )
+        except ImportError:
+            logger.warning("本地Schema索引依赖未安装，跳过初始化")
+            return
+        
+        # Chroma不可用（指纹未知）时接受磁盘上任意版本，旧schema好过空schema
+        known = self.schema_fingerprint != "unknown"
+        await asyncio.to_thread(self.schema_index.load, self.schema_fingerprint if known else None)
+        if known:
+            await self._sync_schema_index()
+        
+        self.schema_refresh_task = asyncio.create_task(self._watch_schema_changes())
+    
+    async def _sync_schema_index(self):
+        """指纹变化时从Chroma重建本地索引"""
+        if self.schema_index is None:
+            return
+        
+        try:
+            collection = await self._get_schema_collection()
+            await self._run_vector(self.schema_index.sync_from_collection, collection, self.schema_fingerprint)
+        except Exception as e:
+            logger.warning(f"本地Schema索引同步失败: {str(e)}")
+    
+    async def _sync_schema_graph(self):
+        """由入库写入的references元数据构建内存外键邻接图"""
+        if os.getenv('SCHEMA_GRAPH_EXPANSION', 'true').lower() != 'true':
+            return
+        
+        try:
+            from schema_graph import SchemaGraph
+            
+            collection = await self._get_schema_collection()
+            data = await self._run_vector(collection.get, include=['documents', 'metadatas'])
+            self.schema_graph = SchemaGraph.from_collection_data(data)
+            logger.info("外键关系图已构建",
+                       tables=len(self.schema_graph.documents),
+                       edges=self.schema_graph.edge_count)
+        except Exception as e:
+            logger.warning(f"外键关系图构建失败: {str(e)}")
+    
+    async def _sync_schema_catalog(self):
+        """从PostgreSQL元数据构建Debugger的表/列模糊索引，构建完成后整体替换"""
+        if getattr(self, 'debugger', None) is None or self.db_engine is None:
+            return
+        
+        try:
+            from schema_catalog import SchemaCatalog
+            from schema_ingest import introspect_schema
+            
+            schemas = [
+                schema.strip()
+                for schema in os.getenv('SCHEMA_INGEST_SCHEMAS', 'public').split(',')
+                if schema.strip()
+            ]
+            tables = await introspect_schema(self.db_engine, schemas)
+            catalog = await asyncio.to_thread(SchemaCatalog.from_tables, tables)
+            self.debugger.schema_catalog = catalog
+            logger.info("Debugger schema目录已更新", tables=len(catalog.tables), columns=catalog.column_count)
+        except Exception as e:
+            logger.warning(f"Debugger schema目录构建失败: {str(e)}")
+    
+    def _expand_schema(self, ids: List[str], documents: List[str]) -> List[str]:
+        """在top-k命中表之间补充最短连接路径上的桥接表（受SCHEMA_TOKEN_BUDGET约束）"""
+        if self.schema_graph is None or len(ids) < 2:
+            return documents
+        
+        hits = set(ids)
+        bridges = [
+            table for table in self.schema_graph.expand(
+                ids, self.schema_token_budget, count_tokens=self.prompt_builder.count_tokens
+            )
+            if table not in hits
+        ]
+        if bridges:
+            schema_bridge_table_counter.inc(len(bridges))
+            logger.info("外键扩展补充桥接表", hits=ids, bridges=bridges)
+        return documents + [self.schema_graph.documents[table] for table in bridges]
+    
+    async def _watch_schema_changes(self):
+        """定期刷新schema指纹，变化时重建本地索引（并使缓存键失效）"""
+        interval = float(os.getenv('SCHEMA_REFRESH_SECONDS', '300'))
+        while True:
+            await asyncio.sleep(interval)
+            await self._refresh_schema_fingerprint()
+    
+    def _cache_key(self, natural_query: str, context: Optional[Dict[str, Any]]) -> str:
+        """生成查询缓存键"""
+        from query_cache import make_cache_key
+        
+        return make_cache_key(natural_query, context, self.whitelist_version, self.schema_fingerprint)
+    
+    async def cache_generation(self,
+                               natural_query: str,
+                               context: Optional[Dict[str, Any]],
+                               generation_result: Dict[str, Any],
+                               result: Optional[List[Dict[str, Any]]] = None,
+                               truncated: bool = False):
+        """SQL执行成功后写入查询缓存与语义缓存（未执行或执行失败的SQL不缓存）；
+        result为结果行时按QUERY_CACHE_RESULTS一并缓存"""
+        cache_key = generation_result.get('cache_key')
+        cache_hit = generation_result.get('cache_hit')
+        
+        if self.query_cache is not None and cache_key is not None:
+            entry = {
+                'sql': generation_result['sql'],
+                'confidence': generation_result['confidence'],
+                'validation': generation_result.get('validation')
+            }
+            if self.cache_results and result is not None:
+                entry['result'] = result
+                entry['result_truncated'] = truncated
+            # 精确缓存命中的条目已存在，只在补充结果时覆盖
+            if cache_hit in (None, 'semantic') or 'result' in entry:
+                await self.query_cache.set(cache_key, entry)
+        
+        validation = generation_result.get('validation') or {}
+        if self.semantic_cache is not None and cache_hit is None and validation.get('status') == 'PASS':
+            try:
+                await self._run_vector(
+                    self.semantic_cache.store,
+                    natural_query, generation_result['sql'], self.whitelist_version, self.schema_fingerprint, context
+                )
+            except Exception as e:
+                logger.warning(f"语义缓存写入失败: {str(e)}")
     
     async def _start_metrics_exporter(self):
         """启动Token指标导出器"""
@@ -200,251 +798,633 @@ class Text2SQLEngine:
         """初始化Debugger v2"""
         try:
             from debugger import get_debugger
+            from fix_memory import FixMemoryStore
+            
+            # 已验证修复持久化到SQLite（WAL），重启后仍可直接重放；路径为空则关闭
+            fix_memory = None
+            fix_memory_path = os.getenv('DEBUGGER_FIX_MEMORY_PATH', '/app/data/fix_memory.db')
+            if fix_memory_path:
+                try:
+                    fix_memory = await asyncio.to_thread(
+                        FixMemoryStore,
+                        fix_memory_path,
+                        int(os.getenv('DEBUGGER_FIX_MEMORY_MAX_ENTRIES', '10000'))
+                    )
+                except Exception as e:
+                    logger.warning(f"修复记忆不可用，跳过: {e}")
+            
+            # 修复候选先经EXPLAIN计划期校验，计划失败的候选在几毫秒内被拒绝，不必真实执行一次
+            probe_enabled = os.getenv('DEBUGGER_PROBE_ENABLED', 'true').lower() == 'true'
+            self.debugger_probe_timeout_ms = int(os.getenv('DEBUGGER_PROBE_TIMEOUT_MS', '500'))
+            self.debugger = get_debugger(
+                max_retries=3,
+                probe=self._explain_probe if probe_enabled else None,
+                probe_timeout=self.debugger_probe_timeout_ms / 1000,
+                max_parallel_fixes=int(os.getenv('DEBUGGER_MAX_PARALLEL_FIXES', '4')),
+                fix_memory=fix_memory,
+                history_size=int(os.getenv('DEBUGGER_HISTORY_SIZE', '1000'))
+            )
             
-            self.debugger = get_debugger(max_retries=3)
+            logger.info("Debugger v2初始化成功", max_retries=3, probe_enabled=probe_enabled,
+                        fix_memory=fix_memory is not None)
             
-            logger.info("Debugger v2初始化成功", max_retries=3)
+            # 修复表/列名时在线上schema目录中检索（schema指纹变化时重建）
+            await self._sync_schema_catalog()
             
         except ImportError:
             logger.warning("Debugger模块未找到，跳过初始化")
         except Exception as e:
             logger.error(f"初始化Debugger失败: {e}")
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def generate_sql(self, natural_query: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """将自然语言转换为SQL"""
+    async def generate_sql(self,
+                           natural_query: str,
+                           context: Optional[Dict[str, Any]] = None,
+                           relevant_schema: Optional[str] = None,
+                           escalate: bool = False) -> Dict[str, Any]:
+        """将自然语言转换为SQL（relevant_schema由批量检索预先提供时跳过单独检索；
+        escalate=True表示快速模型的SQL执行失败后重试，跳过缓存直接使用强模型）"""
         sql_generation_counter.inc()
+        deadline = time.monotonic() + self.llm_request_deadline_seconds
+        if request_deadline.get() is not None:
+            deadline = min(deadline, request_deadline.get())
+        
+        cache_key = None
+        if self.query_cache is not None:
+            cache_key = self._cache_key(natural_query, context)
+        if self.query_cache is not None and not escalate:
+            cached, tier = await self.query_cache.get(cache_key)
+            if cached is not None:
+                cache_hit_counter.labels(tier=tier).inc()
+                logger.info("查询缓存命中", tier=tier)
+                return {
+                    'sql': cached['sql'],
+                    'confidence': cached['confidence'],
+                    'tokens_used': {'input': 0, 'output': 0},
+                    'validation': cached.get('validation'),
+                    'result': cached.get('result'),
+                    'result_truncated': cached.get('result_truncated', False),
+                    'cache_key': cache_key,
+                    'cache_hit': tier
+                }
+            cache_miss_counter.inc()
+        
+        similarity = None
+        if self.semantic_cache is not None and not escalate:
+            semantic_hit, similarity = await self._semantic_cache_lookup(natural_query, context)
+            if semantic_hit is not None:
+                return {
+                    'sql': semantic_hit['sql'],
+                    'confidence': semantic_hit['confidence'],
+                    'tokens_used': {'input': 0, 'output': 0},
+                    'validation': semantic_hit['validation'],
+                    'cache_key': cache_key,
+                    'cache_hit': 'semantic'
+                }
         
         try:
             # 1. Schema检索（通过SchemaSage）
-            relevant_schema = await self._retrieve_schema(natural_query)
+            if relevant_schema is None:
+                relevant_schema = await self._retrieve_schema(natural_query)
             
             # 2. 构建prompt
-            prompt = self._build_prompt(natural_query, relevant_schema, context)
+            prompt, prompt_stats = self._build_prompt(natural_query, relevant_schema, context)
+            # 与prompt同步取system，保证前缀与本次已剔除的表一致
+            system = (self.prompt_builder.system_blocks(SQL_SYSTEM_PROMPT)
+                      if self.prompt_cache_enabled else SQL_SYSTEM_PROMPT)
             
-            # 3. 调用Claude生成SQL
-            response = await self.anthropic_client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                temperature=0.2,
-                system="你是一个SQL专家。基于提供的数据库schema，将自然语言查询转换为正确的SQL语句。只返回SQL语句，不要包含其他解释。",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            sql = response.content[0].text.strip()
-            tokens_used = {
-                "input": response.usage.input_tokens,
-                "output": response.usage.output_tokens
-            }
-            
-            # 记录token使用到Prometheus
-            token_usage_counter.labels(type='input').inc(tokens_used['input'])
-            token_usage_counter.labels(type='output').inc(tokens_used['output'])
-            
-            # 记录到详细Token指标导出器
-            if hasattr(self, 'metrics_exporter'):
-                self.metrics_exporter.record_token_usage(
-                    model="claude-3-opus-20240229",
-                    input_tokens=tokens_used['input'],
-                    output_tokens=tokens_used['output'],
-                    endpoint="text2sql"
-                )
+            # 3. 按问题复杂度选择模型并调用Claude生成SQL
+            if escalate:
+                model, route_reason = self.model_router.strong_model, 'execution_error'
+            else:
+                model, route_reason = self.model_router.choose(natural_query, prompt_stats, similarity)
+            model_route_counter.labels(model=model, reason=route_reason).inc()
+            sql, tokens_used = await self._call_llm(model, system, prompt, deadline)
             
             # 4. SQL验证（通过SQLGuardian）
             validation_result = await self._validate_sql(sql)
             
+            # 快速模型结果置信度低或被拦截时升级到强模型重新生成
+            escalation_reason = self.model_router.escalation_reason(model, validation_result)
+            if escalation_reason is not None:
+                model_escalation_counter.labels(reason=escalation_reason).inc()
+                logger.info("快速模型结果不达标，升级到强模型",
+                           reason=escalation_reason,
+                           confidence=validation_result.get('confidence'))
+                model = self.model_router.strong_model
+                model_route_counter.labels(model=model, reason=escalation_reason).inc()
+                sql, escalated_tokens = await self._call_llm(model, system, prompt, deadline)
+                tokens_used = {key: tokens_used[key] + escalated_tokens[key] for key in tokens_used}
+                validation_result = await self._validate_sql(sql)
+            
             if validation_result['status'] == 'BLOCK':
                 raise ValueError(f"SQL被安全检查拦截: {validation_result['risks']}")
             
             if validation_result.get('fixed_sql'):
                 sql = validation_result['fixed_sql']
             
-            return {
+            generation_result = {
                 'sql': sql,
                 'confidence': validation_result.get('confidence', 0.9),
                 'tokens_used': tokens_used,
-                'validation': validation_result
+                'validation': validation_result,
+                'model': model,
+                'cache_key': cache_key,
+                'cache_hit': None
             }
             
+            return generation_result
+            
         except Exception as e:
             logger.error(f"SQL生成失败: {str(e)}", exc_info=True)
             raise
     
+    async def _call_llm(self,
+                        model: str,
+                        system: Any,
+                        prompt: str,
+                        deadline: Optional[float] = None) -> Tuple[str, Dict[str, int]]:
+        """调用指定模型生成SQL，瞬时错误在截止时间与重试预算内重试；按模型记录延迟与token用量"""
+        started = time.perf_counter()
+        sql, tokens_used = await call_with_retry(
+            lambda: self._llm_attempt(model, system, prompt, deadline),
+            deadline=deadline,
+            budget=self.llm_retry_budget,
+            max_attempts=self.llm_max_attempts,
+            on_retry=lambda outcome: llm_retry_counter.labels(outcome=outcome).inc()
+        )
+        llm_latency_histogram.labels(model=model).observe(time.perf_counter() - started)
+        
+        # 记录token使用到Prometheus
+        for token_type, count in tokens_used.items():
+            token_usage_counter.labels(type=token_type).inc(count)
+        
+        # 记录到详细Token指标导出器
+        if hasattr(self, 'metrics_exporter'):
+            self.metrics_exporter.record_token_usage(
+                model=model,
+                input_tokens=tokens_used['input'],
+                output_tokens=tokens_used['output'],
+                endpoint="text2sql",
+                cache_creation_input_tokens=tokens_used['cache_write'],
+                cache_read_input_tokens=tokens_used['cache_read']
+            )
+        
+        return sql, tokens_used
+    
+    async def _llm_attempt(self,
+                           model: str,
+                           system: Any,
+                           prompt: str,
+                           deadline: Optional[float] = None) -> Tuple[str, Dict[str, int]]:
+        """单次LLM调用（持有并发信号量；重试等待期间不占用），HTTP超时取截止时间的剩余预算"""
+        request_options = {}
+        if deadline is not None:
+            request_options['timeout'] = max(0.1, deadline - time.monotonic())
+        
+        async with self.llm_semaphore:
+            if self.llm_streaming:
+                return await self._stream_llm(model, system, prompt, time.perf_counter(), request_options)
+            
+            response = await self.anthropic_client.messages.create(
+                model=model,
+                max_tokens=1000,
+                system=system,
+                messages=[{"role": "user", "content": prompt}],
+                **request_options
+            )
+        tokens_used = {
+            "input": response.usage.input_tokens,
+            "output": response.usage.output_tokens,
+            "cache_write": getattr(response.usage, 'cache_creation_input_tokens', 0) or 0,
+            "cache_read": getattr(response.usage, 'cache_read_input_tokens', 0) or 0
+        }
+        return response.content[0].text.strip(), tokens_used
+    
+    async def _stream_llm(self,
+                          model: str,
+                          system: Any,
+                          prompt: str,
+                          started: float,
+                          request_options: Dict[str, Any]) -> Tuple[str, Dict[str, int]]:
+        """流式生成：边接收边扫描危险关键字，命中即中止；首条语句以分号结束即停止接收，尽早进入验证与执行"""
+        text = ""
+        stop_reason = None
+        tokens_used = {"input": 0, "output": 0, "cache_write": 0, "cache_read": 0}
+        output_reported = False
+        
+        stream = await self.anthropic_client.messages.create(
+            model=model,
+            max_tokens=1000,
+            system=system,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            **request_options
+        )
+        try:
+            async for event in stream:
+                if event.type == 'message_start':
+                    usage = event.message.usage
+                    tokens_used['input'] = usage.input_tokens
+                    tokens_used['cache_write'] = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+                    tokens_used['cache_read'] = getattr(usage, 'cache_read_input_tokens', 0) or 0
+                elif event.type == 'content_block_delta':
+                    delta = getattr(event.delta, 'text', None)
+                    if not delta:
+                        continue
+                    if not text:
+                        llm_ttft_histogram.labels(model=model).observe(time.perf_counter() - started)
+                    text += delta
+                    
+                    if scan_partial_sql(text) is not None:
+                        stop_reason = 'blocked'
+                        break
+                    end = statement_end(text)
+                    if end is not None:
+                        text = text[:end]
+                        stop_reason = 'statement_end'
+                        break
+                elif event.type == 'message_delta':
+                    tokens_used['output'] = event.usage.output_tokens
+                    output_reported = True
+        finally:
+            # 关闭连接，服务端随即停止生成，不再为后续输出token付费
+            await stream.close()
+        
+        if stop_reason is not None:
+            llm_stream_stop_counter.labels(reason=stop_reason).inc()
+            if stop_reason == 'blocked':
+                logger.warning("流式生成命中危险关键字，已提前中止", model=model, partial_sql=text[:100])
+        if not output_reported:
+            # 提前停止时收不到最终用量，按已接收文本估算
+            tokens_used['output'] = self.prompt_builder.count_tokens(text)
+        
+        return text.strip(), tokens_used
+    
+    async def _query_schema_documents(self, queries: List[str], n_results: int = 3) -> Tuple[List[List[str]], str]:
+        """检索schema块并按外键图扩展：本地索引为快速路径，Chroma为权威数据源与回退"""
+        if self.schema_index is not None and self.schema_index.ready:
+            try:
+                ids, documents = await self._run_vector(self.schema_index.query, queries, n_results)
+                return [self._expand_schema(*row) for row in zip(ids, documents)], 'local'
+            except Exception as e:
+                logger.warning(f"本地Schema索引检索失败，回退Chroma: {str(e)}")
+        
+        collection = await self._get_schema_collection()
+        results = await self._run_vector(
+            collection.query,
+            query_texts=queries,
+            n_results=n_results
+        )
+        ids = results.get('ids') or []
+        documents = results.get('documents') or []
+        return [self._expand_schema(*row) for row in zip(ids, documents)], 'chroma'
+    
     async def _retrieve_schema(self, query: str) -> str:
         """检索相关的数据库schema"""
+        started = time.perf_counter()
         try:
-            # 从向量数据库检索相关schema
-            collection = self.vector_db.get_or_create_collection("db_schema")
-            results = collection.query(
-                query_texts=[query],
-                n_results=3
+            documents, source = await self._query_schema_documents([query])
+            schema_retrieval_histogram.labels(mode='single', source=source, status='success').observe(
+                time.perf_counter() - started
             )
             
-            if results['documents']:
-                return "\n".join(results['documents'][0])
+            if documents:
+                return "\n".join(documents[0])
             return ""
         except Exception as e:
+            schema_retrieval_histogram.labels(mode='single', source='chroma', status='error').observe(
+                time.perf_counter() - started
+            )
             logger.warning(f"Schema检索失败: {str(e)}")
             return ""
     
-    def _build_prompt(self, query: str, schema: str, context: Optional[Dict[str, Any]]) -> str:
-        """构建发送给Claude的prompt"""
-        prompt = f"""数据库Schema:
-{schema}
-
-用户查询: {query}
-"""
+    async def _retrieve_schema_batch(self, queries: List[str]) -> List[Optional[str]]:
+        """批量检索schema - 整批只发起一次检索"""
+        if not queries:
+            return []
+        
+        started = time.perf_counter()
+        try:
+            documents, source = await self._query_schema_documents(queries)
+            schema_retrieval_histogram.labels(mode='batch', source=source, status='success').observe(
+                time.perf_counter() - started
+            )
+            
+            schemas = ["\n".join(docs) for docs in documents]
+            return schemas + [""] * (len(queries) - len(schemas))
+        except Exception as e:
+            # 返回None让各条查询回退到单独检索
+            schema_retrieval_histogram.labels(mode='batch', source='chroma', status='error').observe(
+                time.perf_counter() - started
+            )
+            logger.warning(f"批量Schema检索失败: {str(e)}", batch_size=len(queries))
+            return [None] * len(queries)
+    
+    def _build_prompt(self, query: str, schema: str, context: Optional[Dict[str, Any]]) -> Tuple[str, Dict[str, int]]:
+        """构建发送给Claude的prompt（schema压缩为紧凑表示并控制在PROMPT_TOKEN_BUDGET内），返回(prompt, 统计)"""
+        prompt, stats = self.prompt_builder.build(query, schema, context)
         
-        if context:
-            prompt += f"\n额外上下文: {json.dumps(context, ensure_ascii=False)}"
+        prompt_tokens_histogram.labels(stage='raw').observe(stats['raw_tokens'])
+        prompt_tokens_histogram.labels(stage='compressed').observe(stats['prompt_tokens'])
+        if stats['pruned_columns']:
+            prompt_pruning_counter.labels(kind='column').inc(stats['pruned_columns'])
+        if stats['dropped_tables']:
+            prompt_pruning_counter.labels(kind='table').inc(stats['dropped_tables'])
+            logger.info("Prompt超出预算，已丢弃低相关表", **stats)
         
-        prompt += "\n\n请生成对应的SQL查询语句。"
-        return prompt
+        return prompt, stats
     
     async def _validate_sql(self, sql: str) -> Dict[str, Any]:
-        """通过SQLGuardian验证SQL - 强化安全防护"""
-        import re
-        
-        # SQLGuardian配置
-        guardian_config = self.promptx_agents.get('SQLGuardian', {})
-        
-        validation_result = {
-            'status': 'PASS',
-            'risks': [],
-            'suggestions': [],
-            'confidence': 0.95,
-            'blocked_reason': None
-        }
-        
-        # 1. 正则黑名单 - 严格阻断危险操作
-        dangerous_patterns = [
-            (r'(?i)\b(drop|delete|update|insert|alter|truncate|create|grant|revoke)\b', 'CRITICAL_OPERATION'),
-            (r'(?i)\b(exec|execute|xp_|sp_)\b', 'SYSTEM_COMMAND'),
-            (r'(?i)(union.*select|select.*union)', 'POSSIBLE_INJECTION'),
-            (r'(?i)(;.*--|--.*)', 'SQL_COMMENT_INJECTION'),
-            (r'(?i)(\|\||&&|concat)', 'STRING_MANIPULATION')
-        ]
+        """通过SQLGuardian验证SQL - 强化安全防护（策略由后台监听任务热替换）"""
+        validation_result = self.sql_guardian.validate(sql)
         
-        sql_upper = sql.upper().strip()
-        
-        for pattern, risk_type in dangerous_patterns:
-            if re.search(pattern, sql, re.IGNORECASE):
-                validation_result['status'] = 'BLOCK'
-                validation_result['blocked_reason'] = risk_type
-                validation_result['risks'].append(f"Blocked: {risk_type} detected in SQL")
-                validation_result['confidence'] = 0.0
-                logger.warning(f"SQLGuardian阻断: {risk_type}", sql=sql[:100])
-                return validation_result
-        
-        # 2. 仅允许SELECT操作
-        if not sql_upper.startswith('SELECT'):
-            validation_result['status'] = 'BLOCK'
-            validation_result['blocked_reason'] = 'NON_SELECT_OPERATION'
-            validation_result['risks'].append("Only SELECT queries are allowed")
+        if validation_result['status'] == 'BLOCK':
+            if validation_result['blocked_reason'] != 'NON_SELECT_OPERATION':
+                logger.warning(f"SQLGuardian阻断: {validation_result['blocked_reason']}", sql=sql[:100])
             return validation_result
         
-        # 3. SELECT语句安全检查
-        select_risks = []
-        
-        # 检查子查询深度
-        subquery_count = sql_upper.count('SELECT') - 1
-        if subquery_count > 2:
-            select_risks.append("Deep nested subqueries detected")
-            validation_result['confidence'] -= 0.1
-        
-        # 检查JOIN数量
-        join_count = len(re.findall(r'\bjoin\b', sql_upper))
-        if join_count > 5:
-            select_risks.append("Too many JOINs may affect performance")
-            validation_result['confidence'] -= 0.05
-        
-        # 检查通配符使用
-        if 'SELECT *' in sql_upper:
-            select_risks.append("SELECT * usage - consider specifying columns")
-            validation_result['confidence'] -= 0.05
-        
-        if select_risks:
-            validation_result['suggestions'] = select_risks
-        
-        # 4. 白名单表检查 - 热加载配置
-        await self._reload_security_config_if_needed()
-        allowed_tables = self.security_config.get('allowed_tables', [])
-        
-        # 简单表名提取
-        from_match = re.search(r'from\s+(\w+)', sql_upper)
-        if from_match:
-            table_name = from_match.group(1).lower()
-            if table_name not in allowed_tables:
-                validation_result['status'] = 'WARN'
-                validation_result['risks'].append(f"Table '{table_name}' not in whitelist")
-                validation_result['confidence'] -= 0.2
-        
         logger.info(f"SQLGuardian验证完成", 
                    status=validation_result['status'],
                    confidence=validation_result['confidence'])
         
         return validation_result
     
-    async def execute_sql(self, sql: str) -> List[Dict[str, Any]]:
-        """执行SQL并返回结果"""
+    def _result_row_cap(self, sql: str) -> Optional[int]:
+        """结果行数硬上限：涉及表的max_rows与全局max_result_rows中的较小者"""
+        return self.sql_guardian.row_cap(analyze_sql(sql)['tables'])
+    
+    @asynccontextmanager
+    async def _read_session(self):
+        """SELECT会话：优先最少连接的健康只读副本，无可用副本时回退主库"""
+        if self.replica_router is None:
+            db_route_counter.labels(target='primary').inc()
+            async with self._db_session() as session:
+                yield session
+            return
+        
+        async with self.replica_router.route() as replica:
+            if replica is None:
+                db_route_counter.labels(target='primary_fallback').inc()
+                async with self._db_session() as session:
+                    yield session
+            else:
+                db_route_counter.labels(target='replica').inc()
+                async with self._db_session(replica.session_factory, pool_label=replica.name) as session:
+                    yield session
+    
+    async def _fetch_select(self, sql: str) -> Tuple[List[str], List[Any], bool]:
+        """服务端游标执行SELECT，最多取上限+1行判断是否截断（LIMIT恰为上限时执行语句放宽一行）"""
+        row_cap = self._result_row_cap(sql)
+        async with self._read_session() as session:
+            result = await session.stream(text(probe_sql(sql, row_cap)))
+            columns = list(result.keys())
+            if row_cap is None:
+                rows = await result.fetchall()
+            else:
+                rows = await result.fetchmany(row_cap + 1)
+            await result.close()
+        
+        truncated = row_cap is not None and len(rows) > row_cap
+        if truncated:
+            rows = rows[:row_cap]
+            result_truncated_counter.inc()
+            logger.warning("查询结果已按行数上限截断", row_cap=row_cap, sql=sql[:100])
+        return columns, rows, truncated
+    
+    async def _run_sql(self, sql: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """查询语句（按解析出的语句类型判断，含WITH…SELECT与UNION）走只读会话与行数上限，其余语句在主库执行并提交"""
+        if analyze_sql(sql)['parsed']:
+            read_only = is_query(sql)
+        else:
+            read_only = sql.lstrip().upper().startswith('SELECT')
+        if read_only:
+            columns, rows, truncated = await self._fetch_select(sql)
+            return [dict(zip(columns, row)) for row in rows], truncated
+        
+        async with self._db_session() as session:
+            result = await session.execute(text(sql))
+            await session.commit()
+            return [{"affected_rows": result.rowcount}], False
+    
+    async def execute_sql(self, sql: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """执行SQL，返回(结果行, 是否按行数上限截断)"""
         try:
-            async with self.async_session() as session:
-                result = await session.execute(sql)
-                
-                # 根据SQL类型处理结果
-                if sql.strip().upper().startswith('SELECT'):
-                    rows = result.fetchall()
-                    columns = result.keys()
-                    return [dict(zip(columns, row)) for row in rows]
-                else:
-                    await session.commit()
-                    return [{"affected_rows": result.rowcount}]
+            return await self._run_sql(sql)
                     
         except Exception as e:
             sql_execution_counter.labels(status='failed').inc()
             logger.error(f"SQL执行失败: {str(e)}", sql=sql)
             
             # 触发Debugger v2进行自动修复
-            if hasattr(self, 'debugger'):
-                logger.info("触发Debugger v2自动修复", sql=sql[:100], error=str(e)[:200])
-                
-                fix_result = await self.debugger.auto_fix_sql(
-                    original_sql=sql,
-                    error_message=str(e),
-                    context={'execution_context': 'sql_execution'}
-                )
-                
-                if fix_result['success']:
-                    logger.info("Debugger修复成功，重新执行SQL", 
-                               session_id=fix_result['session_id'])
-                    
-                    # 重新执行修复后的SQL
-                    try:
-                        async with self.async_session() as session:
-                            result = await session.execute(fix_result['fixed_sql'])
+            fixed_sql = await self._request_auto_fix(sql, e)
+            if fixed_sql is not None:
+                # 重新执行修复后的SQL
+                try:
+                    fixed_result = await self._run_sql(fixed_sql)
+                    sql_execution_counter.labels(status='success_after_fix').inc()
+                    return fixed_result
                             
-                            if fix_result['fixed_sql'].strip().upper().startswith('SELECT'):
-                                rows = result.fetchall()
-                                columns = result.keys()
-                                
-                                sql_execution_counter.labels(status='success_after_fix').inc()
-                                
-                                return [dict(zip(columns, row)) for row in rows]
-                            else:
-                                await session.commit()
-                                return [{"affected_rows": result.rowcount}]
-                                
-                    except Exception as retry_error:
-                        logger.error(f"修复后SQL仍然失败: {str(retry_error)}")
-                        # 记录修复失败但不再重试
-                        sql_execution_counter.labels(status='failed_after_fix').inc()
-                        
-                else:
-                    logger.warning("Debugger修复失败", 
-                                 session_id=fix_result['session_id'],
-                                 error_type=fix_result['error_type'])
+                except Exception as retry_error:
+                    logger.error(f"修复后SQL仍然失败: {str(retry_error)}")
+                    # 记录修复失败但不再重试
+                    sql_execution_counter.labels(status='failed_after_fix').inc()
             
             raise
+    
+    async def execute_sql_columnar(self, sql: str) -> Tuple[Dict[str, Any], bool]:
+        """执行SELECT并直接按列组织结果，不构建逐行dict；返回(列式结果, 是否截断)"""
+        try:
+            columns, rows, truncated = await self._fetch_select(sql)
+            return _rows_to_columnar(columns, rows), truncated
+        except Exception as e:
+            sql_execution_counter.labels(status='failed').inc()
+            logger.error(f"SQL执行失败: {str(e)}", sql=sql)
+            
+            fixed_sql = await self._request_auto_fix(sql, e)
+            if fixed_sql is None:
+                raise
+            
+            try:
+                columns, rows, truncated = await self._fetch_select(fixed_sql)
+                sql_execution_counter.labels(status='success_after_fix').inc()
+                return _rows_to_columnar(columns, rows), truncated
+            except Exception as retry_error:
+                logger.error(f"修复后SQL仍然失败: {str(retry_error)}")
+                sql_execution_counter.labels(status='failed_after_fix').inc()
+                raise e
+    
+
+    async def _explain_probe(self, sql: str) -> Optional[float]:
+        """EXPLAIN（不带ANALYZE）校验修复候选，返回规划器估算的总成本；非PostgreSQL无成本估算时返回None"""
+        outcome = 'error'
+        try:
+            # 修复候选同样需要通过安全校验，被拦截的SQL不进入数据库
+            validation_result = self.sql_guardian.validate(sql)
+            if validation_result['status'] == 'BLOCK':
+                outcome = 'blocked'
+                raise ValueError(f"SQL被安全策略拦截: {validation_result['blocked_reason']}")
+            
+            async with self._read_session() as session:
+                dialect = session.bind.dialect.name
+                if dialect == 'postgresql':
+                    await session.execute(text(f"SET LOCAL statement_timeout = {self.debugger_probe_timeout_ms}"))
+                    plan = (await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    outcome = 'clean'
+                    return float(plan[0]['Plan']['Total Cost'])
+                
+                explain = 'EXPLAIN QUERY PLAN' if dialect == 'sqlite' else 'EXPLAIN'
+                (await session.execute(text(f"{explain} {sql}"))).fetchall()
+                outcome = 'clean'
+                return None
+        except asyncio.CancelledError:
+            outcome = 'timeout'
+            raise
+        finally:
+            autofix_probe_counter.labels(outcome=outcome).inc()
+    
+    async def _request_auto_fix(self, sql: str, error: Exception) -> Optional[str]:
+        """调用Debugger v2自动修复，成功时返回修复后的SQL"""
+        if not hasattr(self, 'debugger'):
+            return None
+        
+        logger.info("触发Debugger v2自动修复", sql=sql[:100], error=str(error)[:200])
+        
+        fix_result = await self.debugger.auto_fix_sql(
+            original_sql=sql,
+            error_message=str(error),
+            context={'execution_context': 'sql_execution'},
+            deadline=request_deadline.get()
+        )
+        
+        if fix_result['success']:
+            # 无论是否开启EXPLAIN探测，修复后的SQL执行前都必须重新通过安全校验（含行数上限改写）
+            validation_result = await self._validate_sql(fix_result['fixed_sql'])
+            if validation_result['status'] == 'BLOCK':
+                logger.warning("Debugger修复后的SQL未通过安全校验，不执行",
+                             session_id=fix_result['session_id'],
+                             blocked_reason=validation_result['blocked_reason'])
+                return None
+            
+            logger.info("Debugger修复成功，重新执行SQL", 
+                       session_id=fix_result['session_id'],
+                       plan_cost=fix_result.get('plan_cost'))
+            return validation_result.get('fixed_sql') or fix_result['fixed_sql']
+        
+        logger.warning("Debugger修复失败", 
+                     session_id=fix_result['session_id'],
+                     error_type=fix_result['error_type'])
+        return None
+    
+    async def execute_sql_stream(self, sql: str, chunk_size: int = 500):
+        """流式执行SELECT - 服务端游标分块产出，内存占用与结果规模无关"""
+        row_cap = self._result_row_cap(sql)
+        async with self._read_session() as session:
+            try:
+                result = await session.stream(text(probe_sql(sql, row_cap)))
+            except Exception as e:
+                sql_execution_counter.labels(status='failed').inc()
+                logger.error(f"SQL执行失败: {str(e)}", sql=sql)
+                
+                fixed_sql = await self._request_auto_fix(sql, e)
+                if fixed_sql is None:
+                    raise
+                
+                await session.rollback()
+                await self._apply_statement_timeout(session)
+                sql = fixed_sql
+                row_cap = self._result_row_cap(sql)
+                result = await session.stream(text(probe_sql(sql, row_cap)))
+            
+            columns = list(result.keys())
+            yield {'type': 'columns', 'sql': sql, 'columns': columns}
+            
+            remaining = row_cap
+            async for partition in result.partitions(chunk_size):
+                if remaining is not None and len(partition) > remaining:
+                    # 超出行数上限：产出剩余配额后停止读取游标
+                    if remaining:
+                        yield {'type': 'rows', 'rows': [dict(zip(columns, row)) for row in partition[:remaining]]}
+                    result_truncated_counter.inc()
+                    yield {'type': 'truncated', 'row_cap': row_cap}
+                    break
+                if remaining is not None:
+                    remaining -= len(partition)
+                yield {'type': 'rows', 'rows': [dict(zip(columns, row)) for row in partition]}
+            await result.close()
+            
+            sql_execution_counter.labels(status='success').inc()
+
+def _remaining_seconds() -> Optional[float]:
+    """当前请求的剩余时间预算（秒），未设置截止时间时返回None"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+def _request_budget_seconds(http_request: Request) -> float:
+    """请求级时间预算：X-Request-Timeout-Ms头优先（不超过REQUEST_TIMEOUT_MAX_SECONDS），否则取REQUEST_TIMEOUT_SECONDS"""
+    budget = float(os.getenv('REQUEST_TIMEOUT_SECONDS', '8'))
+    header = http_request.headers.get('x-request-timeout-ms')
+    if header:
+        try:
+            budget = float(header) / 1000
+        except ValueError:
+            logger.warning("忽略无效的X-Request-Timeout-Ms", value=header)
+    return min(max(budget, 0.1), float(os.getenv('REQUEST_TIMEOUT_MAX_SECONDS', '60')))
+
+def _column_type(values: List[Any]) -> str:
+    """根据首个非空值推断列类型"""
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return 'bool'
+        if isinstance(value, int):
+            return 'int'
+        if isinstance(value, float):
+            return 'float'
+        if isinstance(value, datetime):
+            return 'timestamp'
+        if isinstance(value, (bytes, bytearray)):
+            return 'binary'
+        if isinstance(value, str):
+            return 'string'
+        return type(value).__name__
+    return 'null'
+
+def _rows_to_columnar(columns: List[str], rows) -> Dict[str, Any]:
+    """将行序列转置为列数组"""
+    data = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+    return {
+        'columns': [{'name': name, 'type': _column_type(values)} for name, values in zip(columns, data)],
+        'data': data,
+        'row_count': len(rows)
+    }
+
+def _records_to_columnar(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """将缓存中的list-of-dicts结果转为列式"""
+    columns = list(records[0].keys()) if records else []
+    return _rows_to_columnar(columns, [tuple(record.get(name) for name in columns) for record in records])
+
+def _columnar_to_arrow(columnar: Dict[str, Any], metadata: Dict[str, Any]) -> bytes:
+    """编码为Arrow IPC流，SQL/置信度等头信息放入schema元数据"""
+    import pyarrow as pa
+    
+    # 按位置建列：JOIN结果可能含同名列（如u.id与o.id），按名称建表会丢列
+    table = pa.Table.from_arrays(
+        [pa.array(values) for values in columnar['data']],
+        names=[column['name'] for column in columnar['columns']]
+    )
+    table = table.replace_schema_metadata(
+        {key: json.dumps(value, ensure_ascii=False, default=str) for key, value in metadata.items()}
+    )
+    
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
 
 # 创建全局引擎实例
 engine = Text2SQLEngine()
@@ -454,6 +1434,19 @@ async def startup_event():
     """应用启动时初始化"""
     await engine.initialize()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止后台任务"""
+    if engine.config_watcher_task is not None:
+        engine.config_watcher_task.cancel()
+    if engine.schema_refresh_task is not None:
+        engine.schema_refresh_task.cancel()
+    if engine.replica_router is not None:
+        await engine.replica_router.close()
+    if getattr(engine, 'debugger', None) is not None and engine.debugger.fix_memory is not None:
+        engine.debugger.fix_memory.close()
+    engine.vector_executor.shutdown(wait=False, cancel_futures=True)
+
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
@@ -468,40 +1461,265 @@ async def metrics():
     """Prometheus指标端点"""
     return generate_latest()
 
-@app.post("/api/text2sql", response_model=Text2SQLResponse)
-async def text2sql(request: Text2SQLRequest):
-    """主要的Text2SQL API端点"""
+async def _process_query(query: str,
+                         context: Optional[Dict[str, Any]],
+                         relevant_schema: Optional[str] = None,
+                         execute: bool = True,
+                         columnar: bool = False) -> Dict[str, Any]:
+    """生成并执行单条查询，供单条与批量端点共用（columnar=True时result为列式结构）"""
     start_time = asyncio.get_event_loop().time()
     
+    # 生成SQL
+    generation_result = await engine.generate_sql(
+        query,
+        context,
+        relevant_schema=relevant_schema
+    )
+    
+    # 执行SQL（缓存中已有结果则直接返回）
+    sql = generation_result['sql']
+    result = generation_result.get('result')
+    truncated = bool(result is not None and generation_result.get('result_truncated'))
+    run = engine.execute_sql_columnar if columnar else engine.execute_sql
+    if columnar and result is not None:
+        result = _records_to_columnar(result)
+    elif result is None and execute:
+        try:
+            result, truncated = await run(sql)
+        except Exception as e:
+            # 快速模型生成的SQL修复后仍执行失败：升级到强模型重新生成并执行一次
+            if generation_result.get('model') != engine.model_router.fast_model:
+                raise
+            model_escalation_counter.labels(reason='execution_error').inc()
+            logger.info("快速模型SQL执行失败，升级到强模型", error=str(e)[:200])
+            first_tokens = generation_result['tokens_used']
+            generation_result = await engine.generate_sql(
+                query,
+                context,
+                relevant_schema=relevant_schema,
+                escalate=True
+            )
+            generation_result['tokens_used'] = {
+                key: first_tokens.get(key, 0) + count for key, count in generation_result['tokens_used'].items()
+            }
+            sql = generation_result['sql']
+            result, truncated = await run(sql)
+        sql_execution_counter.labels(status='success').inc()
+        
+        await engine.cache_generation(query, context, generation_result, None if columnar else result, truncated)
+    
+    row_count = result['row_count'] if columnar and result is not None else len(result or [])
+    
+    # 计算响应时间
+    execution_time = (asyncio.get_event_loop().time() - start_time) * 1000
+    response_time_histogram.observe(execution_time / 1000)
+    
+    return {
+        'sql': sql,
+        'result': result,
+        'explanation': f"查询已成功执行，返回{row_count}条结果" if result is not None else "SQL已生成，未执行",
+        'confidence': generation_result['confidence'],
+        'execution_time_ms': execution_time,
+        'tokens_used': generation_result['tokens_used'],
+        'truncated': truncated
+    }
+
+@app.post("/api/text2sql", response_model=Text2SQLResponse)
+async def text2sql(request: Text2SQLRequest, http_request: Request):
+    """主要的Text2SQL API端点（Accept协商：默认JSON行数组，可选列式JSON或Arrow IPC）"""
+    accept = http_request.headers.get('accept', '')
+    want_arrow = ARROW_STREAM_MEDIA_TYPE in accept
+    want_columnar = want_arrow or COLUMNAR_JSON_MEDIA_TYPE in accept
+    budget = _request_budget_seconds(http_request)
+    request_deadline.set(time.monotonic() + budget)
+    
     try:
-        # 生成SQL
-        generation_result = await engine.generate_sql(
-            request.query,
-            request.context
+        # 超出预算时取消生成/执行/自动修复，及时释放连接
+        payload = await asyncio.wait_for(
+            _process_query(request.query, request.context, columnar=want_columnar),
+            timeout=budget
         )
         
-        # 执行SQL
-        sql = generation_result['sql']
-        result = await engine.execute_sql(sql)
+        if want_arrow:
+            try:
+                body = _columnar_to_arrow(payload['result'], {
+                    key: payload[key] for key in ('sql', 'confidence', 'execution_time_ms', 'tokens_used', 'truncated')
+                })
+                response_format_counter.labels(format='arrow').inc()
+                return Response(content=body, media_type=ARROW_STREAM_MEDIA_TYPE)
+            except ImportError:
+                logger.warning("pyarrow未安装，回退到列式JSON")
         
-        sql_execution_counter.labels(status='success').inc()
+        if want_columnar:
+            response_format_counter.labels(format='columnar_json').inc()
+            return Response(
+                content=json.dumps(payload, ensure_ascii=False, default=str),
+                media_type=COLUMNAR_JSON_MEDIA_TYPE
+            )
         
-        # 计算响应时间
-        execution_time = (asyncio.get_event_loop().time() - start_time) * 1000
-        response_time_histogram.observe(execution_time / 1000)
+        response_format_counter.labels(format='json').inc()
+        return Text2SQLResponse(**payload)
         
-        return Text2SQLResponse(
-            sql=sql,
-            result=result,
-            explanation=f"查询已成功执行，返回{len(result)}条结果",
-            confidence=generation_result['confidence'],
-            execution_time_ms=execution_time,
-            tokens_used=generation_result['tokens_used']
+    except asyncio.TimeoutError:
+        request_deadline_exceeded_counter.labels(endpoint='text2sql').inc()
+        logger.warning("Text2SQL请求超出时间预算", query=request.query, budget_seconds=budget)
+        raise HTTPException(status_code=504, detail=f"请求超出时间预算({budget:.1f}s)")
+    except Exception as e:
+        logger.error(f"Text2SQL请求失败: {str(e)}", query=request.query)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/text2sql/batch")
+async def text2sql_batch(request: Text2SQLBatchRequest):
+    """批量Text2SQL端点 - 去重、批量检索、有界并发生成，按完成顺序以NDJSON流式返回"""
+    max_batch = int(os.getenv('BATCH_MAX_QUERIES', '500'))
+    if len(request.queries) > max_batch:
+        raise HTTPException(status_code=413, detail=f"批量查询数超过上限{max_batch}")
+    
+    # 按规范化查询+上下文去重，记录每条唯一查询对应的原始下标
+    from query_cache import normalize_query
+    
+    unique_items: Dict[str, Dict[str, Any]] = {}
+    for index, item in enumerate(request.queries):
+        dedup_key = json.dumps(
+            [normalize_query(item.query), item.context or {}],
+            ensure_ascii=False, sort_keys=True, default=str
         )
+        if dedup_key not in unique_items:
+            unique_items[dedup_key] = {'query': item.query, 'context': item.context, 'indices': []}
+        unique_items[dedup_key]['indices'].append(index)
+    
+    items = list(unique_items.values())
+    concurrency = min(request.max_concurrency or engine.llm_max_concurrency, engine.llm_max_concurrency)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    logger.info("批量Text2SQL请求",
+               total=len(request.queries),
+               unique=len(items),
+               concurrency=concurrency,
+               session_id=request.session_id)
+    
+    async def run_item(item: Dict[str, Any], relevant_schema: Optional[str]):
+        async with semaphore:
+            try:
+                payload = await _process_query(
+                    item['query'], item['context'],
+                    relevant_schema=relevant_schema,
+                    execute=request.execute
+                )
+                payload['status'] = 'success'
+            except Exception as e:
+                logger.error(f"批量查询条目失败: {str(e)}", query=item['query'])
+                payload = {'status': 'error', 'error': str(e)}
+        return item, payload
+    
+    async def stream_results():
+        # 整批共享一次schema检索
+        schemas = await engine._retrieve_schema_batch([item['query'] for item in items])
+        tasks = [asyncio.create_task(run_item(item, schema)) for item, schema in zip(items, schemas)]
         
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item, payload = await next_done
+                batch_item_counter.labels(status=payload['status']).inc(len(item['indices']))
+                for index in item['indices']:
+                    line = {'index': index, 'query': request.queries[index].query, **payload}
+                    yield json.dumps(line, ensure_ascii=False, default=str) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def _format_stream_event(event: Dict[str, Any], use_sse: bool) -> str:
+    """将流式事件编码为NDJSON行或SSE帧"""
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    if use_sse:
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+@app.post("/api/text2sql/stream")
+async def text2sql_stream(request: Text2SQLRequest, http_request: Request):
+    """流式Text2SQL端点 - 先发送SQL/置信度头，再分块发送结果行（NDJSON或SSE）"""
+    start_time = asyncio.get_event_loop().time()
+    use_sse = 'text/event-stream' in http_request.headers.get('accept', '')
+    chunk_size = int(os.getenv('STREAM_CHUNK_ROWS', '500'))
+    # 时间预算只约束SQL生成；结果行的流式传输由statement_timeout约束
+    budget = _request_budget_seconds(http_request)
+    request_deadline.set(time.monotonic() + budget)
+    
+    try:
+        generation_result = await asyncio.wait_for(
+            engine.generate_sql(request.query, request.context),
+            timeout=budget
+        )
+    except asyncio.TimeoutError:
+        request_deadline_exceeded_counter.labels(endpoint='text2sql_stream').inc()
+        raise HTTPException(status_code=504, detail=f"请求超出时间预算({budget:.1f}s)")
     except Exception as e:
         logger.error(f"Text2SQL请求失败: {str(e)}", query=request.query)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events():
+        # 结果流不受请求预算约束（仅由配置的statement_timeout约束）
+        request_deadline.set(None)
+        yield _format_stream_event({
+            'type': 'header',
+            'sql': generation_result['sql'],
+            'confidence': generation_result['confidence'],
+            'tokens_used': generation_result['tokens_used']
+        }, use_sse)
+        
+        row_count = 0
+        truncated = False
+        try:
+            cached_rows = generation_result.get('result')
+            if cached_rows is not None:
+                truncated = bool(generation_result.get('result_truncated'))
+                for offset in range(0, len(cached_rows), chunk_size):
+                    chunk = cached_rows[offset:offset + chunk_size]
+                    row_count += len(chunk)
+                    yield _format_stream_event({'type': 'rows', 'rows': chunk}, use_sse)
+            else:
+                async for event in engine.execute_sql_stream(generation_result['sql'], chunk_size):
+                    if event['type'] == 'truncated':
+                        truncated = True
+                        continue
+                    if event['type'] == 'rows':
+                        row_count += len(event['rows'])
+                    yield _format_stream_event(event, use_sse)
+        except Exception as e:
+            logger.error(f"流式执行失败: {str(e)}", query=request.query)
+            yield _format_stream_event({'type': 'error', 'error': str(e)}, use_sse)
+            return
+        
+        if cached_rows is None:
+            await engine.cache_generation(request.query, request.context, generation_result)
+        
+        execution_time = (asyncio.get_event_loop().time() - start_time) * 1000
+        response_time_histogram.observe(execution_time / 1000)
+        yield _format_stream_event({
+            'type': 'end',
+            'row_count': row_count,
+            'truncated': truncated,
+            'execution_time_ms': execution_time
+        }, use_sse)
+    
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+@app.post("/api/schema/ingest")
+async def ingest_db_schema(schemas: Optional[str] = None, dry_run: bool = False):
+    """Schema入库端点 - 只upsert内容哈希变化的表"""
+    schema_list = [
+        schema.strip()
+        for schema in (schemas or os.getenv('SCHEMA_INGEST_SCHEMAS', 'public')).split(',')
+        if schema.strip()
+    ]
+    try:
+        return await engine.ingest_schema(schema_list, dry_run=dry_run)
+    except Exception as e:
+        logger.error(f"Schema入库失败: {str(e)}", schemas=schema_list)
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/sql/validate")
 async def validate_sql(sql: str):
@@ -0,0 +1,60 @@
+"""
+模型分级路由
+女娲造物：小事轻骑，大事重兵
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class ModelRouter:
+    """简单问题先交给快速低价模型，置信度低、被拦截或执行失败时升级到强模型"""
+
+    def __init__(self,
+                 fast_model: str = "claude-3-haiku-20240307",
+                 strong_model: str = "claude-3-opus-20240229",
+                 max_query_chars: int = 80,
+                 max_tables: int = 1,
+                 near_miss_similarity: float = 0.85,
+                 min_confidence: float = 0.8,
+                 enabled: bool = True):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.max_query_chars = max_query_chars
+        self.max_tables = max_tables
+        self.near_miss_similarity = near_miss_similarity
+        self.min_confidence = min_confidence
+        self.enabled = enabled
+
+    def choose(self,
+               query: str,
+               prompt_stats: Dict[str, int],
+               similarity: Optional[float] = None) -> Tuple[str, str]:
+        """返回(模型, 路由原因)；prompt_stats来自PromptBuilder.build，similarity为语义缓存未命中时的最高相似度"""
+        if not self.enabled:
+            return self.strong_model, 'disabled'
+
+        # 语义缓存差一点命中：已有相近问题的SQL，快速模型足以应对
+        if similarity is not None and similarity >= self.near_miss_similarity:
+            return self.fast_model, 'cache_near_miss'
+
+        # 短问题且只涉及一张表（检索仅一张表，或查询只点名一张表）
+        single_table = (prompt_stats.get('tables', 0) <= self.max_tables
+                        or 0 < prompt_stats.get('mentioned_tables', 0) <= self.max_tables)
+        if len(query) <= self.max_query_chars and single_table:
+            return self.fast_model, 'simple'
+
+        return self.strong_model, 'complex'
+
+    def escalation_reason(self, model: str, validation_result: Dict[str, Any]) -> Optional[str]:
+        """快速模型的结果需要升级时返回原因，否则返回None"""
+        if model == self.strong_model:
+            return None
+        if validation_result['status'] == 'BLOCK':
+            return 'blocked'
+        if validation_result.get('confidence', 0.0) < self.min_confidence:
+            return 'low_confidence'
+        return None
@@ -0,0 +1,350 @@
+"""
+Token预算内的Prompt构建
+女娲造物：言简而意赅，字省而义全
+"""
+
+import re
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+# 紧凑表示中的类型缩写
+TYPE_ABBREVIATIONS = {
+    'integer': 'int',
+    'bigint': 'bigint',
+    'smallint': 'smallint',
+    'character varying': 'varchar',
+    'character': 'char',
+    'timestamp without time zone': 'timestamp',
+    'timestamp with time zone': 'timestamptz',
+    'time without time zone': 'time',
+    'double precision': 'double',
+    'boolean': 'bool',
+    'numeric': 'numeric',
+}
+
+_CREATE_TABLE_RE = re.compile(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w."]+)\s*\(', re.IGNORECASE)
+_ROWS_HEADER_RE = re.compile(r'--\s*rows:\s*([^;\n]+)(?:;\s*([^\n]*))?')
+_REFERENCES_RE = re.compile(r'REFERENCES\s+([\w."]+)\s*\(\s*([\w"]+)', re.IGNORECASE)
+_CONSTRAINT_RE = re.compile(r'\s+(?:NOT\s+NULL|NULL|PRIMARY\s+KEY|REFERENCES|DEFAULT|UNIQUE|CHECK)\b.*$', re.IGNORECASE | re.S)
+_TABLE_CONSTRAINT_RE = re.compile(r'^(?:PRIMARY\s+KEY|FOREIGN\s+KEY|CONSTRAINT|UNIQUE|CHECK)\b', re.IGNORECASE)
+_WORD_RE = re.compile(r'[a-z0-9_]+')
+# 中日韩表意文字、假名、谚文与全角标点
+_CJK_RE = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+
+def approx_tokens(text: str) -> int:
+    """预算用token估计：CJK字符约1 token/字，其余文本约4字符/token（近似值）。
+    anthropic SDK未提供公开的本地tokenizer，预算控制按此近似值估算，不依赖SDK私有模块
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return max(1, cjk + (len(text) - cjk + 3) // 4)
+
+
+def _split_top_level(body: str) -> List[str]:
+    """按顶层逗号拆分列定义（numeric(10,2)等括号内的逗号不拆）"""
+    parts, depth, current = [], 0, []
+    for char in body:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if ''.join(current).strip():
+        parts.append(''.join(current).strip())
+    return parts
+
+
+def parse_tables(schema_text: str) -> Tuple[List[Dict[str, Any]], str]:
+    """解析DDL风格的schema文本，返回(表结构列表, 无法解析的剩余文本)"""
+    tables, leftovers, position = [], [], 0
+    for match in _CREATE_TABLE_RE.finditer(schema_text):
+        if match.start() < position:
+            continue
+
+        # 匹配与开括号配对的闭括号
+        depth, end = 1, match.end()
+        while end < len(schema_text) and depth:
+            depth += {'(': 1, ')': -1}.get(schema_text[end], 0)
+            end += 1
+        if depth:
+            break
+
+        preceding = schema_text[position:match.start()]
+        header = _ROWS_HEADER_RE.search(preceding)
+        leftover = _ROWS_HEADER_RE.sub('', preceding).strip()
+        if leftover:
+            leftovers.append(leftover)
+
+        columns, primary_key = [], set()
+        for definition in _split_top_level(schema_text[match.end():end - 1]):
+            if _TABLE_CONSTRAINT_RE.match(definition):
+                pk = re.match(r'PRIMARY\s+KEY\s*\(([^)]*)\)', definition, re.IGNORECASE)
+                if pk:
+                    primary_key.update(name.strip().strip('"') for name in pk.group(1).split(','))
+                continue
+            pieces = definition.split(None, 1)
+            if not pieces:
+                continue
+            reference = _REFERENCES_RE.search(definition)
+            raw_type = _CONSTRAINT_RE.sub('', pieces[1]).strip().lower() if len(pieces) > 1 else ''
+            columns.append({
+                'name': pieces[0].strip('"'),
+                'type': TYPE_ABBREVIATIONS.get(raw_type, raw_type),
+                'primary_key': bool(re.search(r'PRIMARY\s+KEY', definition, re.IGNORECASE)),
+                'reference': f"{reference.group(1)}.{reference.group(2)}".replace('"', '') if reference else None
+            })
+        for column in columns:
+            column['primary_key'] = column['primary_key'] or column['name'] in primary_key
+
+        tables.append({
+            'name': match.group(1).replace('"', ''),
+            'columns': columns,
+            'rows': header.group(1).strip() if header else None,
+            'comment': (header.group(2) or '').strip() if header else ''
+        })
+        position = end
+        # 跳过语句结尾的分号
+        while position < len(schema_text) and schema_text[position] in ' \t;':
+            position += 1
+
+    tail = schema_text[position:].strip()
+    if tail:
+        leftovers.append(tail)
+    return tables, "\n".join(leftovers)
+
+
+def _query_words(query: str) -> set:
+    """查询中的标识符及其下划线分词"""
+    identifiers = set(_WORD_RE.findall(query.lower()))
+    return identifiers | {part for identifier in identifiers for part in identifier.split('_') if part}
+
+
+def _column_relevant(column: Dict[str, Any], words: set, common_parts: set) -> bool:
+    """主外键列始终保留；其余列按全名或区分度高的名称分词与查询词重叠判断"""
+    if column['primary_key'] or column['reference']:
+        return True
+    name = column['name'].lower()
+    if name in words:
+        return True
+    parts = {part for part in name.split('_') if len(part) >= 3 and part not in common_parts}
+    return bool(parts & words)
+
+
+def render_compact(table: Dict[str, Any], columns: Optional[List[Dict[str, Any]]] = None) -> str:
+    """紧凑表示：users(id int PK,email varchar,org_id int→orgs.id) ~10,000+行 -- 注释"""
+    shown = table['columns'] if columns is None else columns
+    rendered = []
+    for column in shown:
+        text = f"{column['name']} {column['type']}".strip()
+        if column['primary_key']:
+            text += " PK"
+        if column['reference']:
+            text += f"→{column['reference']}"
+        rendered.append(text)
+    hidden = len(table['columns']) - len(shown)
+    if hidden:
+        rendered.append(f"…+{hidden}列")
+
+    line = f"{table['name']}({','.join(rendered)})"
+    if table['rows'] and table['rows'] != 'unknown':
+        line += f" {table['rows']}行"
+    if table['comment']:
+        line += f" -- {table['comment']}"
+    return line
+
+
+class StableSchemaPrefix:
+    """高频表组成的稳定schema前缀：按周期刷新，周期内逐字节不变，以命中提示缓存"""
+
+    def __init__(self,
+                 token_budget: int = 2000,
+                 refresh_seconds: float = 3600,
+                 warmup_requests: int = 20,
+                 count_tokens: Callable[[str], int] = approx_tokens):
+        self.token_budget = token_budget
+        self.refresh_seconds = refresh_seconds
+        self.warmup_requests = warmup_requests
+        self.count_tokens = count_tokens
+        self.text = ""
+        self.tables = frozenset()
+        self._counts: Dict[str, int] = {}
+        self._lines: Dict[str, str] = {}
+        self._recorded = 0
+        self._warmed = False
+        self._refreshed_at = time.time()
+
+    def record(self, tables: List[Dict[str, Any]]):
+        """累计表的检索频次，并保留其完整紧凑表示"""
+        self._recorded += 1
+        for table in tables:
+            self._counts[table['name']] = self._counts.get(table['name'], 0) + 1
+            self._lines[table['name']] = render_compact(table)
+
+    def maybe_refresh(self, now: Optional[float] = None) -> bool:
+        """到期（或首次预热完成）时按频次重选前缀表，返回前缀是否变化"""
+        now = time.time() if now is None else now
+        warming_up = not self._warmed and self._recorded >= self.warmup_requests
+        if not warming_up and now - self._refreshed_at < self.refresh_seconds:
+            return False
+
+        selected, used = [], 0
+        for name in sorted(self._counts, key=lambda name: (-self._counts[name], name)):
+            cost = self.count_tokens(self._lines[name])
+            if used + cost > self.token_budget:
+                continue
+            selected.append(name)
+            used += cost
+
+        # 按表名排序，频次变化但表集合不变时前缀保持不变
+        text = "\n".join(self._lines[name] for name in sorted(selected))
+        changed = text != self.text
+        self.text = text
+        self.tables = frozenset(selected)
+        self._refreshed_at = now
+        self._warmed = True
+        self._counts = {}
+        if changed:
+            logger.info("稳定schema前缀已刷新", tables=len(selected), tokens=used)
+        return changed
+
+    def reset(self):
+        """schema变更后清空前缀与统计"""
+        self.text = ""
+        self.tables = frozenset()
+        self._counts = {}
+        self._lines = {}
+        self._recorded = 0
+        self._warmed = False
+        self._refreshed_at = time.time()
+
+
+class PromptBuilder:
+    """在输入token预算内组装prompt：压缩schema → 裁剪无关列 → 丢弃低相关表 → 截断上下文"""
+
+    def __init__(self,
+                 token_budget: int = 4000,
+                 count_tokens: Callable[[str], int] = approx_tokens,
+                 prune_min_columns: int = 12,
+                 keep_leading_columns: int = 6,
+                 context_share: float = 0.2,
+                 prefix: Optional[StableSchemaPrefix] = None):
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens
+        self.prune_min_columns = prune_min_columns
+        self.keep_leading_columns = keep_leading_columns
+        self.context_share = context_share
+        self.prefix = prefix
+
+    def system_blocks(self, system_prompt: str) -> List[Dict[str, Any]]:
+        """稳定前缀 = 系统提示 + 高频表schema，整体标记为可缓存"""
+        text = system_prompt
+        if self.prefix is not None and self.prefix.text:
+            text += f"\n\n常用表Schema:\n{self.prefix.text}"
+        return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+    @staticmethod
+    def _render(query: str, schema: str, context_text: Optional[str]) -> str:
+        prompt = f"""数据库Schema:
+{schema}
+
+用户查询: {query}
+"""
+        if context_text:
+            prompt += f"\n额外上下文: {context_text}"
+        prompt += "\n\n请生成对应的SQL查询语句。"
+        return prompt
+
+    def _prune_columns(self, table: Dict[str, Any], words: set) -> List[Dict[str, Any]]:
+        """宽表只保留主外键、与查询相关的列以及前几列"""
+        if len(table['columns']) < self.prune_min_columns:
+            return table['columns']
+
+        # 表内过半列共有的分词（如attr_1..attr_n的attr）没有区分度
+        part_counts: Dict[str, int] = {}
+        for column in table['columns']:
+            for part in set(column['name'].lower().split('_')):
+                part_counts[part] = part_counts.get(part, 0) + 1
+        common_parts = {part for part, count in part_counts.items() if count * 2 > len(table['columns'])}
+
+        return [
+            column for index, column in enumerate(table['columns'])
+            if index < self.keep_leading_columns or _column_relevant(column, words, common_parts)
+        ]
+
+    def _fit_context(self, context: Optional[Dict[str, Any]], budget: int) -> Optional[str]:
+        if not context:
+            return None
+        text = json.dumps(context, ensure_ascii=False, separators=(',', ':'), default=str)
+        if self.count_tokens(text) <= budget:
+            return text
+        # 二分截断到预算内
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low] + "…"
+
+    def build(self,
+              query: str,
+              schema: str,
+              context: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, int]]:
+        """返回(prompt, 统计)；统计含压缩前后token数、裁剪情况与检索/查询提及的表数"""
+        raw_context = json.dumps(context, ensure_ascii=False) if context else None
+        raw_tokens = self.count_tokens(self._render(query, schema, raw_context))
+
+        context_text = self._fit_context(context, int(self.token_budget * self.context_share))
+        tables, leftover = parse_tables(schema)
+        words = _query_words(query)
+        retrieved_tables = len(tables)
+        mentioned_tables = sum(
+            1 for table in tables
+            if table['name'].lower() in words or table['name'].lower().rstrip('s') in words
+        )
+
+        # 已在稳定前缀中的表不再重复放入可变部分
+        if self.prefix is not None:
+            self.prefix.record(tables)
+            self.prefix.maybe_refresh()
+            tables = [table for table in tables if table['name'] not in self.prefix.tables]
+
+        base_tokens = self.count_tokens(self._render(query, leftover, context_text))
+        schema_budget = max(0, self.token_budget - base_tokens)
+
+        lines = [render_compact(table) for table in tables]
+        pruned_columns = 0
+        if sum(self.count_tokens(line) for line in lines) > schema_budget:
+            lines = []
+            for table in tables:
+                kept = self._prune_columns(table, words)
+                pruned_columns += len(table['columns']) - len(kept)
+                lines.append(render_compact(table, kept))
+
+        # 检索结果按相关度排序：超预算时从末尾丢弃，至少保留一张表
+        dropped_tables = 0
+        while len(lines) > 1 and sum(self.count_tokens(line) for line in lines) > schema_budget:
+            lines.pop()
+            dropped_tables += 1
+
+        compact_schema = "\n".join(lines + ([leftover] if leftover else []))
+        prompt = self._render(query, compact_schema, context_text)
+        stats = {
+            'raw_tokens': raw_tokens,
+            'prompt_tokens': self.count_tokens(prompt),
+            'pruned_columns': pruned_columns,
+            'dropped_tables': dropped_tables,
+            'tables': retrieved_tables,
+            'mentioned_tables': mentioned_tables
+        }
+        return prompt, stats
@@ -0,0 +1,224 @@
+"""
+Text2SQL 查询结果缓存
+女娲造物：一问既答，再问即得
+"""
+
+import re
+import json
+import time
+import hashlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT_RE = re.compile(r'[\s\.,;:!?。，；：！？]+$')
+
+
+def normalize_query(query: str) -> str:
+    """规范化自然语言查询：小写、合并空白、去掉结尾标点"""
+    normalized = _WHITESPACE_RE.sub(' ', query.strip().lower())
+    return _TRAILING_PUNCT_RE.sub('', normalized)
+
+
+def make_cache_key(query: str,
+                   context: Optional[Dict[str, Any]],
+                   whitelist_version: str,
+                   schema_fingerprint: str) -> str:
+    """由规范化查询、上下文、白名单版本和schema指纹生成缓存键"""
+    payload = json.dumps(
+        {
+            'q': normalize_query(query),
+            'ctx': context or {},
+            'wl': whitelist_version,
+            'schema': schema_fingerprint
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str
+    )
+    return "text2sql:" + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """进程内LRU缓存 - 支持TTL与字节预算"""
+
+    def __init__(self,
+                 max_bytes: int = 100 * 1024 * 1024,
+                 ttl_seconds: float = 300,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self.current_bytes = 0
+        # key -> (expires_at, size, value)
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key, reason='expired')
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None):
+        size = len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+        if size > self.max_bytes:
+            # 单条超出预算，直接不缓存
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.current_bytes += size
+
+        while self.current_bytes > self.max_bytes and self._entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key, reason='capacity')
+
+    def delete(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def _remove(self, key: str, reason: Optional[str] = None):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+        if reason and self.on_evict:
+            self.on_evict(reason)
+
+
+class CacheBackend(ABC):
+    """共享缓存后端接口（L2）"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+
+class RedisCacheBackend(CacheBackend):
+    """基于Redis的共享缓存后端"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis_asyncio
+
+        self.client = redis_asyncio.from_url(url)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Dict[str, Any], ttl_seconds: float):
+        await self.client.set(
+            key,
+            json.dumps(value, ensure_ascii=False, default=str),
+            ex=max(1, int(ttl_seconds))
+        )
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+
+class QueryCache:
+    """两级缓存：L1进程内LRU + 可选L2共享后端"""
+
+    def __init__(self,
+                 max_bytes: int = 100 * 1024 * 1024,
+                 ttl_seconds: float = 300,
+                 shared_backend: Optional[CacheBackend] = None,
+                 shared_ttl_seconds: float = 3600,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.local = LRUCache(max_bytes=max_bytes, ttl_seconds=ttl_seconds, on_evict=on_evict)
+        self.shared_backend = shared_backend
+        self.shared_ttl_seconds = shared_ttl_seconds
+        self.ttl_seconds = ttl_seconds
+
+    async def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """查询缓存，返回(值, 命中层级)"""
+        value = self.local.get(key)
+        if value is not None:
+            return value, 'l1'
+
+        if self.shared_backend is not None:
+            try:
+                value = await self.shared_backend.get(key)
+            except Exception as e:
+                logger.warning(f"共享缓存读取失败: {e}")
+                value = None
+
+            if value is not None:
+                # 回填L1
+                self.local.set(key, value)
+                return value, 'l2'
+
+        return None, None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        """写入两级缓存"""
+        self.local.set(key, value)
+
+        if self.shared_backend is not None:
+            try:
+                await self.shared_backend.set(key, value, self.shared_ttl_seconds)
+            except Exception as e:
+                logger.warning(f"共享缓存写入失败: {e}")
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+        if self.shared_backend is not None:
+            try:
+                await self.shared_backend.delete(key)
+            except Exception as e:
+                logger.warning(f"共享缓存删除失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self.local),
+            'bytes': self.local.current_bytes,
+            'max_bytes': self.local.max_bytes,
+            'shared_backend': type(self.shared_backend).__name__ if self.shared_backend else None
+        }
+
+
+def build_shared_backend(url: Optional[str]) -> Optional[CacheBackend]:
+    """根据URL构建共享缓存后端"""
+    if not url:
+        return None
+
+    if url.startswith(('redis://', 'rediss://')):
+        try:
+            return RedisCacheBackend(url)
+        except ImportError:
+            logger.warning("redis模块未安装，跳过共享缓存")
+            return None
+
+    logger.warning("不支持的共享缓存后端", url=url)
+    return None
@@ -0,0 +1,126 @@
+"""
+只读副本路由
+女娲造物：一源多流，择闲而行
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+logger = structlog.get_logger()
+
+
+async def ping_engine(db_engine) -> None:
+    """默认健康探测：在副本上执行SELECT 1"""
+    async with db_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+class Replica:
+    """单个只读副本的运行状态"""
+
+    def __init__(self, name: str, db_engine):
+        self.name = name
+        self.db_engine = db_engine
+        self.session_factory = sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.in_flight = 0
+
+
+class ReadReplicaRouter:
+    """健康检查 + 最少连接数的只读副本路由，无可用副本时返回None由调用方回退主库"""
+
+    def __init__(self,
+                 replicas: List[Tuple[str, Any]],
+                 health_interval_seconds: float = 5.0,
+                 health_timeout_seconds: float = 2.0,
+                 failure_threshold: int = 2,
+                 probe: Callable[[Any], Awaitable[None]] = ping_engine,
+                 on_health_change: Optional[Callable[[str, bool], None]] = None):
+        self.replicas = [Replica(name, db_engine) for name, db_engine in replicas]
+        self.health_interval_seconds = health_interval_seconds
+        self.health_timeout_seconds = health_timeout_seconds
+        self.failure_threshold = failure_threshold
+        self.probe = probe
+        self.on_health_change = on_health_change
+        self._health_task = None
+        self._next_offset = 0
+
+        if self.on_health_change:
+            for replica in self.replicas:
+                self.on_health_change(replica.name, replica.healthy)
+
+    def pick(self) -> Optional[Replica]:
+        """选择进行中查询最少的健康副本；并列时轮转起点，避免总落在第一个"""
+        count = len(self.replicas)
+        if count == 0:
+            return None
+
+        start = self._next_offset % count
+        self._next_offset += 1
+
+        best = None
+        for step in range(count):
+            replica = self.replicas[(start + step) % count]
+            if replica.healthy and (best is None or replica.in_flight < best.in_flight):
+                best = replica
+        return best
+
+    @asynccontextmanager
+    async def route(self):
+        """占用一个副本名额，产出被选中的副本（可能为None）"""
+        replica = self.pick()
+        if replica is None:
+            yield None
+            return
+
+        replica.in_flight += 1
+        try:
+            yield replica
+        finally:
+            replica.in_flight -= 1
+
+    async def check_health(self):
+        """探测全部副本，连续失败达到阈值才摘除，一次成功即恢复"""
+        await asyncio.gather(*(self._check_replica(replica) for replica in self.replicas))
+
+    async def _check_replica(self, replica: Replica):
+        try:
+            await asyncio.wait_for(self.probe(replica.db_engine), timeout=self.health_timeout_seconds)
+            replica.consecutive_failures = 0
+            healthy = True
+        except Exception as e:
+            replica.consecutive_failures += 1
+            healthy = replica.healthy and replica.consecutive_failures < self.failure_threshold
+            if not healthy:
+                logger.warning("只读副本健康检查失败", replica=replica.name, error=str(e)[:200])
+
+        if healthy != replica.healthy:
+            replica.healthy = healthy
+            logger.info("只读副本状态变更", replica=replica.name, healthy=healthy)
+            if self.on_health_change:
+                self.on_health_change(replica.name, healthy)
+
+    def start(self):
+        """启动后台健康检查"""
+        if self._health_task is None and self.replicas:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval_seconds)
+
+    async def close(self):
+        """停止健康检查并释放副本连接池"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for replica in self.replicas:
+            await replica.db_engine.dispose()
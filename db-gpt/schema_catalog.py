@@ -0,0 +1,171 @@
+"""
+Debugger的Schema目录与表/列名模糊检索
+女娲造物：名有小误，实可寻之
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+
+
+def trigrams(name: str) -> Set[str]:
+    """首尾补空格的字符三元组，短名也至少产生一个三元组"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """带相邻换位的编辑距离（OSA），只计算|i-j|<=max_distance的对角带；超过上限返回max_distance + 1"""
+    la, lb = len(a), len(b)
+    too_far = max_distance + 1
+    if abs(la - lb) > max_distance:
+        return too_far
+
+    previous2: List[int] = []
+    previous = [j if j <= max_distance else too_far for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        ca = a[i - 1]
+        pa = a[i - 2] if i > 1 else None
+        current = [too_far] * (lb + 1)
+        current[0] = i if i <= max_distance else too_far
+        row_min = current[0]
+        for j in range(max(1, i - max_distance), min(lb, i + max_distance) + 1):
+            cb = b[j - 1]
+            value = previous[j - 1] if ca == cb else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if pa is not None and j > 1 and ca == b[j - 2] and pa == cb and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return too_far
+        previous2, previous = previous, current
+    return min(previous[lb], too_far)
+
+
+def max_edit_distance(name: str) -> int:
+    """可接受的拼写误差随名字长度增长（5字符2处，10字符3处）"""
+    return max(1, round(len(name) * 0.3))
+
+
+class FuzzyNameIndex:
+    """三元组倒排索引：向量化计算三元组Jaccard相似度取候选，只对少量候选计算编辑距离"""
+
+    def __init__(self, names: Iterable[str], candidates: int = 10, min_similarity: float = 0.3):
+        self.names: List[str] = sorted(set(names))
+        self.candidates = candidates
+        self.min_similarity = min_similarity
+        gram_counts = []
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for position, name in enumerate(self.names):
+            grams = trigrams(name)
+            gram_counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(position)
+        self._gram_counts = np.asarray(gram_counts, dtype=np.float32)
+        self._postings = {gram: np.asarray(positions, dtype=np.int32) for gram, positions in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def search(self, term: str) -> List[Tuple[int, float, str]]:
+        """返回[(编辑距离, 相似度, 名字)]，按编辑距离升序、相似度降序；编辑距离或相似度达标者才保留"""
+        grams = trigrams(term)
+        hits = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not hits:
+            return []
+
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        similarity = shared / (len(grams) + self._gram_counts - shared)
+        top = np.flatnonzero(shared)
+        if len(top) > self.candidates:
+            top = top[np.argpartition(-similarity[top], self.candidates - 1)[:self.candidates]]
+
+        max_distance = max_edit_distance(term)
+        matches = []
+        for position in top.tolist():
+            name = self.names[position]
+            similarity_value = float(similarity[position])
+            distance = edit_distance(term, name, max_distance)
+            if distance <= max_distance or similarity_value >= self.min_similarity:
+                matches.append((distance, similarity_value, name))
+        matches.sort(key=lambda match: (match[0], -match[1], match[2]))
+        return matches
+
+
+class SchemaCatalog:
+    """表→列目录；表名按不带schema前缀的名字建一个全局索引，列名每张表一个索引，检索列时只查SQL实际引用的表"""
+
+    def __init__(self, tables: Dict[str, Sequence[str]]):
+        self.tables: Dict[str, List[str]] = {
+            table.lower(): [column.lower() for column in columns] for table, columns in tables.items()
+        }
+        # analyze_sql给出的是不带schema前缀的表名
+        self._by_bare_name: Dict[str, List[str]] = defaultdict(list)
+        for table in self.tables:
+            self._by_bare_name[table.rsplit('.', 1)[-1]].append(table)
+
+        self.table_index = FuzzyNameIndex(self._by_bare_name)
+        self.column_indexes = {table: FuzzyNameIndex(columns) for table, columns in self.tables.items()}
+        self.column_index = FuzzyNameIndex(column for columns in self.tables.values() for column in columns)
+
+    @classmethod
+    def from_tables(cls, tables: List[Dict[str, Any]]) -> 'SchemaCatalog':
+        """由schema_ingest.introspect_schema的结果构建"""
+        return cls({table['name']: [column['name'] for column in table['columns']] for table in tables})
+
+    @property
+    def column_count(self) -> int:
+        return sum(len(columns) for columns in self.tables.values())
+
+    def resolve(self, table_names: Iterable[str]) -> List[str]:
+        """SQL中引用的表名（可能不带schema前缀）对应的目录表"""
+        resolved = []
+        for name in table_names:
+            name = name.lower()
+            if name in self.tables:
+                resolved.append(name)
+            else:
+                resolved.extend(self._by_bare_name.get(name, ()))
+        return resolved
+
+    def similar_tables(self, name: str, limit: int = 3) -> List[str]:
+        """按不带schema前缀的名字检索；同名表优先与缺失表同schema的"""
+        schema, _, bare = name.lower().rpartition('.')
+        tables = []
+        for _, _, match in self.table_index.search(bare):
+            tables.extend(sorted(self._by_bare_name[match], key=lambda table: table.rpartition('.')[0] != schema))
+        return tables[:limit]
+
+    def similar_columns(self,
+                        name: str,
+                        referenced_tables: Iterable[str] = (),
+                        owner_tables: Iterable[str] = (),
+                        limit: int = 3) -> List[str]:
+        """在SQL引用的表内检索相似列名：按编辑距离，其次是否出现在该列所属表（owner_tables）、
+        在引用表中出现的次数，最后按三元组相似度排序；SQL未引用已知表时退回全部列
+        """
+        name = name.lower()
+        tables = self.resolve(referenced_tables)
+        if not tables:
+            return [column for _, _, column in self.column_index.search(name)[:limit]]
+
+        owners = set(self.resolve(owner_tables))
+        # 列 -> [编辑距离, 是否在所属表中, 出现的引用表数, 相似度]
+        ranked: Dict[str, List[Any]] = {}
+        for table in tables:
+            for distance, similarity, column in self.column_indexes[table].search(name):
+                entry = ranked.setdefault(column, [distance, False, 0, similarity])
+                entry[1] = entry[1] or table in owners
+                entry[2] += 1
+        return [
+            column for column, _ in sorted(
+                ranked.items(),
+                key=lambda item: (item[1][0], not item[1][1], -item[1][2], -item[1][3], item[0])
+            )[:limit]
+        ]
@@ -0,0 +1,100 @@
+"""
+外键关系图与检索扩展
+女娲造物：执两端而求其桥
+"""
+
+from collections import deque
+from itertools import combinations
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import structlog
+
+from prompt_builder import approx_tokens
+
+logger = structlog.get_logger()
+
+
+class SchemaGraph:
+    """表级外键邻接图（无向），用于补全检索命中表之间的桥接表"""
+
+    def __init__(self, documents: Dict[str, str], references: Dict[str, Set[str]]):
+        self.documents = documents
+        self.adjacency: Dict[str, Set[str]] = {table: set() for table in documents}
+        for table, targets in references.items():
+            for target in targets:
+                if table in self.adjacency and target in self.adjacency and target != table:
+                    self.adjacency[table].add(target)
+                    self.adjacency[target].add(table)
+
+    @classmethod
+    def from_collection_data(cls, data: Dict[str, Any]) -> 'SchemaGraph':
+        """由db_schema集合的documents与metadatas（入库时写入table/references）构建"""
+        documents: Dict[str, str] = {}
+        references: Dict[str, Set[str]] = {}
+        for entry_id, document, metadata in zip(data.get('ids') or [],
+                                                data.get('documents') or [],
+                                                data.get('metadatas') or []):
+            metadata = metadata or {}
+            table = metadata.get('table', entry_id)
+            documents[table] = document
+            references[table] = {ref for ref in (metadata.get('references') or '').split(',') if ref}
+        return cls(documents, references)
+
+    @property
+    def edge_count(self) -> int:
+        return sum(len(neighbors) for neighbors in self.adjacency.values()) // 2
+
+    def shortest_path(self, source: str, target: str, max_hops: int = 3) -> Optional[List[str]]:
+        """BFS求两表间最短连接路径（含两端），超出max_hops视为不可达"""
+        if source not in self.adjacency or target not in self.adjacency:
+            return None
+        if source == target:
+            return [source]
+
+        parents = {source: None}
+        frontier = deque([(source, 0)])
+        while frontier:
+            table, depth = frontier.popleft()
+            if depth >= max_hops:
+                continue
+            for neighbor in self.adjacency[table]:
+                if neighbor in parents:
+                    continue
+                parents[neighbor] = table
+                if neighbor == target:
+                    path = [neighbor]
+                    while parents[path[-1]] is not None:
+                        path.append(parents[path[-1]])
+                    return path[::-1]
+                frontier.append((neighbor, depth + 1))
+        return None
+
+    def expand(self,
+               hit_tables: List[str],
+               token_budget: int,
+               max_hops: int = 3,
+               count_tokens: Callable[[str], int] = approx_tokens) -> List[str]:
+        """在命中表之间补充最短连接路径上的桥接表，按路径长度优先、在token预算内加入"""
+        selected = [table for table in dict.fromkeys(hit_tables) if table in self.documents]
+        used = sum(count_tokens(self.documents[table]) for table in selected)
+
+        paths = []
+        for source, target in combinations(selected, 2):
+            path = self.shortest_path(source, target, max_hops)
+            if path and len(path) > 2:
+                paths.append(path)
+        paths.sort(key=len)
+
+        chosen = set(selected)
+        for path in paths:
+            bridges = [table for table in path[1:-1] if table not in chosen]
+            if not bridges:
+                continue
+            cost = sum(count_tokens(self.documents[table]) for table in bridges)
+            if used + cost > token_budget:
+                continue
+            selected.extend(bridges)
+            chosen.update(bridges)
+            used += cost
+
+        return selected
@@ -0,0 +1,130 @@
+"""
+本地Schema向量索引
+女娲造物：近取诸身，不假外求
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+MATRIX_FILE = "schema_index.npy"
+META_FILE = "schema_index.json"
+
+
+class LocalSchemaIndex:
+    """预计算schema块embedding的内存映射矩阵 + 向量化top-k余弦检索"""
+
+    def __init__(self,
+                 index_dir: str,
+                 embed_fn: Callable[[List[str]], Sequence[Sequence[float]]]):
+        self.index_dir = Path(index_dir)
+        self.embed_fn = embed_fn
+        # (矩阵, id, 文档, 指纹) 作为整体替换，检索线程不会看到新矩阵配旧文档
+        self._snapshot = (None, [], [], None)
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self._snapshot[3]
+
+    @property
+    def documents(self) -> List[str]:
+        return self._snapshot[2]
+
+    @property
+    def ready(self) -> bool:
+        matrix, _, documents, _ = self._snapshot
+        return matrix is not None and len(documents) > 0
+
+    def load(self, fingerprint: Optional[str] = None) -> bool:
+        """加载磁盘索引；给定指纹时要求一致（fingerprint=None表示接受任意版本）"""
+        meta_path = self.index_dir / META_FILE
+        matrix_path = self.index_dir / MATRIX_FILE
+        if not meta_path.exists() or not matrix_path.exists():
+            return False
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if fingerprint is not None and meta.get('fingerprint') != fingerprint:
+                return False
+
+            matrix = np.load(matrix_path, mmap_mode='r')
+            if matrix.ndim != 2 or matrix.shape[0] != len(meta['documents']):
+                logger.warning("本地Schema索引损坏，忽略", path=str(matrix_path))
+                return False
+        except Exception as e:
+            logger.warning(f"本地Schema索引加载失败: {str(e)}")
+            return False
+
+        self._snapshot = (matrix, meta['ids'], meta['documents'], meta.get('fingerprint'))
+        logger.info("本地Schema索引已加载", chunks=len(self.documents), fingerprint=self.fingerprint)
+        return True
+
+    def build(self,
+              fingerprint: str,
+              ids: List[str],
+              documents: List[str],
+              embeddings: Sequence[Sequence[float]]):
+        """写入新索引（行向量预先归一化），原子替换后重新以mmap加载"""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(documents):
+            raise ValueError(f"embedding矩阵形状{matrix.shape}与文档数{len(documents)}不一致")
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        matrix_tmp = self.index_dir / f".{MATRIX_FILE}.tmp"
+        meta_tmp = self.index_dir / f".{META_FILE}.tmp"
+        with open(matrix_tmp, 'wb') as f:
+            np.save(f, matrix)
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'ids': ids, 'documents': documents}, f, ensure_ascii=False)
+
+        # 先替换矩阵再替换元数据：元数据即提交点
+        os.replace(matrix_tmp, self.index_dir / MATRIX_FILE)
+        os.replace(meta_tmp, self.index_dir / META_FILE)
+
+        if not self.load(fingerprint):
+            raise RuntimeError("本地Schema索引写入后加载失败")
+
+    def search(self,
+               query_embeddings: Sequence[Sequence[float]],
+               n_results: int = 3) -> Tuple[List[List[str]], List[List[str]]]:
+        """对每个查询向量返回余弦相似度最高的n_results个schema块，形如Chroma的(ids, documents)"""
+        matrix, ids, documents, _ = self._snapshot
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+
+        scores = queries @ matrix.T
+        k = min(n_results, scores.shape[1])
+        # argpartition取top-k，再只对这k个排序
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        top = np.take_along_axis(top, order, axis=1)
+        return [[ids[i] for i in row] for row in top], [[documents[i] for i in row] for row in top]
+
+    def query(self, query_texts: List[str], n_results: int = 3) -> Tuple[List[List[str]], List[List[str]]]:
+        """计算查询embedding后检索"""
+        return self.search(self.embed_fn(query_texts), n_results)
+
+    def sync_from_collection(self, collection: Any, fingerprint: str) -> bool:
+        """从Chroma集合导出documents与embeddings重建索引（Chroma为权威数据源）"""
+        if self.fingerprint == fingerprint and self.ready:
+            return False
+
+        data = collection.get(include=['documents', 'embeddings'])
+        if not data.get('ids'):
+            logger.warning("db_schema集合为空，跳过本地索引构建")
+            return False
+
+        self.build(fingerprint, list(data['ids']), list(data['documents']), data['embeddings'])
+        logger.info("本地Schema索引已重建", chunks=len(self.documents), fingerprint=fingerprint)
+        return True
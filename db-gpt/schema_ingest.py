@@ -0,0 +1,281 @@
+"""
+Schema采集与增量入库
+女娲造物：观其形而记其变
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import structlog
+from sqlalchemy import text
+
+logger = structlog.get_logger()
+
+COLUMNS_SQL = text("""
+    SELECT c.table_schema, c.table_name, c.column_name, c.data_type, c.is_nullable
+    FROM information_schema.columns c
+    JOIN information_schema.tables t
+      ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+    WHERE t.table_type = 'BASE TABLE' AND c.table_schema = ANY(:schemas)
+    ORDER BY c.table_schema, c.table_name, c.ordinal_position
+""")
+
+CONSTRAINTS_SQL = text("""
+    SELECT ns.nspname AS table_schema,
+           cl.relname AS table_name,
+           con.contype,
+           ARRAY(SELECT a.attname FROM unnest(con.conkey) WITH ORDINALITY k(attnum, ord)
+                 JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                 ORDER BY k.ord) AS columns,
+           fns.nspname AS ref_schema,
+           fcl.relname AS ref_table,
+           ARRAY(SELECT a.attname FROM unnest(con.confkey) WITH ORDINALITY k(attnum, ord)
+                 JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+                 ORDER BY k.ord) AS ref_columns
+    FROM pg_constraint con
+    JOIN pg_class cl ON cl.oid = con.conrelid
+    JOIN pg_namespace ns ON ns.oid = cl.relnamespace
+    LEFT JOIN pg_class fcl ON fcl.oid = con.confrelid
+    LEFT JOIN pg_namespace fns ON fns.oid = fcl.relnamespace
+    WHERE con.contype IN ('p', 'f') AND ns.nspname = ANY(:schemas)
+    ORDER BY ns.nspname, cl.relname, con.conname
+""")
+
+TABLE_STATS_SQL = text("""
+    SELECT ns.nspname AS table_schema,
+           cl.relname AS table_name,
+           cl.reltuples::bigint AS row_estimate,
+           obj_description(cl.oid, 'pg_class') AS comment
+    FROM pg_class cl
+    JOIN pg_namespace ns ON ns.oid = cl.relnamespace
+    WHERE cl.relkind IN ('r', 'p') AND ns.nspname = ANY(:schemas)
+""")
+
+
+def _table_name(schema: str, table: str) -> str:
+    """public下的表使用裸表名，与白名单保持一致"""
+    return table if schema == 'public' else f"{schema}.{table}"
+
+
+async def introspect_schema(db_engine, schemas: List[str]) -> List[Dict[str, Any]]:
+    """通过information_schema/pg_catalog读取表、列、主外键与行数估计"""
+    async with db_engine.connect() as conn:
+        column_rows = (await conn.execute(COLUMNS_SQL, {'schemas': schemas})).mappings().all()
+        constraint_rows = (await conn.execute(CONSTRAINTS_SQL, {'schemas': schemas})).mappings().all()
+        stats_rows = (await conn.execute(TABLE_STATS_SQL, {'schemas': schemas})).mappings().all()
+
+    tables: Dict[str, Dict[str, Any]] = {}
+    for row in column_rows:
+        name = _table_name(row['table_schema'], row['table_name'])
+        table = tables.setdefault(name, {
+            'name': name, 'columns': [], 'primary_key': [], 'foreign_keys': [],
+            'row_estimate': None, 'comment': None
+        })
+        table['columns'].append({
+            'name': row['column_name'],
+            'type': row['data_type'],
+            'nullable': row['is_nullable'] == 'YES'
+        })
+
+    for row in constraint_rows:
+        table = tables.get(_table_name(row['table_schema'], row['table_name']))
+        if table is None:
+            continue
+        if row['contype'] == 'p':
+            table['primary_key'] = list(row['columns'])
+        else:
+            table['foreign_keys'].append({
+                'columns': list(row['columns']),
+                'ref_table': _table_name(row['ref_schema'], row['ref_table']),
+                'ref_columns': list(row['ref_columns'])
+            })
+
+    for row in stats_rows:
+        table = tables.get(_table_name(row['table_schema'], row['table_name']))
+        if table is not None:
+            table['row_estimate'] = row['row_estimate']
+            table['comment'] = row['comment']
+
+    return [tables[name] for name in sorted(tables)]
+
+
+def _row_magnitude(row_estimate: Optional[int]) -> str:
+    """行数只保留数量级，避免统计信息的日常波动触发重新embedding"""
+    if row_estimate is None or row_estimate < 0:
+        return "unknown"
+    if row_estimate < 10:
+        return "<10"
+    magnitude = 10
+    while magnitude * 10 <= row_estimate:
+        magnitude *= 10
+    return f"{magnitude:,}+"
+
+
+def render_chunk(table: Dict[str, Any]) -> str:
+    """每表一个schema块：DDL风格描述，含列类型、主外键与行数量级"""
+    primary_key = set(table['primary_key'])
+    references = {}
+    for fk in table['foreign_keys']:
+        if len(fk['columns']) == 1:
+            references[fk['columns'][0]] = f"{fk['ref_table']}({fk['ref_columns'][0]})"
+
+    lines = []
+    for column in table['columns']:
+        parts = [f"  {column['name']} {column['type']}"]
+        if not column['nullable']:
+            parts.append("NOT NULL")
+        if column['name'] in primary_key and len(primary_key) == 1:
+            parts.append("PRIMARY KEY")
+        if column['name'] in references:
+            parts.append(f"REFERENCES {references[column['name']]}")
+        lines.append(" ".join(parts))
+
+    if len(primary_key) > 1:
+        lines.append(f"  PRIMARY KEY ({', '.join(table['primary_key'])})")
+    for fk in table['foreign_keys']:
+        if len(fk['columns']) > 1:
+            lines.append(
+                f"  FOREIGN KEY ({', '.join(fk['columns'])}) "
+                f"REFERENCES {fk['ref_table']}({', '.join(fk['ref_columns'])})"
+            )
+
+    header = f"-- rows: {_row_magnitude(table['row_estimate'])}"
+    if table.get('comment'):
+        header += f"; {table['comment']}"
+    return f"{header}\nCREATE TABLE {table['name']} (\n" + ",\n".join(lines) + "\n);"
+
+
+def build_chunks(tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """生成带内容哈希的schema块（id即表名）"""
+    chunks = []
+    for table in tables:
+        document = render_chunk(table)
+        chunks.append({
+            'id': table['name'],
+            'document': document,
+            'metadata': {
+                'table': table['name'],
+                'content_hash': hashlib.sha256(document.encode('utf-8')).hexdigest(),
+                'columns': ",".join(column['name'] for column in table['columns']),
+                'references': ",".join(sorted({fk['ref_table'] for fk in table['foreign_keys']}))
+            }
+        })
+    return chunks
+
+
+class SchemaIngestor:
+    """对比内容哈希，只upsert变化的schema块并删除已不存在的表"""
+
+    def __init__(self,
+                 collection,
+                 run_sync: Optional[Callable[..., Awaitable[Any]]] = None,
+                 on_chunk: Optional[Callable[[str, int], None]] = None):
+        self.collection = collection
+        # Chroma客户端为同步实现，默认放到线程中执行
+        self.run_sync = run_sync or asyncio.to_thread
+        self.on_chunk = on_chunk
+
+    async def sync(self, chunks: List[Dict[str, Any]], prune: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+        existing = await self.run_sync(self.collection.get, include=['metadatas'])
+        existing_hashes = {
+            entry_id: (metadata or {}).get('content_hash')
+            for entry_id, metadata in zip(existing.get('ids') or [], existing.get('metadatas') or [])
+        }
+
+        changed = [chunk for chunk in chunks if existing_hashes.get(chunk['id']) != chunk['metadata']['content_hash']]
+        current_ids = {chunk['id'] for chunk in chunks}
+        stale_ids = sorted(set(existing_hashes) - current_ids) if prune else []
+
+        stats = {
+            'changed': len(changed),
+            'unchanged': len(chunks) - len(changed),
+            'deleted': len(stale_ids),
+            'changed_tables': [chunk['id'] for chunk in changed],
+            'deleted_tables': stale_ids,
+            'dry_run': dry_run
+        }
+
+        if not dry_run:
+            if changed:
+                await self.run_sync(
+                    self.collection.upsert,
+                    ids=[chunk['id'] for chunk in changed],
+                    documents=[chunk['document'] for chunk in changed],
+                    metadatas=[chunk['metadata'] for chunk in changed]
+                )
+            if stale_ids:
+                await self.run_sync(self.collection.delete, ids=stale_ids)
+            if changed or stale_ids:
+                # 集合元数据记录整体schema哈希，使服务端schema指纹随内容变化
+                schema_hash = hashlib.sha256(
+                    "".join(sorted(chunk['metadata']['content_hash'] for chunk in chunks)).encode('utf-8')
+                ).hexdigest()[:16]
+                await self.run_sync(self.collection.modify, metadata={'schema_hash': schema_hash})
+
+        if self.on_chunk:
+            for outcome in ('changed', 'unchanged', 'deleted'):
+                self.on_chunk(outcome, stats[outcome])
+
+        logger.info("Schema入库完成",
+                   changed=stats['changed'], unchanged=stats['unchanged'],
+                   deleted=stats['deleted'], dry_run=dry_run)
+        return stats
+
+
+async def ingest_schema(db_engine,
+                        collection,
+                        schemas: List[str],
+                        run_sync: Optional[Callable[..., Awaitable[Any]]] = None,
+                        on_chunk: Optional[Callable[[str, int], None]] = None,
+                        prune: bool = True,
+                        dry_run: bool = False) -> Dict[str, Any]:
+    """采集 → 分块哈希 → 增量入库"""
+    tables = await introspect_schema(db_engine, schemas)
+    chunks = build_chunks(tables)
+    stats = await SchemaIngestor(collection, run_sync=run_sync, on_chunk=on_chunk).sync(
+        chunks, prune=prune, dry_run=dry_run
+    )
+    stats['tables'] = len(tables)
+    return stats
+
+
+def main():
+    """命令行入口：python schema_ingest.py [--schemas public,sales] [--dry-run] [--no-prune]"""
+    import argparse
+
+    import chromadb
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    parser = argparse.ArgumentParser(description="采集PostgreSQL schema并增量更新db_schema向量集合")
+    parser.add_argument('--schemas', default=os.getenv('SCHEMA_INGEST_SCHEMAS', 'public'),
+                        help="逗号分隔的schema列表")
+    parser.add_argument('--dry-run', action='store_true', help="只报告变化，不写入Chroma")
+    parser.add_argument('--no-prune', action='store_true', help="保留已不存在的表对应的块")
+    args = parser.parse_args()
+
+    db_url = f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+
+    async def _run():
+        db_engine = create_async_engine(db_url)
+        try:
+            vector_db = chromadb.HttpClient(host=os.getenv('VECTOR_DB_URL', 'http://chromadb:8000'))
+            collection = vector_db.get_or_create_collection("db_schema")
+            return await ingest_schema(
+                db_engine,
+                collection,
+                [schema.strip() for schema in args.schemas.split(',') if schema.strip()],
+                prune=not args.no_prune,
+                dry_run=args.dry_run
+            )
+        finally:
+            await db_engine.dispose()
+
+    stats = asyncio.run(_run())
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+近似问题语义缓存
+女娲造物：问虽异辞，意则同归
+"""
+
+import json
+import time
+import hashlib
+from typing import Dict, Any, Optional, Callable, List
+
+import structlog
+
+from query_cache import normalize_query
+
+logger = structlog.get_logger()
+
+
+def context_hash(context: Optional[Dict[str, Any]]) -> str:
+    """上下文指纹：同一问题在不同上下文下可能对应不同SQL，只在相同上下文的条目间复用"""
+    payload = json.dumps(context or {}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class SemanticQueryCache:
+    """基于向量相似度的近似问题缓存（问题embedding → 已验证SQL）"""
+
+    def __init__(self,
+                 vector_db,
+                 collection_name: str = "text2sql_question_cache",
+                 similarity_threshold: float = 0.92,
+                 max_entries: int = 5000,
+                 max_age_seconds: float = 7 * 24 * 3600,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.vector_db = vector_db
+        self.collection_name = collection_name
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.on_evict = on_evict
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            # 余弦空间：distance = 1 - cosine_similarity
+            self._collection = self.vector_db.get_or_create_collection(
+                self.collection_name,
+                metadata={"hnsw:space": "cosine"}
+            )
+        return self._collection
+
+    @staticmethod
+    def _entry_id(query: str, whitelist_version: str, schema_fingerprint: str, context_key: str) -> str:
+        raw = f"{normalize_query(query)}|{whitelist_version}|{schema_fingerprint}|{context_key}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self,
+               query: str,
+               whitelist_version: str,
+               schema_fingerprint: str,
+               context: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """查找相同上下文下最相近的历史问题，返回最佳候选（含相似度），无候选时返回None"""
+        results = self.collection.query(
+            query_texts=[normalize_query(query)],
+            n_results=1,
+            where={"$and": [
+                {"whitelist_version": whitelist_version},
+                {"schema_fingerprint": schema_fingerprint},
+                {"context_hash": context_hash(context)}
+            ]}
+        )
+
+        if not results.get('ids') or not results['ids'][0]:
+            return None
+
+        entry_id = results['ids'][0][0]
+        metadata = results['metadatas'][0][0]
+        similarity = 1.0 - float(results['distances'][0][0])
+
+        now = time.time()
+        if now - metadata.get('created_at', now) > self.max_age_seconds:
+            self._delete([entry_id], reason='semantic_age')
+            return None
+
+        return {
+            'id': entry_id,
+            'sql': metadata['sql'],
+            'matched_query': results['documents'][0][0],
+            'similarity': similarity,
+            'hits': int(metadata.get('hits', 0)),
+            'hit': similarity >= self.similarity_threshold
+        }
+
+    def touch(self, entry_id: str, hits: int = 0):
+        """命中后更新使用时间与次数，供淘汰策略参考"""
+        self.collection.update(
+            ids=[entry_id],
+            metadatas=[{'last_used_at': time.time(), 'hits': hits + 1}]
+        )
+
+    def store(self,
+              query: str,
+              sql: str,
+              whitelist_version: str,
+              schema_fingerprint: str,
+              context: Optional[Dict[str, Any]] = None):
+        """记录一条已执行成功的(问题, 上下文, SQL)"""
+        now = time.time()
+        context_key = context_hash(context)
+        self.collection.upsert(
+            ids=[self._entry_id(query, whitelist_version, schema_fingerprint, context_key)],
+            documents=[normalize_query(query)],
+            metadatas=[{
+                'sql': sql,
+                'whitelist_version': whitelist_version,
+                'schema_fingerprint': schema_fingerprint,
+                'context_hash': context_key,
+                'created_at': now,
+                'last_used_at': now,
+                'hits': 0
+            }]
+        )
+        self._evict_if_needed()
+
+    def _evict_if_needed(self):
+        """超出容量时按 过期优先 → 最近最少使用 淘汰到容量的90%"""
+        count = self.collection.count()
+        if count <= self.max_entries:
+            return
+
+        entries = self.collection.get(include=['metadatas'])
+        now = time.time()
+
+        def eviction_order(item):
+            _, metadata = item
+            expired = now - metadata.get('created_at', 0) > self.max_age_seconds
+            return (not expired, metadata.get('last_used_at', 0), metadata.get('hits', 0))
+
+        ranked = sorted(zip(entries['ids'], entries['metadatas']), key=eviction_order)
+        target = int(self.max_entries * 0.9)
+        victims = [entry_id for entry_id, _ in ranked[:count - target]]
+        self._delete(victims, reason='semantic_capacity')
+
+    def _delete(self, ids: List[str], reason: str):
+        if not ids:
+            return
+        self.collection.delete(ids=ids)
+        if self.on_evict:
+            for _ in ids:
+                self.on_evict(reason)
+        logger.info("语义缓存淘汰", count=len(ids), reason=reason)
@@ -0,0 +1,424 @@
+"""
+SQLGuardian 验证器：单次分词的规则扫描 + AST表/列分析
+女娲造物：一眼识险，万句不迟
+"""
+
+import re
+import hashlib
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.dialects.postgres import Postgres
+    from sqlglot.optimizer.scope import traverse_scope
+    from sqlglot.tokens import TokenType
+except ImportError:
+    sqlglot = None
+
+# 单次分词，关键字规则改为集合运算
+_WORD_RE = re.compile(r'\w+')
+_FROM_TABLE_RE = re.compile(r'\bfrom\s+(\w+)')
+
+CRITICAL_KEYWORDS = frozenset({
+    'drop', 'delete', 'update', 'insert', 'alter', 'truncate', 'create', 'grant', 'revoke'
+})
+SYSTEM_KEYWORDS = frozenset({'exec', 'execute', 'xp_', 'sp_'})
+STRING_OPERATORS = ('||', '&&', 'concat')
+
+# SQL解析结果缓存（按SQL哈希，有界LRU）
+ANALYSIS_CACHE_SIZE = 2048
+_analysis_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def analyze_sql(sql: str) -> Dict[str, Any]:
+    """解析SQL，提取引用的全部表、列、通配符与最外层LIMIT；结果按SQL哈希缓存，调用方不得修改"""
+    key = hashlib.sha1(sql.encode('utf-8')).hexdigest()
+    cached = _analysis_cache.get(key)
+    if cached is not None:
+        _analysis_cache.move_to_end(key)
+        return cached
+
+    analysis = _parse_and_extract(sql)
+
+    _analysis_cache[key] = analysis
+    if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+        _analysis_cache.popitem(last=False)
+    return analysis
+
+
+def _parse_and_extract(sql: str) -> Dict[str, Any]:
+    analysis = {
+        'parsed': False,
+        'statement_count': 0,
+        'tables': frozenset(),
+        'columns': {},
+        'unresolved_columns': (),
+        'star_tables': frozenset(),
+        'limit': None,
+        'expression': None
+    }
+
+    if sqlglot is None:
+        return analysis
+
+    try:
+        statements = [stmt for stmt in sqlglot.parse(sql, read='postgres') if stmt is not None]
+    except Exception:
+        return analysis
+
+    analysis['statement_count'] = len(statements)
+    if len(statements) != 1:
+        return analysis
+
+    expression = statements[0]
+    tables = set()
+    columns: Dict[str, set] = {}
+    unresolved: List[Tuple[str, frozenset]] = []
+    star_tables = set()
+
+    try:
+        scopes = traverse_scope(expression)
+    except Exception:
+        return analysis
+
+    for scope in scopes:
+        # 别名 -> 真实表名（CTE与派生表在各自的scope中检查）
+        table_sources = {
+            alias: source.name.lower()
+            for alias, source in scope.sources.items()
+            if isinstance(source, exp.Table)
+        }
+        tables.update(table_sources.values())
+        selected_tables = frozenset(
+            table_sources[alias] for alias in scope.selected_sources if alias in table_sources
+        )
+        derived_selected = len(selected_tables) < len(scope.selected_sources)
+        output_aliases = set()
+
+        if isinstance(scope.expression, exp.Select):
+            for projection in scope.expression.expressions:
+                if isinstance(projection, exp.Alias):
+                    output_aliases.add(projection.alias.lower())
+                if isinstance(projection, exp.Star):
+                    star_tables.update(selected_tables)
+                elif isinstance(projection, exp.Column) and isinstance(projection.this, exp.Star):
+                    qualifier = projection.table.lower()
+                    if qualifier in table_sources:
+                        star_tables.add(table_sources[qualifier])
+
+        for column in scope.columns:
+            if isinstance(column.this, exp.Star):
+                continue
+            name = column.name.lower()
+            qualifier = column.table.lower()
+            if qualifier:
+                if qualifier in table_sources:
+                    columns.setdefault(table_sources[qualifier], set()).add(name)
+            elif name in output_aliases or column.find_ancestor(exp.Select) is not scope.expression:
+                # 输出别名引用，或子查询中可能相关的列（由子查询自身scope检查）
+                continue
+            elif len(selected_tables) == 1 and not derived_selected:
+                columns.setdefault(next(iter(selected_tables)), set()).add(name)
+            elif selected_tables:
+                unresolved.append((name, selected_tables))
+
+    # 仅识别字面量整数LIMIT/FETCH FIRST，LIMIT ALL/参数等视为无上限
+    limit = expression.args.get('limit')
+    limit_value = None
+    if isinstance(limit, exp.Fetch):
+        count = limit.args.get('count')
+        limit_value = 1 if count is None else None
+    else:
+        count = limit.expression if limit is not None else None
+    if isinstance(count, exp.Literal) and count.is_int:
+        limit_value = int(count.this)
+
+    analysis.update({
+        'parsed': True,
+        'tables': frozenset(tables),
+        'columns': {table: frozenset(names) for table, names in columns.items()},
+        'unresolved_columns': tuple(unresolved),
+        'star_tables': frozenset(star_tables),
+        'limit': limit_value,
+        'expression': expression
+    })
+    return analysis
+
+
+def is_query(sql: str) -> bool:
+    """按解析出的语句类型判断是否为只读查询（SELECT、UNION/INTERSECT/EXCEPT及WITH…SELECT）"""
+    analysis = analyze_sql(sql)
+    return analysis['parsed'] and isinstance(analysis['expression'], (exp.Select, exp.Union))
+
+
+def probe_sql(sql: str, row_cap: Optional[int]) -> str:
+    """执行用SQL：最外层LIMIT恰为行数上限时放宽一行，执行端据此判断是否截断；返回与缓存的仍是原SQL"""
+    analysis = analyze_sql(sql)
+    if row_cap is None or analysis['limit'] != row_cap:
+        return sql
+    return analysis['expression'].limit(row_cap + 1).sql(dialect='postgres')
+
+
+def analysis_cache_size() -> int:
+    return len(_analysis_cache)
+
+
+def scan_partial_sql(text: str) -> Optional[str]:
+    """对流式生成中的部分SQL做危险关键字扫描，命中时返回风险类型；末尾可能未写完的词不参与判断"""
+    lowered = text.lower()
+    words = _WORD_RE.findall(lowered)
+    if words and _WORD_RE.match(lowered[-1:]):
+        words = words[:-1]
+    word_set = frozenset(words)
+    if not CRITICAL_KEYWORDS.isdisjoint(word_set):
+        return 'CRITICAL_OPERATION'
+    if not SYSTEM_KEYWORDS.isdisjoint(word_set):
+        return 'SYSTEM_COMMAND'
+    return None
+
+
+def _statement_text(sql: str) -> str:
+    """去掉末尾分号与注释后的语句原文（按分词位置截取）"""
+    end = 0
+    for token in Postgres().tokenize(sql):
+        if token.token_type != TokenType.SEMICOLON:
+            end = token.end + 1
+    return sql[:end]
+
+
+def statement_end(text: str) -> Optional[int]:
+    """返回首条语句结束处（引号外的分号之后）的位置，语句尚未结束时返回None"""
+    quote = None
+    for index, char in enumerate(text):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == ';':
+            return index + 1
+    return None
+
+
+class SQLGuardian:
+    """启动时构建、白名单热加载时重建的SQL验证器"""
+
+    def __init__(self, security_config: Dict[str, Any]):
+        security_config = security_config or {}
+        self.allowed_tables = frozenset(
+            table.lower() for table in security_config.get('allowed_tables', [])
+        )
+
+        # 表级列权限：allowed为None表示不限制列；构建后只读，热加载时整体替换
+        table_permissions = {}
+        for table, permissions in (security_config.get('table_permissions') or {}).items():
+            allowed = [column.lower() for column in permissions.get('allowed_columns', ['*'])]
+            table_permissions[table.lower()] = MappingProxyType({
+                'allowed': None if '*' in allowed else tuple(allowed),
+                'blocked': frozenset(column.lower() for column in permissions.get('blocked_columns', [])),
+                'max_rows': permissions.get('max_rows')
+            })
+        self.table_permissions = MappingProxyType(table_permissions)
+
+        self.max_result_rows = (security_config.get('query_limits') or {}).get('max_result_rows')
+
+    def validate(self, sql: str) -> Dict[str, Any]:
+        """单次分词验证SQL，返回 status/risks/suggestions/confidence/blocked_reason"""
+        validation_result = {
+            'status': 'PASS',
+            'risks': [],
+            'suggestions': [],
+            'confidence': 0.95,
+            'blocked_reason': None
+        }
+
+        lowered = sql.lower()
+        words = _WORD_RE.findall(lowered)
+        word_set = frozenset(words)
+
+        # 1. 关键字/片段黑名单 - 严格阻断危险操作（按规则优先级）
+        risk_type = None
+        if not CRITICAL_KEYWORDS.isdisjoint(word_set):
+            risk_type = 'CRITICAL_OPERATION'
+        elif not SYSTEM_KEYWORDS.isdisjoint(word_set):
+            risk_type = 'SYSTEM_COMMAND'
+        elif 'union' in lowered and 'select' in lowered and self._union_select_same_line(lowered):
+            risk_type = 'POSSIBLE_INJECTION'
+        elif '--' in lowered:
+            risk_type = 'SQL_COMMENT_INJECTION'
+        elif any(operator in lowered for operator in STRING_OPERATORS):
+            risk_type = 'STRING_MANIPULATION'
+
+        if risk_type is not None:
+            validation_result['status'] = 'BLOCK'
+            validation_result['blocked_reason'] = risk_type
+            validation_result['risks'].append(f"Blocked: {risk_type} detected in SQL")
+            validation_result['confidence'] = 0.0
+            return validation_result
+
+        # 2. 仅允许SELECT操作（含解析确认为查询的WITH语句）
+        stripped = lowered.lstrip()
+        if not stripped.startswith('select') and not (stripped.startswith('with') and is_query(sql)):
+            validation_result['status'] = 'BLOCK'
+            validation_result['blocked_reason'] = 'NON_SELECT_OPERATION'
+            validation_result['risks'].append("Only SELECT queries are allowed")
+            return validation_result
+
+        # 3. SELECT语句安全检查
+        select_risks: List[str] = []
+
+        if lowered.count('select') - 1 > 2:
+            select_risks.append("Deep nested subqueries detected")
+            validation_result['confidence'] -= 0.1
+
+        if words.count('join') > 5:
+            select_risks.append("Too many JOINs may affect performance")
+            validation_result['confidence'] -= 0.05
+
+        if 'select *' in lowered:
+            select_risks.append("SELECT * usage - consider specifying columns")
+            validation_result['confidence'] -= 0.05
+
+        if select_risks:
+            validation_result['suggestions'] = select_risks
+
+        analysis = analyze_sql(sql)
+        if not analysis['parsed']:
+            if analysis['statement_count'] > 1:
+                validation_result['status'] = 'BLOCK'
+                validation_result['blocked_reason'] = 'MULTIPLE_STATEMENTS'
+                validation_result['risks'].append("Only a single statement is allowed")
+                validation_result['confidence'] = 0.0
+                return validation_result
+
+            # 无法解析时退回首个FROM的白名单检查
+            from_match = _FROM_TABLE_RE.search(lowered)
+            if from_match and from_match.group(1) not in self.allowed_tables:
+                validation_result['status'] = 'WARN'
+                validation_result['risks'].append(f"Table '{from_match.group(1)}' not in whitelist")
+                validation_result['confidence'] -= 0.2
+            return validation_result
+
+        # 4. 白名单表检查 - 覆盖JOIN、CTE与子查询中的全部表
+        outside = sorted(analysis['tables'] - self.allowed_tables)
+        if outside:
+            validation_result['status'] = 'WARN'
+            for table_name in outside:
+                validation_result['risks'].append(f"Table '{table_name}' not in whitelist")
+            validation_result['confidence'] -= 0.2
+
+        # 5. 列级权限检查
+        column_violation = self._check_columns(analysis)
+        if column_violation is not None:
+            reason, message = column_violation
+            validation_result['status'] = 'BLOCK'
+            validation_result['blocked_reason'] = reason
+            validation_result['risks'].append(message)
+            validation_result['confidence'] = 0.0
+            return validation_result
+
+        # 6. 行数上限 - 按max_rows改写LIMIT；无需改写时不设置fixed_sql，保留原SQL文本
+        star_expansions = {
+            table: self.table_permissions[table]['allowed']
+            for table in analysis['star_tables']
+            if self.table_permissions.get(table, {}).get('allowed') is not None
+        }
+        row_cap = self.row_cap(analysis['tables'])
+        apply_limit = row_cap is not None and (analysis['limit'] is None or analysis['limit'] > row_cap)
+
+        if star_expansions or apply_limit:
+            validation_result['fixed_sql'] = self._rewrite(
+                sql, analysis, star_expansions, row_cap if apply_limit else None
+            )
+            if star_expansions:
+                validation_result['suggestions'].append(
+                    f"SELECT * expanded to permitted columns for: {', '.join(sorted(star_expansions))}"
+                )
+            if apply_limit:
+                validation_result['suggestions'].append(f"LIMIT {row_cap} applied (max_rows)")
+
+        return validation_result
+
+    def row_cap(self, tables) -> Optional[int]:
+        """查询涉及表的最小max_rows与全局max_result_rows中的较小者"""
+        caps = [
+            self.table_permissions[table]['max_rows']
+            for table in tables
+            if self.table_permissions.get(table, {}).get('max_rows')
+        ]
+        if self.max_result_rows:
+            caps.append(self.max_result_rows)
+        return min(caps) if caps else None
+
+    def _check_columns(self, analysis: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        """检查列级黑白名单，返回(阻断原因, 风险描述)"""
+        for table, columns in analysis['columns'].items():
+            permissions = self.table_permissions.get(table)
+            if permissions is None:
+                continue
+            blocked = sorted(columns & permissions['blocked'])
+            if blocked:
+                return 'BLOCKED_COLUMN', f"Column(s) {', '.join(blocked)} of '{table}' are blocked"
+            if permissions['allowed'] is not None:
+                disallowed = sorted(columns - set(permissions['allowed']))
+                if disallowed:
+                    return 'COLUMN_NOT_ALLOWED', f"Column(s) {', '.join(disallowed)} of '{table}' are not allowed"
+
+        # 无法确定归属的列：任一候选表禁止即阻断；所有候选表都限制且均不允许时阻断
+        for column, candidates in analysis['unresolved_columns']:
+            candidate_permissions = [self.table_permissions.get(table) for table in candidates]
+            if any(p is not None and column in p['blocked'] for p in candidate_permissions):
+                return 'BLOCKED_COLUMN', f"Column '{column}' is blocked"
+            if all(p is not None and p['allowed'] is not None and column not in p['allowed']
+                   for p in candidate_permissions):
+                return 'COLUMN_NOT_ALLOWED', f"Column '{column}' is not allowed"
+
+        return None
+
+    @staticmethod
+    def _rewrite(sql: str, analysis: Dict[str, Any], star_expansions: Dict[str, Tuple[str, ...]],
+                 limit: Optional[int]) -> str:
+        """展开受限表的SELECT *并追加LIMIT；仅追加LIMIT时在原文末尾拼接，不经AST重新渲染"""
+        if not star_expansions and analysis['expression'].args.get('limit') is None:
+            return f"{_statement_text(sql)} LIMIT {limit}"
+
+        rewritten = analysis['expression'].copy()
+
+        if star_expansions:
+            for scope in traverse_scope(rewritten):
+                if not isinstance(scope.expression, exp.Select):
+                    continue
+                table_sources = {
+                    alias: source.name.lower()
+                    for alias, source in scope.sources.items()
+                    if isinstance(source, exp.Table)
+                }
+                projections = []
+                for projection in scope.expression.expressions:
+                    if isinstance(projection, exp.Star):
+                        for alias in scope.selected_sources:
+                            table = table_sources.get(alias)
+                            if table in star_expansions:
+                                projections.extend(exp.column(column, table=alias) for column in star_expansions[table])
+                            else:
+                                projections.append(exp.Column(this=exp.Star(), table=exp.to_identifier(alias)))
+                    elif isinstance(projection, exp.Column) and isinstance(projection.this, exp.Star) \
+                            and table_sources.get(projection.table.lower()) in star_expansions:
+                        table = table_sources[projection.table.lower()]
+                        projections.extend(exp.column(column, table=projection.table) for column in star_expansions[table])
+                    else:
+                        projections.append(projection)
+                scope.expression.set('expressions', projections)
+
+        if limit is not None:
+            rewritten = rewritten.limit(limit, copy=False)
+
+        return rewritten.sql(dialect='postgres')
+
+    @staticmethod
+    def _union_select_same_line(lowered: str) -> bool:
+        """UNION与SELECT出现在同一行（原正则 union.*select|select.*union 的语义）"""
+        return any('union' in line and 'select' in line for line in lowered.split('\n'))
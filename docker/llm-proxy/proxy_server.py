@@ -72,6 +72,17 @@ class RateLimiter:
             
             return True
     
+    def retry_after_seconds(self) -> int:
+        """最早一条记录滑出一分钟窗口所需的秒数，作为429响应的Retry-After"""
+        timestamps = []
+        if self.request_times:
+            timestamps.append(self.request_times[0])
+        if self.token_usage:
+            timestamps.append(self.token_usage[0][0])
+        if not timestamps:
+            return 1
+        return max(1, int(min(timestamps) + 60 - time.time()) + 1)
+    
     async def update_actual_tokens(self, actual_tokens: int):
         """更新实际使用的token数"""
         async with self._lock:
@@ -133,7 +144,8 @@ async def proxy_request(request: Request, path: str):
         request_counter.labels(status='rate_limited').inc()
         raise HTTPException(
             status_code=429,
-            detail="Rate limit exceeded. Please wait before retrying."
+            detail="Rate limit exceeded. Please wait before retrying.",
+            headers={"Retry-After": str(rate_limiter.retry_after_seconds())}
         )
     
     # 构建目标URL
@@ -54,18 +54,25 @@ class TokenMetricsExporter:
         )
         
         # Token价格映射（每1K tokens的USD价格）
+        # 提示缓存：写入按输入价1.25倍计费，读取按输入价0.1倍计费
         self.token_prices = {
             'claude-3-opus-20240229': {
                 'input': 0.015,   # $15/1M input tokens
-                'output': 0.075   # $75/1M output tokens
+                'output': 0.075,  # $75/1M output tokens
+                'cache_write': 0.01875,  # $18.75/1M cache write tokens
+                'cache_read': 0.0015     # $1.50/1M cache read tokens
             },
             'claude-3-sonnet-20240229': {
                 'input': 0.003,   # $3/1M input tokens
-                'output': 0.015   # $15/1M output tokens
+                'output': 0.015,  # $15/1M output tokens
+                'cache_write': 0.00375,  # $3.75/1M cache write tokens
+                'cache_read': 0.0003     # $0.30/1M cache read tokens
             },
             'claude-3-haiku-20240307': {
                 'input': 0.00025, # $0.25/1M input tokens
-                'output': 0.00125 # $1.25/1M output tokens
+                'output': 0.00125, # $1.25/1M output tokens
+                'cache_write': 0.0003,   # $0.30/1M cache write tokens
+                'cache_read': 0.00003    # $0.03/1M cache read tokens
             }
         }
         
@@ -75,8 +82,10 @@ class TokenMetricsExporter:
                           model: str,
                           input_tokens: int,
                           output_tokens: int, 
-                          endpoint: str = "text2sql"):
-        """记录Token使用量"""
+                          endpoint: str = "text2sql",
+                          cache_creation_input_tokens: int = 0,
+                          cache_read_input_tokens: int = 0):
+        """记录Token使用量（input_tokens为未命中缓存部分，缓存写入/读取单独计量计费）"""
         try:
             # 记录输入tokens
             self.tokens_used_total.labels(
@@ -92,11 +101,30 @@ class TokenMetricsExporter:
                 endpoint=endpoint
             ).inc(output_tokens)
             
+            # 记录提示缓存tokens
+            if cache_creation_input_tokens:
+                self.tokens_used_total.labels(
+                    model=model,
+                    type="cache_write",
+                    endpoint=endpoint
+                ).inc(cache_creation_input_tokens)
+            if cache_read_input_tokens:
+                self.tokens_used_total.labels(
+                    model=model,
+                    type="cache_read",
+                    endpoint=endpoint
+                ).inc(cache_read_input_tokens)
+            
             # 计算成本
             if model in self.token_prices:
-                input_cost = (input_tokens / 1000) * self.token_prices[model]['input']
-                output_cost = (output_tokens / 1000) * self.token_prices[model]['output']
-                total_cost = input_cost + output_cost
+                prices = self.token_prices[model]
+                input_cost = (input_tokens / 1000) * prices['input']
+                output_cost = (output_tokens / 1000) * prices['output']
+                cache_cost = (
+                    (cache_creation_input_tokens / 1000) * prices['cache_write']
+                    + (cache_read_input_tokens / 1000) * prices['cache_read']
+                )
+                total_cost = input_cost + output_cost + cache_cost
                 
                 self.token_cost_usd_total.labels(
                     model=model,
@@ -107,6 +135,8 @@ class TokenMetricsExporter:
                            model=model,
                            input_tokens=input_tokens,
                            output_tokens=output_tokens,
+                           cache_write_tokens=cache_creation_input_tokens,
+                           cache_read_tokens=cache_read_input_tokens,
                            cost_usd=round(total_cost, 6),
                            endpoint=endpoint)
             else:
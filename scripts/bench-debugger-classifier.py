@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Debugger v2 错误分类微基准
+女娲造物：以数为证，快慢自明
+"""
+
+import os
+import re
+import sys
+import timeit
+
+# 添加路径以导入debugger
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+import debugger
+from debugger import DebuggerV2, ErrorType
+
+# asyncpg经SQLAlchemy包装后的真实错误文本（str(exception)原样）
+SQLALCHEMY_TAIL = "\n[SQL: {sql}]\n(Background on this error at: https://sqlalche.me/e/20/f405)"
+
+CORPUS = [
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.UndefinedTableError'>: "
+    "relation \"orders_2024\" does not exist" + SQLALCHEMY_TAIL.format(sql="SELECT id FROM orders_2024 LIMIT 10"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.UndefinedTableError'>: "
+    "relation \"user_profiles\" does not exist" + SQLALCHEMY_TAIL.format(sql="SELECT * FROM user_profiles"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.UndefinedColumnError'>: "
+    "column \"emial\" does not exist" + SQLALCHEMY_TAIL.format(sql="SELECT emial FROM users"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.UndefinedColumnError'>: "
+    "column u.created does not exist" + SQLALCHEMY_TAIL.format(sql="SELECT u.created FROM users u"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.PostgresSyntaxError'>: "
+    "syntax error at or near \"FORM\"" + SQLALCHEMY_TAIL.format(sql="SELECT id FORM users"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.PostgresSyntaxError'>: "
+    "syntax error at end of input" + SQLALCHEMY_TAIL.format(sql="SELECT id FROM users WHERE"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.UndefinedTableError'>: "
+    "missing FROM-clause entry for table \"o\"" + SQLALCHEMY_TAIL.format(sql="SELECT o.id FROM users u"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.InsufficientPrivilegeError'>: "
+    "permission denied for table payments" + SQLALCHEMY_TAIL.format(sql="SELECT amount FROM payments"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.InsufficientPrivilegeError'>: "
+    "permission denied for schema audit" + SQLALCHEMY_TAIL.format(sql="SELECT * FROM audit.events"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.OperationalError) <class 'asyncpg.exceptions.QueryCanceledError'>: "
+    "canceling statement due to statement timeout" + SQLALCHEMY_TAIL.format(sql="SELECT count(*) FROM events"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.InterfaceError) <class 'asyncpg.exceptions._base.InterfaceError'>: "
+    "connection is closed" + SQLALCHEMY_TAIL.format(sql="SELECT 1"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.DataError) <class 'asyncpg.exceptions.InvalidTextRepresentationError'>: "
+    "invalid input syntax for type integer: \"abc\"" + SQLALCHEMY_TAIL.format(sql="SELECT * FROM users WHERE id = 'abc'"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.UndefinedFunctionError'>: "
+    "operator does not exist: integer = text" + SQLALCHEMY_TAIL.format(sql="SELECT * FROM users WHERE id = name"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.AmbiguousColumnError'>: "
+    "column reference \"id\" is ambiguous" + SQLALCHEMY_TAIL.format(sql="SELECT id FROM users JOIN orders USING (x)"),
+    "(sqlalchemy.dialects.postgresql.asyncpg.DataError) <class 'asyncpg.exceptions.DivisionByZeroError'>: "
+    "division by zero" + SQLALCHEMY_TAIL.format(sql="SELECT 1/0"),
+    "timeout expired",
+]
+
+
+def legacy_detect(error_message, error_patterns):
+    """原 detect_error_type 的逐类型、逐模式re.search实现（每次调用都扫描全部模式）"""
+    error_lower = error_message.lower()
+    for error_type, patterns in error_patterns.items():
+        for pattern in patterns:
+            if re.search(pattern, error_lower):
+                return error_type
+    return ErrorType.UNKNOWN_ERROR
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    per_call_us = seconds / (number * len(CORPUS)) * 1e6
+    print(f"  {label:<12} {per_call_us:8.2f} µs/条")
+    return per_call_us
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    # 基准中关闭分类日志，只比较分类本身的开销
+    debugger.logger.info = lambda msg, **kwargs: None
+
+    warm = DebuggerV2()
+    patterns = warm.error_patterns
+
+    print(f"🧪 Debugger错误分类微基准 ({len(CORPUS)}条错误 × {number}轮)")
+    for message in CORPUS:
+        legacy, current = legacy_detect(message, patterns), warm.detect_error_type(message)
+        if legacy != current:
+            print(f"  ⚠️ 分类变化: {legacy.value} -> {current.value}: {message.splitlines()[0][-60:]}")
+
+    def run_legacy():
+        for message in CORPUS:
+            legacy_detect(message, patterns)
+
+    heads = [debugger.error_head(message) for message in CORPUS]
+
+    def run_classify():
+        # 仅分类：关键字预筛 + 预编译正则
+        for head in heads:
+            warm._classify(head)
+
+    def run_cold():
+        # 缓存全部未命中：签名归一化 + 分类
+        for message in CORPUS:
+            warm._classify(debugger.error_signature(message))
+
+    def run_memoized():
+        for message in CORPUS:
+            warm.detect_error_type(message)
+
+    legacy_us = bench("legacy", run_legacy, number)
+    classify_us = bench("classify", run_classify, number)
+    cold_us = bench("cold", run_cold, number)
+    memoized_us = bench("memoized", run_memoized, number)
+
+    print(f"📊 加速比: 预筛+编译正则 {legacy_us / classify_us:.1f}x，"
+          f"签名缓存命中 {legacy_us / memoized_us:.1f}x，未命中 {legacy_us / cold_us:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Debugger Schema目录模糊检索微基准
+女娲造物：以数为证，快慢自明
+"""
+
+import os
+import random
+import sys
+import time
+import timeit
+
+# 添加路径以导入schema_catalog
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from schema_catalog import SchemaCatalog, edit_distance, max_edit_distance
+
+WORDS = [
+    'id', 'name', 'email', 'created', 'updated', 'user', 'order', 'product', 'price', 'amount',
+    'status', 'type', 'code', 'date', 'total', 'count', 'address', 'city', 'country', 'phone',
+    'description', 'title', 'category', 'customer', 'account', 'balance', 'currency', 'region',
+    'store', 'item', 'quantity', 'discount', 'tax', 'payment', 'method', 'shipping', 'tracking',
+    'note', 'score', 'level', 'rank', 'group', 'team', 'owner', 'parent', 'source', 'target',
+]
+
+
+def build_schema(table_count: int, columns_per_table: int):
+    rng = random.Random(42)
+    tables = {}
+    while len(tables) < table_count:
+        name = '_'.join(rng.sample(WORDS, rng.choice([1, 2, 2, 3])))
+        if name in tables:
+            continue
+        columns = {'id'}
+        while len(columns) < columns_per_table:
+            columns.add('_'.join(rng.sample(WORDS, rng.choice([1, 2, 2]))))
+        tables[name] = sorted(columns)
+    return tables
+
+
+def typo(name: str, rng: random.Random) -> str:
+    """交换相邻两个字符，模拟LLM生成的拼写错误"""
+    if len(name) < 3:
+        return name + 'x'
+    i = rng.randrange(len(name) - 1)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def linear_scan(term, names):
+    """逐个计算编辑距离的线性扫描（无索引）"""
+    limit = max_edit_distance(term)
+    return sorted((edit_distance(term, name, limit), name) for name in names)[:3]
+
+
+def bench(label, func, calls, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    per_call_us = seconds / (number * calls) * 1e6
+    print(f"  {label:<18} {per_call_us:8.1f} µs/次")
+    return per_call_us
+
+
+def main():
+    table_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    columns_per_table = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    tables = build_schema(table_count, columns_per_table)
+
+    started = time.perf_counter()
+    catalog = SchemaCatalog(tables)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"🧪 Schema目录检索微基准 ({len(catalog.tables)}张表, {catalog.column_count}列, 构建{build_ms:.0f}ms)")
+
+    rng = random.Random(7)
+    table_names = list(tables)
+    table_queries = [typo(rng.choice(table_names), rng) for _ in range(50)]
+    column_queries = []
+    for _ in range(50):
+        referenced = rng.sample(table_names, 2)
+        column = rng.choice(tables[referenced[0]])
+        column_queries.append((typo(column, rng), referenced, referenced[:1]))
+
+    hits = sum(1 for query, referenced, _ in column_queries
+               if catalog.similar_columns(query, referenced))
+    print(f"  列名检索命中 {hits}/{len(column_queries)}")
+
+    all_columns = sorted({column for columns in tables.values() for column in columns})
+
+    def run_tables():
+        for query in table_queries:
+            catalog.similar_tables(query)
+
+    def run_columns():
+        for query, referenced, owners in column_queries:
+            catalog.similar_columns(query, referenced, owners)
+
+    def run_columns_unrestricted():
+        for query, _, _ in column_queries:
+            catalog.similar_columns(query)
+
+    def run_linear():
+        for query, _, _ in column_queries[:10]:
+            linear_scan(query, all_columns)
+
+    bench("tables", run_tables, len(table_queries), 20)
+    bench("columns(引用表)", run_columns, len(column_queries), 20)
+    bench("columns(全部列)", run_columns_unrestricted, len(column_queries), 5)
+    bench("linear scan", run_linear, 10, 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+SQLGuardian 验证器微基准
+女娲造物：以数为证，快慢自明
+"""
+
+import os
+import re
+import sys
+import timeit
+
+# 添加路径以导入sql_guardian
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from sql_guardian import SQLGuardian
+
+ALLOWED_TABLES = ['users', 'products', 'orders', 'categories', 'inventory', 'order_items']
+
+CORPUS = [
+    "SELECT id, username, email FROM users WHERE status = 'active' ORDER BY created_at DESC LIMIT 50",
+    "SELECT u.username, o.id, p.name FROM users u JOIN orders o ON u.id = o.user_id "
+    "JOIN order_items oi ON oi.order_id = o.id JOIN products p ON p.id = oi.product_id LIMIT 100",
+    "SELECT category_id, COUNT(*) FROM products GROUP BY category_id HAVING COUNT(*) > 10",
+    "SELECT * FROM inventory WHERE quantity < (SELECT AVG(quantity) FROM inventory)",
+    "DROP TABLE users",
+    "SELECT id FROM users UNION SELECT password FROM admins",
+    "SELECT name FROM payments -- bypass",
+]
+
+
+def legacy_validate(sql, allowed_tables):
+    """原 _validate_sql 的逐条正则实现（每次调用重新编译/多次大写转换）"""
+    validation_result = {'status': 'PASS', 'risks': [], 'suggestions': [], 'confidence': 0.95, 'blocked_reason': None}
+    dangerous_patterns = [
+        (r'(?i)\b(drop|delete|update|insert|alter|truncate|create|grant|revoke)\b', 'CRITICAL_OPERATION'),
+        (r'(?i)\b(exec|execute|xp_|sp_)\b', 'SYSTEM_COMMAND'),
+        (r'(?i)(union.*select|select.*union)', 'POSSIBLE_INJECTION'),
+        (r'(?i)(;.*--|--.*)', 'SQL_COMMENT_INJECTION'),
+        (r'(?i)(\|\||&&|concat)', 'STRING_MANIPULATION')
+    ]
+    sql_upper = sql.upper().strip()
+    for pattern, risk_type in dangerous_patterns:
+        if re.search(pattern, sql, re.IGNORECASE):
+            validation_result['status'] = 'BLOCK'
+            validation_result['blocked_reason'] = risk_type
+            validation_result['confidence'] = 0.0
+            return validation_result
+    if not sql_upper.startswith('SELECT'):
+        validation_result['status'] = 'BLOCK'
+        return validation_result
+    if sql_upper.count('SELECT') - 1 > 2:
+        validation_result['confidence'] -= 0.1
+    if len(re.findall(r'\bjoin\b', sql_upper, re.IGNORECASE)) > 5:
+        validation_result['confidence'] -= 0.05
+    if 'SELECT *' in sql_upper:
+        validation_result['confidence'] -= 0.05
+    from_match = re.search(r'from\s+(\w+)', sql_upper, re.IGNORECASE)
+    if from_match and from_match.group(1).lower() not in allowed_tables:
+        validation_result['status'] = 'WARN'
+    return validation_result
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    per_call_us = seconds / (number * len(CORPUS)) * 1e6
+    print(f"  {label:<12} {per_call_us:8.2f} µs/条")
+    return per_call_us
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    guardian = SQLGuardian({'allowed_tables': ALLOWED_TABLES})
+
+    print(f"🧪 SQLGuardian微基准 ({len(CORPUS)}条SQL × {number}轮)")
+
+    def run_legacy():
+        for sql in CORPUS:
+            legacy_validate(sql, ALLOWED_TABLES)
+
+    def run_guardian():
+        for sql in CORPUS:
+            guardian.validate(sql)
+
+    legacy_us = bench("legacy", run_legacy, number)
+    guardian_us = bench("guardian", run_guardian, number)
+
+    print(f"📊 加速比: {legacy_us / guardian_us:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ Mock测试服务器 - 用于E2E测试
 """
 
 import json
+import hashlib
 import http.server
 import socketserver
 from urllib.parse import urlparse, parse_qs
@@ -13,6 +14,12 @@ from datetime import datetime
 class MockHTTPRequestHandler(http.server.BaseHTTPRequestHandler):
     """Mock HTTP请求处理器"""
     
+    # 提示缓存模拟：已写入缓存的system前缀哈希
+    prompt_cache = set()
+    # /v1/messages返回的SQL；流式响应按固定字符数切分为增量事件
+    response_sql = 'SELECT * FROM sample_table LIMIT 10'
+    stream_chunk_chars = 8
+    
     def do_GET(self):
         """处理GET请求"""
         if self.path == '/health':
@@ -53,6 +60,8 @@ token_cost_usd_total{model="claude-3-opus-20240229",endpoint="text2sql"} 0.03375
             self.handle_text2sql(request_data)
         elif self.path == '/api/sql/validate':
             self.handle_sql_validate(request_data)
+        elif self.path == '/v1/messages':
+            self.handle_messages(request_data)
         else:
             self.send_error(404, "Not Found")
     
@@ -108,6 +117,85 @@ token_cost_usd_total{model="claude-3-opus-20240229",endpoint="text2sql"} 0.03375
         
         self.send_json_response(response)
     
+    def handle_messages(self, request_data):
+        """模拟Anthropic Messages接口，含提示缓存计量：带cache_control的system前缀首次写入，之后读取"""
+        system = request_data.get('system', '')
+        blocks = system if isinstance(system, list) else [{'type': 'text', 'text': system}]
+        cached_text = ''.join(block.get('text', '') for block in blocks if block.get('cache_control'))
+        uncached_text = ''.join(block.get('text', '') for block in blocks if not block.get('cache_control'))
+        for message in request_data.get('messages', []):
+            content = message.get('content', '')
+            if isinstance(content, list):
+                content = ''.join(part.get('text', '') for part in content)
+            uncached_text += content
+        
+        cache_creation, cache_read = 0, 0
+        if cached_text:
+            prefix_hash = hashlib.sha256(cached_text.encode('utf-8')).hexdigest()
+            if prefix_hash in self.prompt_cache:
+                cache_read = len(cached_text)
+            else:
+                self.prompt_cache.add(prefix_hash)
+                cache_creation = len(cached_text)
+        
+        sql = self.response_sql
+        message = {
+            'id': 'msg_mock',
+            'type': 'message',
+            'role': 'assistant',
+            'model': request_data.get('model', 'claude-3-opus-20240229'),
+            'content': [{'type': 'text', 'text': sql}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {
+                'input_tokens': len(uncached_text),  # 模拟未命中缓存的输入token数
+                'output_tokens': len(sql) // 2,
+                'cache_creation_input_tokens': cache_creation,
+                'cache_read_input_tokens': cache_read
+            }
+        }
+        
+        if request_data.get('stream'):
+            self.send_message_stream(message)
+        else:
+            self.send_json_response(message)
+    
+    def send_message_stream(self, message):
+        """以SSE事件流返回消息：message_start携带输入用量，文本分块为content_block_delta，
+        message_delta携带最终输出token数，最后message_stop"""
+        text = message['content'][0]['text']
+        usage = dict(message['usage'], output_tokens=1)
+        events = [
+            ('message_start', {'type': 'message_start',
+                               'message': dict(message, content=[], stop_reason=None, usage=usage)}),
+            ('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                     'content_block': {'type': 'text', 'text': ''}})
+        ]
+        for offset in range(0, len(text), self.stream_chunk_chars):
+            events.append(('content_block_delta', {
+                'type': 'content_block_delta', 'index': 0,
+                'delta': {'type': 'text_delta', 'text': text[offset:offset + self.stream_chunk_chars]}
+            }))
+        events.extend([
+            ('content_block_stop', {'type': 'content_block_stop', 'index': 0}),
+            ('message_delta', {'type': 'message_delta',
+                               'delta': {'stop_reason': message['stop_reason'], 'stop_sequence': None},
+                               'usage': {'output_tokens': message['usage']['output_tokens']}}),
+            ('message_stop', {'type': 'message_stop'})
+        ])
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            for event, data in events:
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前停止接收（命中危险关键字或语句已结束）
+            pass
+    
     def handle_sql_validate(self, request_data):
         """处理SQL验证请求"""
         sql = request_data.get('sql', '').upper()
@@ -179,6 +267,7 @@ def start_mock_server(port=8000):
             print(f"📊 指标接口: http://localhost:{port}/metrics")
             print(f"🔧 Text2SQL: POST http://localhost:{port}/api/text2sql")
             print(f"🛡️ SQL验证: POST http://localhost:{port}/api/sql/validate")
+            print(f"🤖 Messages: POST http://localhost:{port}/v1/messages")
             print("=" * 50)
             
             httpd.serve_forever()
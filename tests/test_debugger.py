@@ -7,19 +7,33 @@ Debugger v2 单元测试
 import asyncio
 import sys
 import os
+import tempfile
+import time
 import unittest
+from unittest.mock import patch
+
+import pytest
 
 # 添加路径以导入debugger
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
 
-from debugger import DebuggerV2, ErrorType
+from debugger import DebuggerV2, ErrorType, error_signature
+from fix_memory import FixMemoryStore, sql_fingerprint
+from schema_catalog import SchemaCatalog
+
+CATALOG = {
+    'users': ['id', 'email_address', 'user_name', 'created_at'],
+    'user_profiles': ['id', 'user_id', 'bio'],
+    'orders': ['id', 'user_id', 'total', 'created_at'],
+    'sales.order_items': ['id', 'order_id', 'quantity'],
+}
 
 class TestDebuggerV2(unittest.TestCase):
     """Debugger v2 测试类"""
     
     def setUp(self):
         """每个测试方法前的设置"""
-        self.debugger = DebuggerV2(max_retries=3)
+        self.debugger = DebuggerV2(max_retries=3, schema_catalog=SchemaCatalog(CATALOG))
     
     def test_error_type_detection_schema(self):
         """测试Schema错误检测"""
@@ -51,11 +65,56 @@ class TestDebuggerV2(unittest.TestCase):
         error_type = self.debugger.detect_error_type(error_msg)
         assert error_type == ErrorType.UNKNOWN_ERROR
     
+    def test_error_type_priority(self):
+        """测试多种错误特征同时出现时按类型优先级分类"""
+        error_type = self.debugger.detect_error_type("syntax error and table does not exist")
+        assert error_type == ErrorType.SCHEMA_ERROR
+        assert self.debugger.detect_error_type("connection reset: query timeout") == ErrorType.TIMEOUT_ERROR
+    
+    def test_error_signature_normalization(self):
+        """测试错误签名去掉SQL附带信息、字面量与对象名"""
+        wrapped = (
+            "(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) "
+            "<class 'asyncpg.exceptions.UndefinedTableError'>: relation \"orders_2024\" does not exist\n"
+            "[SQL: SELECT id FROM orders_2024 WHERE timeout > 5]\n"
+            "(Background on this error at: https://sqlalche.me/e/20/f405)"
+        )
+        other = wrapped.replace("orders_2024", "payments")
+        assert error_signature(wrapped) == error_signature(other)
+        assert "timeout" not in error_signature(wrapped)
+        assert error_signature("permission denied for table payments") == "permission denied for table ?"
+        assert self.debugger.detect_error_type(wrapped) == ErrorType.SCHEMA_ERROR
+    
+    def test_error_classification_memoized(self):
+        """测试分类结果按签名缓存，原文快捷缓存单独有界"""
+        debugger = DebuggerV2(classification_cache_size=4, error_head_cache_size=2)
+        for table in ("users", "orders", "payments"):
+            assert debugger.detect_error_type(f"permission denied for table {table}") == ErrorType.PERMISSION_ERROR
+        # 三条原文共享一个签名
+        assert list(debugger._classification_cache) == ["permission denied for table ?"]
+        assert len(debugger._error_head_cache) == 2
+        
+        for index in range(10):
+            debugger.detect_error_type(f"column \"c{index}\" does not exist")
+        assert len(debugger._classification_cache) == 2
+        assert len(debugger._error_head_cache) == 2
+    
+    def test_unique_error_text_does_not_evict_signatures(self):
+        """测试大量唯一错误原文不会挤掉签名缓存条目"""
+        debugger = DebuggerV2(classification_cache_size=2, error_head_cache_size=2)
+        debugger.detect_error_type("permission denied for table users")
+        debugger.detect_error_type("canceling statement due to statement timeout")
+        
+        with patch.object(debugger, '_classify', side_effect=AssertionError("签名缓存未命中")):
+            for index in range(50):
+                assert debugger.detect_error_type(f"permission denied for table t{index}") == ErrorType.PERMISSION_ERROR
+        assert "canceling statement due to statement timeout" in debugger._classification_cache
+    
     def test_fix_schema_error_table(self):
         """测试修复Schema表错误"""
         async def _test():
-            sql = "SELECT * FROM nonexistent_table"
-            error = "table 'nonexistent_table' does not exist"
+            sql = "SELECT * FROM usres"
+            error = 'relation "usres" does not exist'
             
             result = await self.debugger._fix_schema_error(sql, error, {}, 1)
             
@@ -141,21 +200,224 @@ class TestDebuggerV2(unittest.TestCase):
         assert result['attempts'] == 2
         assert 'session_id' in result
     
-    @pytest.mark.asyncio
-    async def test_rag_search_tables(self):
+    def test_rag_search_tables(self):
         """测试RAG表搜索"""
-        similar_tables = await self.debugger._rag_search_tables('user_info')
+        similar_tables = asyncio.run(self.debugger._rag_search_tables('user_info'))
         
         assert len(similar_tables) > 0
         assert any('user' in table.lower() for table in similar_tables)
+        assert asyncio.run(self.debugger._rag_search_tables('ordr_items')) == ['sales.order_items']
+        assert asyncio.run(self.debugger._rag_search_tables('nonexistent_table')) == []
+        assert asyncio.run(DebuggerV2()._rag_search_tables('usres')) == []
     
-    @pytest.mark.asyncio 
-    async def test_rag_search_columns(self):
-        """测试RAG列搜索"""
-        similar_columns = await self.debugger._rag_search_columns('user_name', 'SELECT user_name FROM users')
-        
-        assert len(similar_columns) >= 0  # 可能返回空列表或有结果
+    def test_rag_search_columns(self):
+        """测试RAG列搜索只在SQL引用的表中检索"""
+        similar_columns = asyncio.run(
+            self.debugger._rag_search_columns('usr_id', 'SELECT o.usr_id FROM orders o JOIN user_profiles p ON p.id = o.id')
+        )
+        assert similar_columns[0] == 'user_id'
+        # users未被引用，其列不参与检索
+        assert 'user_name' not in asyncio.run(self.debugger._rag_search_columns('user_nam', 'SELECT user_nam FROM orders'))
+    
+    def test_fix_schema_error_postgres_column_message(self):
+        """测试PostgreSQL带表限定名的缺失列错误"""
+        result = asyncio.run(self.debugger._fix_schema_error(
+            "SELECT u.emial_address FROM users u", "column u.emial_address does not exist", {}, 1
+        ))
+        assert result['success'] == True
+        assert result['fixed_sql'] == "SELECT u.email_address FROM users u"
+    
+    def test_auto_fix_sql_sqlite_column_message(self):
+        """测试SQLite缺失列错误按Schema错误修复"""
+        error_msg = "(sqlite3.OperationalError) no such column: emial_address"
+        assert self.debugger.detect_error_type(error_msg) == ErrorType.SCHEMA_ERROR
+        result = asyncio.run(self.debugger.auto_fix_sql("SELECT emial_address FROM users", error_msg, {}))
+        assert result['success'] == True
+        assert result['fixed_sql'] == "SELECT email_address FROM users"
     
+    def test_auto_fix_sql_deadline_exceeded(self):
+        """测试时间预算耗尽时不再尝试修复"""
+        async def _test():
+            return await self.debugger.auto_fix_sql(
+                "SELECT * FROM users",
+                "completely invalid syntax",
+                deadline=time.monotonic() - 1
+            )
+        
+        result = asyncio.run(_test())
+        
+        assert result['success'] == False
+        assert result['attempts'] == 0
+        assert result['deadline_exceeded'] == True
+        assert self.debugger.fixes_history[-1]['status'] == 'DEADLINE_EXCEEDED'
+
+    def test_auto_fix_sql_probe_rejects_bad_plan(self):
+        """测试EXPLAIN计划失败的候选不算成功，以计划错误继续下一次尝试"""
+        probed = []
+
+        async def probe(sql):
+            probed.append(sql)
+            if 'LIMIT 100' in sql:
+                raise RuntimeError("canceling statement due to statement timeout")
+            return 12.5
+
+        debugger = DebuggerV2(max_retries=3, probe=probe)
+        result = asyncio.run(debugger.auto_fix_sql(
+            "SELECT * FROM events", "canceling statement due to statement timeout"
+        ))
+
+        assert result['success'] == True
+        assert result['attempts'] == 2
+        assert 'LIMIT 50' in result['fixed_sql']
+        assert result['plan_cost'] == 12.5
+        assert len(probed) == 2
+
+        attempts = debugger.fixes_history[-1]['attempts']
+        assert attempts[0]['probe_status'] == 'error'
+        assert 'plan_cost' not in attempts[0]
+        assert attempts[1]['input_sql'] == attempts[0]['output_sql']
+        assert (attempts[1]['probe_status'], attempts[1]['plan_cost']) == ('clean', 12.5)
+
+    def test_auto_fix_sql_probe_timeout(self):
+        """测试EXPLAIN超出短超时视为未通过校验"""
+        async def probe(sql):
+            await asyncio.sleep(1)
+            return 1.0
+
+        debugger = DebuggerV2(max_retries=2, probe=probe, probe_timeout=0.01)
+        result = asyncio.run(debugger.auto_fix_sql(
+            "SELECT * FROM events", "canceling statement due to statement timeout"
+        ))
+
+        assert result['success'] == False
+        assert result['attempts'] == 2
+        assert all(a['probe_status'] == 'timeout' for a in debugger.fixes_history[-1]['attempts'])
+
+    def test_speculative_candidates_validated_concurrently(self):
+        """测试同时匹配多个错误类型时并发校验候选，置信度最高且计划正常的候选胜出"""
+        sql = "SELECT email FROM users"
+        error = 'syntax error: column "email" does not exist'
+        active = []
+        peak = []
+
+        async def probe(candidate):
+            active.append(candidate)
+            peak.append(len(active))
+            await asyncio.sleep(0.05)
+            active.remove(candidate)
+            if 'email_address' not in candidate:
+                raise RuntimeError('column "email" does not exist')
+            return 3.0
+
+        assert DebuggerV2()._candidate_error_types(ErrorType.SCHEMA_ERROR, error) == [
+            ErrorType.SCHEMA_ERROR, ErrorType.SQL_SYNTAX_ERROR
+        ]
+
+        debugger = DebuggerV2(max_retries=3, probe=probe, schema_catalog=SchemaCatalog(CATALOG))
+        result = asyncio.run(debugger.auto_fix_sql(sql, error))
+
+        assert result['success'] == True
+        assert result['attempts'] == 1
+        assert result['fixed_sql'] == "SELECT email_address FROM users"
+        assert result['error_type'] == 'schema_error'
+        assert max(peak) == 2
+        # 语法候选置信度更高但计划失败，排在前面
+        attempts = debugger.fixes_history[-1]['attempts']
+        assert [a['fix_strategy'] for a in attempts] == ['_fix_syntax_error', '_fix_schema_error']
+        assert attempts[0]['probe_status'] == 'error'
+
+        # 无probe时直接返回置信度最高的候选
+        unverified = asyncio.run(DebuggerV2(schema_catalog=SchemaCatalog(CATALOG)).auto_fix_sql(sql, error))
+        assert unverified['error_type'] == 'sql_syntax_error'
+
+    def test_speculative_losers_cancelled(self):
+        """测试更高置信度的候选通过校验后取消其余仍在校验的候选"""
+        async def probe(candidate):
+            if 'email_address' in candidate:
+                await asyncio.sleep(1)
+            return 1.0
+
+        debugger = DebuggerV2(probe=probe, schema_catalog=SchemaCatalog(CATALOG))
+        started = time.monotonic()
+        result = asyncio.run(debugger.auto_fix_sql(
+            "SELECT email FROM users", 'syntax error: column "email" does not exist'
+        ))
+
+        assert result['success'] == True
+        assert result['error_type'] == 'sql_syntax_error'
+        assert time.monotonic() - started < 0.5
+        attempts = debugger.fixes_history[-1]['attempts']
+        assert attempts[1]['probe_status'] == 'cancelled'
+
+    def test_max_parallel_fixes_one_uses_primary_strategy(self):
+        """测试并发上限为1时只执行主类型策略"""
+        debugger = DebuggerV2(max_parallel_fixes=1)
+        assert debugger._candidate_error_types(
+            ErrorType.SCHEMA_ERROR, 'syntax error: column "email" does not exist'
+        ) == [ErrorType.SCHEMA_ERROR]
+
+    def test_fix_memory_replays_verified_fix(self):
+        """测试通过计划校验的修复被持久化，重启后同类错误直接重放而不执行修复策略"""
+        probed = []
+
+        async def probe(sql):
+            probed.append(sql)
+            return 2.0
+
+        error = "canceling statement due to statement timeout"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'fix_memory.db')
+            first = DebuggerV2(probe=probe, fix_memory=FixMemoryStore(path))
+            fixed = asyncio.run(first.auto_fix_sql("SELECT * FROM events", error))
+            assert fixed['success'] == True
+            first.fix_memory.close()
+
+            restarted = DebuggerV2(probe=probe, fix_memory=FixMemoryStore(path))
+            restarted.fix_strategies = {}
+            replayed = asyncio.run(restarted.auto_fix_sql("SELECT *  FROM events;", error))
+            assert replayed['replayed'] == True
+            assert replayed['attempts'] == 0
+            assert replayed['fixed_sql'] == fixed['fixed_sql']
+            assert replayed['plan_cost'] == 2.0
+            assert len(probed) == 2
+
+            stats = restarted.get_fix_statistics()
+            assert (stats['total_sessions'], stats['replayed_sessions'], stats['fix_memory_entries']) == (1, 1, 1)
+            restarted.fix_memory.close()
+
+    def test_fix_memory_forgets_stale_fix(self):
+        """测试重放的修复计划校验失败时删除记忆并回到修复策略"""
+        async def probe(sql):
+            if 'LIMIT 100' in sql:
+                raise RuntimeError('relation "events" does not exist')
+            return 1.0
+
+        store = FixMemoryStore(':memory:')
+        error = "canceling statement due to statement timeout"
+        debugger = DebuggerV2(probe=probe, fix_memory=store)
+        store.remember(sql_fingerprint("SELECT * FROM events LIMIT 10"), error_signature(error),
+                       "SELECT * FROM events LIMIT 100")
+
+        result = asyncio.run(debugger.auto_fix_sql("SELECT * FROM events LIMIT 10", error))
+        assert 'replayed' not in result
+        assert result['fixed_sql'] == "SELECT * FROM events LIMIT 10"
+        assert store.lookup(sql_fingerprint("SELECT * FROM events LIMIT 10"), error_signature(error))['fixed_sql'] == \
+            "SELECT * FROM events LIMIT 10"
+
+    def test_history_bounded_and_statistics_incremental(self):
+        """测试历史为环形缓冲，统计不受历史淘汰影响"""
+        debugger = DebuggerV2(max_retries=2, history_size=2)
+        for _ in range(3):
+            asyncio.run(debugger.auto_fix_sql("SELECT * FROM events", "query timeout"))
+        asyncio.run(debugger.auto_fix_sql("INVALID", "some mysterious database error"))
+
+        assert len(debugger.fixes_history) == 2
+        stats = debugger.get_fix_statistics()
+        assert stats['total_sessions'] == 4
+        assert stats['successful_sessions'] == 3
+        assert stats['average_attempts'] == (3 + 2) / 4
+        assert stats['error_type_distribution'] == {'timeout_error': 3, 'unknown_error': 2}
+
     def test_get_fix_statistics_empty(self):
         """测试空修复历史的统计"""
         stats = self.debugger.get_fix_statistics()
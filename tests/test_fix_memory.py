@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Debugger修复记忆单元测试
+女娲造物：测则明，试则安
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# 添加路径以导入fix_memory
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from fix_memory import FixMemoryStore, sql_fingerprint
+
+
+class TestFixMemoryStore(unittest.TestCase):
+    """修复记忆测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'memory', 'fix_memory.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fingerprint_normalizes_whitespace_only(self):
+        """测试指纹忽略空白与结尾分号，但区分字面量"""
+        self.assertEqual(sql_fingerprint("SELECT  id\nFROM users;"), sql_fingerprint("SELECT id FROM users"))
+        self.assertNotEqual(sql_fingerprint("SELECT id FROM users WHERE id = 1"),
+                            sql_fingerprint("SELECT id FROM users WHERE id = 2"))
+
+    def test_persists_across_reopen(self):
+        """测试修复写入WAL文件，重新打开后仍可命中"""
+        store = FixMemoryStore(self.path)
+        store.remember("fp", "sig", "SELECT 1", "reason", "schema_error")
+        store.close()
+
+        reopened = FixMemoryStore(self.path)
+        self.assertEqual(len(reopened), 1)
+        known = reopened.lookup("fp", "sig")
+        self.assertEqual((known['fixed_sql'], known['error_type'], known['hits']), ("SELECT 1", "schema_error", 1))
+        self.assertEqual(reopened.lookup("fp", "sig")['hits'], 2)
+        self.assertIsNone(reopened.lookup("fp", "other"))
+        journal_mode = reopened._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(journal_mode, "wal")
+        reopened.close()
+
+    def test_upsert_forget_and_eviction(self):
+        """测试同键覆盖、删除与超上限淘汰最久未用条目"""
+        store = FixMemoryStore(self.path, max_entries=2)
+        store.remember("a", "sig", "SELECT 1")
+        store.remember("a", "sig", "SELECT 2")
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.lookup("a", "sig")['fixed_sql'], "SELECT 2")
+
+        store.remember("b", "sig", "SELECT 3")
+        store.lookup("a", "sig")
+        store.remember("c", "sig", "SELECT 4")
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.lookup("b", "sig"))
+        self.assertIsNotNone(store.lookup("a", "sig"))
+
+        store.forget("a", "sig")
+        self.assertEqual(len(store), 1)
+        self.assertIsNone(store.lookup("a", "sig"))
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+LLM定向重试单元测试
+女娲造物：测则明，试则安
+"""
+
+import sys
+import os
+import asyncio
+import unittest
+
+import anthropic
+import httpx
+
+# 添加路径以导入llm_retry
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from llm_retry import RetryBudget, call_with_retry, is_transient, retry_after_seconds
+
+
+def status_error(status_code, headers=None):
+    response = httpx.Response(status_code, headers=headers or {},
+                              request=httpx.Request("POST", "http://llm-proxy/v1/messages"))
+    return anthropic.APIStatusError("upstream error", response=response, body=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestLLMRetry(unittest.TestCase):
+    """LLM定向重试测试类"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.outcomes = []
+
+    def run_with_retry(self, failures, deadline=None, budget=None, max_attempts=3):
+        calls = []
+
+        async def attempt():
+            calls.append(self.clock.now)
+            if len(calls) <= len(failures):
+                raise failures[len(calls) - 1]
+            return "SELECT 1"
+
+        async def _test():
+            return await call_with_retry(attempt, deadline, budget, max_attempts=max_attempts,
+                                         on_retry=self.outcomes.append,
+                                         clock=self.clock, sleep=self.clock.sleep)
+
+        return asyncio.run(_test()), calls
+
+    def test_transient_classification(self):
+        """测试只有瞬时错误可重试"""
+        self.assertTrue(is_transient(status_error(429)))
+        self.assertTrue(is_transient(status_error(529)))
+        self.assertFalse(is_transient(status_error(400)))
+        self.assertFalse(is_transient(ValueError("SQL被安全检查拦截")))
+
+    def test_transient_classification_sdk_errors(self):
+        """测试SDK具体异常类型的分类（超时、限流、过载、服务端错误可重试，请求/鉴权错误不重试）"""
+        request = httpx.Request("POST", "http://llm-proxy/v1/messages")
+
+        def sdk_error(error_class, status_code):
+            return error_class("upstream error", response=httpx.Response(status_code, request=request), body=None)
+
+        self.assertTrue(is_transient(anthropic.APITimeoutError(request=request)))
+        self.assertTrue(is_transient(anthropic.APIConnectionError(request=request)))
+        self.assertTrue(is_transient(sdk_error(anthropic.RateLimitError, 429)))
+        self.assertTrue(is_transient(sdk_error(anthropic.InternalServerError, 529)))
+        self.assertFalse(is_transient(sdk_error(anthropic.BadRequestError, 400)))
+        self.assertFalse(is_transient(sdk_error(anthropic.AuthenticationError, 401)))
+
+    def test_retry_after_header(self):
+        """测试读取retry-after与retry-after-ms头"""
+        self.assertEqual(retry_after_seconds(status_error(429, {'retry-after': '3'})), 3.0)
+        self.assertEqual(retry_after_seconds(status_error(429, {'retry-after-ms': '250'})), 0.25)
+        self.assertIsNone(retry_after_seconds(ValueError("x")))
+
+    def test_retries_honor_retry_after(self):
+        """测试429按retry-after等待后重试成功"""
+        result, calls = self.run_with_retry([status_error(429, {'retry-after': '2'})])
+        self.assertEqual(result, "SELECT 1")
+        self.assertEqual(self.clock.sleeps, [2.0])
+        self.assertEqual(self.outcomes, ['retried'])
+
+    def test_non_transient_not_retried(self):
+        """测试业务错误立即抛出"""
+        with self.assertRaises(ValueError):
+            self.run_with_retry([ValueError("blocked")])
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_deadline_stops_retry(self):
+        """测试等待会超过截止时间时放弃重试"""
+        with self.assertRaises(anthropic.APIStatusError):
+            self.run_with_retry([status_error(429, {'retry-after': '30'})], deadline=10)
+        self.assertEqual(self.outcomes, ['deadline_exceeded'])
+
+    def test_attempts_exhausted(self):
+        """测试达到最大尝试次数后抛出"""
+        with self.assertRaises(anthropic.APIStatusError):
+            self.run_with_retry([status_error(503)] * 3, max_attempts=3)
+        self.assertEqual(self.outcomes, ['retried', 'retried', 'attempts_exhausted'])
+
+    def test_budget_limits_retries(self):
+        """测试全局重试预算耗尽后不再重试，并按速率补充"""
+        budget = RetryBudget(capacity=1, refill_per_second=0.1, clock=self.clock)
+        self.run_with_retry([status_error(503)], budget=budget)
+        with self.assertRaises(anthropic.APIStatusError):
+            self.run_with_retry([status_error(503)], budget=budget)
+        self.assertEqual(self.outcomes[-1], 'budget_exhausted')
+
+        self.clock.now += 10
+        self.assertTrue(budget.try_acquire())
+
+
+if __name__ == "__main__":
+    unittest.main()
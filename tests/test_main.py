@@ -0,0 +1,985 @@
+#!/usr/bin/env python3
+"""
+Text2SQL引擎与API端点单元测试
+女娲造物：测则明，试则安
+"""
+
+import asyncio
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+# 添加路径以导入main与mock_server
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+sys.path.append(os.path.dirname(__file__))
+
+import main
+from fastapi.testclient import TestClient
+
+import anthropic
+import httpx
+from anthropic import AsyncAnthropic
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # Arrow为可选响应格式
+    pyarrow = None
+from prometheus_client import REGISTRY
+
+from debugger import DebuggerV2
+from mock_server import MockHTTPRequestHandler
+from query_cache import QueryCache
+from schema_catalog import SchemaCatalog
+
+USERS_DDL = "CREATE TABLE users (id integer, email varchar(255), status varchar(20))"
+
+
+class FakeMessages:
+    """测试用messages接口：按调用顺序返回预设SQL（用完后重复最后一条），记录调用参数；
+    routes为{查询: SQL}时按prompt中的用户查询返回"""
+
+    def __init__(self, responses, routes=None):
+        self.responses = list(responses)
+        self.routes = routes or {}
+        self.calls = []
+
+    def prompts_for(self, query):
+        return [call for call in self.calls if f"用户查询: {query}" in call['messages'][0]['content']]
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        prompt = kwargs['messages'][0]['content']
+        sql = next((sql for query, sql in self.routes.items() if f"用户查询: {query}" in prompt), None)
+        if sql is None:
+            sql = self.responses[min(len(self.calls), len(self.responses)) - 1]
+        usage = SimpleNamespace(input_tokens=100, output_tokens=20)
+        return SimpleNamespace(content=[SimpleNamespace(text=sql)], usage=usage)
+
+
+class FakeAnthropic:
+    def __init__(self, *responses, routes=None):
+        self.messages = FakeMessages(responses or ("SELECT id, email FROM users",), routes)
+
+
+class FakeSchemaCollection:
+    """测试用db_schema集合：任何问题都检索到users表"""
+
+    def query(self, query_texts, n_results):
+        return {'ids': [['users'] for _ in query_texts], 'documents': [[USERS_DDL] for _ in query_texts]}
+
+
+class FakeSemanticCache:
+    """测试用语义缓存：hit_sql非空时每次查找都命中"""
+
+    def __init__(self, hit_sql=None):
+        self.hit_sql = hit_sql
+        self.lookups = []
+        self.stored = []
+
+    def lookup(self, query, whitelist_version, schema_fingerprint, context=None):
+        self.lookups.append(context)
+        if self.hit_sql is None:
+            return None
+        return {'id': 'entry', 'sql': self.hit_sql, 'matched_query': 'list all users',
+                'similarity': 0.97, 'hits': 0, 'hit': True}
+
+    def touch(self, entry_id, hits=0):
+        pass
+
+    def store(self, query, sql, whitelist_version, schema_fingerprint, context=None):
+        self.stored.append((query, sql, context))
+
+
+class QuietHandler(MockHTTPRequestHandler):
+    prompt_cache = set()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def metric_value(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class EngineTestCase(unittest.TestCase):
+    """以SQLite库、假LLM客户端与假schema集合构建引擎，并替换main.engine供端点使用"""
+
+    rows = 5
+    security_config = {'allowed_tables': ['users'], 'query_limits': {'max_result_rows': 100}}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = main.Text2SQLEngine()
+        self.engine.llm_streaming = False
+        self.engine.anthropic_client = FakeAnthropic()
+        self.engine.schema_collection = FakeSchemaCollection()
+        self.engine._apply_security_config(self.security_config, main.SQLGuardian(self.security_config), 0)
+        # NullPool：TestClient与asyncio.run各自使用独立事件循环，连接不跨循环复用
+        self.engine.db_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tmpdir.name, 'text2sql.db')}", poolclass=NullPool
+        )
+        self.engine.async_session = sessionmaker(self.engine.db_engine, class_=AsyncSession, expire_on_commit=False)
+        asyncio.run(self.create_tables())
+
+        patcher = patch.object(main, 'engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.engine.vector_executor.shutdown(wait=True)
+        self.tmpdir.cleanup()
+
+    async def create_tables(self):
+        async with self.engine.db_engine.begin() as conn:
+            await conn.execute(text(USERS_DDL))
+            await conn.execute(
+                text("INSERT INTO users (id, email, status) VALUES (:id, :email, 'active')"),
+                [{'id': i, 'email': f'user{i}@example.com'} for i in range(self.rows)]
+            )
+
+    def use_llm(self, *responses, routes=None):
+        self.engine.anthropic_client = FakeAnthropic(*responses, routes=routes)
+        return self.engine.anthropic_client.messages
+
+    def post_lines(self, path, payload, headers=None):
+        """POST并按行解析NDJSON响应"""
+        response = self.client.post(path, json=payload, headers=headers or {})
+        return response, [json.loads(line) for line in response.text.splitlines() if line]
+
+
+class TestSecurityConfig(unittest.TestCase):
+    """安全配置加载测试类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = main.Text2SQLEngine()
+        self.engine.config_file_path = Path(self.tmpdir.name) / "allowed_tables.yml"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_config(self, content: str):
+        self.engine.config_file_path.write_text(content, encoding='utf-8')
+
+    def test_null_query_limits_uses_defaults(self):
+        """测试query_limits为空值时按默认语句超时加载"""
+        self.write_config("allowed_tables: [users]\nquery_limits:\n")
+        self.engine._apply_security_config(*self.engine._read_security_config())
+
+        self.assertEqual(self.engine.statement_timeout_ms, 30000)
+        self.assertIsNone(self.engine.sql_guardian.max_result_rows)
+
+    def test_non_mapping_query_limits_rejected_on_reload(self):
+        """测试query_limits不是映射时热加载被拒绝，保留当前策略"""
+        self.write_config("allowed_tables: [users]\nquery_limits:\n  max_execution_time_seconds: 5\n")
+        self.engine._apply_security_config(*self.engine._read_security_config())
+        self.assertEqual(self.engine.statement_timeout_ms, 5000)
+
+        self.write_config("allowed_tables: [orders]\nquery_limits: [5]\n")
+        with self.assertRaises(ValueError):
+            self.engine._read_security_config()
+
+        asyncio.run(self.engine._reload_security_config())
+        self.assertEqual(self.engine.security_config['allowed_tables'], ['users'])
+        self.assertEqual(self.engine.statement_timeout_ms, 5000)
+
+
+
+class TestStreamLLM(unittest.TestCase):
+    """流式生成测试类：经Mock服务器的SSE事件流驱动_stream_llm"""
+
+    model = 'claude-3-haiku-20240307'
+
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), QuietHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.engine = main.Text2SQLEngine()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.engine.vector_executor.shutdown(wait=True)
+
+    def stream(self, sql, streaming=True):
+        self.server.RequestHandlerClass = type('Handler', (QuietHandler,), {'response_sql': sql})
+        self.engine.llm_streaming = streaming
+
+        async def _test():
+            self.engine.anthropic_client = AsyncAnthropic(
+                api_key="test", base_url=f"http://127.0.0.1:{self.server.server_address[1]}", max_retries=0
+            )
+            try:
+                return await self.engine._llm_attempt(self.model, "system", "prompt", time.monotonic() + 10)
+            finally:
+                await self.engine.anthropic_client.close()
+
+        return asyncio.run(_test())
+
+    def ttft_count(self):
+        return metric_value('text2sql_llm_time_to_first_token_seconds_count', {'model': self.model})
+
+    def early_stops(self, reason):
+        return metric_value('text2sql_llm_stream_early_stops_total', {'reason': reason})
+
+    def test_complete_stream_uses_reported_usage(self):
+        """测试完整流式响应：拼接全部增量，输出token取message_delta上报值，并记录首token延迟"""
+        sql = "SELECT id, email FROM users ORDER BY id"
+        ttft_before = self.ttft_count()
+
+        text, tokens_used = self.stream(sql)
+
+        self.assertEqual(text, sql)
+        self.assertEqual(tokens_used['input'], len("system") + len("prompt"))
+        self.assertEqual(tokens_used['output'], len(sql) // 2)
+        self.assertEqual(self.ttft_count(), ttft_before + 1)
+
+    def test_non_streaming_response(self):
+        """测试关闭流式时读取完整消息的用量"""
+        text, tokens_used = self.stream("SELECT id FROM users", streaming=False)
+
+        self.assertEqual(text, "SELECT id FROM users")
+        self.assertEqual(tokens_used['output'], len("SELECT id FROM users") // 2)
+
+    def test_statement_end_cuts_stream(self):
+        """测试首条语句在引号外的分号处结束即停止接收，输出token按已接收文本估算"""
+        stops_before = self.early_stops('statement_end')
+        ttft_before = self.ttft_count()
+
+        text, tokens_used = self.stream("SELECT id FROM users WHERE email = 'a;b'; SELECT email FROM users")
+
+        self.assertEqual(text, "SELECT id FROM users WHERE email = 'a;b';")
+        self.assertEqual(tokens_used['output'], self.engine.prompt_builder.count_tokens(text))
+        self.assertEqual(self.early_stops('statement_end'), stops_before + 1)
+        self.assertEqual(self.ttft_count(), ttft_before + 1)
+
+    def test_blocked_keyword_stops_stream(self):
+        """测试危险关键字一出现即中止，不再接收后续增量"""
+        stops_before = self.early_stops('blocked')
+
+        text, tokens_used = self.stream("DELETE FROM users WHERE id IN (SELECT id FROM users)")
+
+        self.assertEqual(text, "DELETE F")
+        self.assertEqual(tokens_used['output'], self.engine.prompt_builder.count_tokens("DELETE F"))
+        self.assertEqual(self.early_stops('blocked'), stops_before + 1)
+
+
+class TestReadRouting(EngineTestCase):
+    """读写路由测试类：按语句类型而非前缀判断查询"""
+
+    security_config = {'allowed_tables': ['users'], 'query_limits': {'max_result_rows': 3}}
+
+    def test_cte_query_runs_as_read(self):
+        """测试WITH…SELECT经只读会话执行并受行数上限约束，不作为写操作提交"""
+        self.use_llm("WITH active AS (SELECT id, email FROM users WHERE status = 'active') "
+                     "SELECT id, email FROM active ORDER BY id")
+        read_sessions = []
+        read_session = self.engine._read_session
+
+        def tracking_read_session():
+            read_sessions.append(True)
+            return read_session()
+
+        self.engine._read_session = tracking_read_session
+        response = self.client.post('/api/text2sql', json={'query': 'list active users'})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(read_sessions, [True])
+        self.assertEqual([row['id'] for row in body['result']], [0, 1, 2])
+        self.assertNotIn('affected_rows', body['result'][0])
+        self.assertTrue(body['truncated'])
+
+
+class TestRowCapTruncation(EngineTestCase):
+    """行数上限测试类：SQLGuardian改写LIMIT后执行端仍能识别截断"""
+
+    security_config = {'allowed_tables': ['users'], 'query_limits': {'max_result_rows': 3}}
+
+    def run_capped(self, sql):
+        validation = self.engine.sql_guardian.validate(sql)
+        return asyncio.run(self.engine.execute_sql(validation.get('fixed_sql') or sql))
+
+    def test_rewritten_limit_detects_truncation(self):
+        """测试超出上限的结果在改写+取数后标记为截断并裁到上限"""
+        rows, truncated = self.run_capped("SELECT id FROM users ORDER BY id")
+        self.assertTrue(truncated)
+        self.assertEqual([row['id'] for row in rows], [0, 1, 2])
+
+    def test_result_at_cap_not_truncated(self):
+        """测试结果行数恰好等于上限时不标记截断"""
+        rows, truncated = self.run_capped("SELECT id FROM users WHERE id < 3")
+        self.assertFalse(truncated)
+        self.assertEqual(len(rows), 3)
+
+        rows, truncated = self.run_capped("SELECT id FROM users LIMIT 2")
+        self.assertFalse(truncated)
+        self.assertEqual(len(rows), 2)
+
+    def test_stream_reports_truncation(self):
+        """测试流式执行按改写后的LIMIT识别截断"""
+        validation = self.engine.sql_guardian.validate("SELECT id FROM users ORDER BY id")
+
+        async def collect():
+            return [event async for event in self.engine.execute_sql_stream(validation['fixed_sql'], chunk_size=2)]
+
+        events = asyncio.run(collect())
+        rows = [row['id'] for event in events if event['type'] == 'rows' for row in event['rows']]
+        self.assertEqual(rows, [0, 1, 2])
+        self.assertEqual(events[-1], {'type': 'truncated', 'row_cap': 3})
+
+
+class TestAutoFixValidation(EngineTestCase):
+    """自动修复测试类：修复候选经EXPLAIN探测与SQLGuardian校验后才执行"""
+
+    security_config = {
+        'allowed_tables': ['users'],
+        'table_permissions': {'users': {'allowed_columns': ['*'], 'blocked_columns': ['status']}},
+        'query_limits': {'max_result_rows': 100}
+    }
+
+    def use_debugger(self, columns, probe=True):
+        self.probed = []
+
+        async def probe_candidate(sql):
+            self.probed.append(sql)
+            return await self.engine._explain_probe(sql)
+
+        self.engine.debugger_probe_timeout_ms = 500
+        self.engine.debugger = DebuggerV2(
+            max_retries=1,
+            probe=probe_candidate if probe else None,
+            schema_catalog=SchemaCatalog({'users': columns})
+        )
+
+    def test_probe_accepts_fixed_candidate(self):
+        """测试探测通过的修复候选经校验（追加LIMIT）后执行"""
+        self.use_debugger(['id', 'email', 'status'])
+        self.use_llm("SELECT emial FROM users ORDER BY id")
+
+        response = self.client.post('/api/text2sql', json={'query': 'list user emails'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.probed, ["SELECT email FROM users ORDER BY id LIMIT 100"])
+        self.assertEqual(response.json()['result'][0], {'email': 'user0@example.com'})
+
+    def test_probe_rejects_stale_candidate(self):
+        """测试schema目录过期时探测拒绝不存在的列，修复失败而不执行候选"""
+        self.use_debugger(['id', 'emails'])
+        self.use_llm("SELECT emial FROM users")
+
+        response = self.client.post('/api/text2sql', json={'query': 'list user emails'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("SELECT emails FROM users LIMIT 100", self.probed)
+
+    def test_guardian_blocks_fix_without_probe(self):
+        """测试关闭探测时修复候选仍需通过SQLGuardian，修出的受限列不被执行"""
+        self.use_debugger(['id', 'email', 'status'], probe=False)
+        self.use_llm("SELECT stauts FROM users")
+        executed = []
+        run_sql = self.engine._run_sql
+
+        async def tracking_run_sql(sql):
+            executed.append(sql)
+            return await run_sql(sql)
+
+        self.engine._run_sql = tracking_run_sql
+        response = self.client.post('/api/text2sql', json={'query': 'list user statuses'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn("SELECT status FROM users", executed)
+        self.assertEqual(set(executed), {"SELECT stauts FROM users LIMIT 100"})
+
+
+class TestBatchEndpoint(EngineTestCase):
+    """批量端点测试类"""
+
+    def test_mixed_batch_isolates_failures(self):
+        """测试成功与失败条目混合：失败只影响自身，每行按原始下标对应请求中的查询"""
+        messages = self.use_llm(routes={
+            'list user emails': "SELECT email FROM users ORDER BY id",
+            'broken query': "SELECT missing_column FROM users",
+            'delete everyone': "DELETE FROM users",
+            'count users': "SELECT COUNT(*) AS total FROM users"
+        })
+        queries = ['list user emails', 'broken query', 'delete everyone', 'List user emails.', 'count users']
+
+        response, lines = self.post_lines('/api/text2sql/batch', {'queries': [{'query': q} for q in queries]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-type'], 'application/x-ndjson')
+        by_index = {line['index']: line for line in lines}
+        self.assertEqual(len(lines), len(queries))
+        self.assertEqual(sorted(by_index), list(range(len(queries))))
+        for index, query in enumerate(queries):
+            self.assertEqual(by_index[index]['query'], query)
+
+        self.assertEqual([by_index[i]['status'] for i in range(len(queries))],
+                         ['success', 'error', 'error', 'success', 'success'])
+        self.assertEqual(by_index[0]['result'][0], {'email': 'user0@example.com'})
+        self.assertEqual(by_index[3]['result'], by_index[0]['result'])
+        self.assertEqual(by_index[4]['result'], [{'total': self.rows}])
+        self.assertIn('missing_column', by_index[1]['error'])
+        self.assertIn('安全检查拦截', by_index[2]['error'])
+        # 规范化后相同的查询只生成一次
+        self.assertEqual(len(messages.prompts_for('list user emails')), 1)
+
+    def test_batch_size_limit(self):
+        """测试超过BATCH_MAX_QUERIES时整批拒绝，不调用LLM"""
+        messages = self.use_llm()
+        with patch.dict(os.environ, {'BATCH_MAX_QUERIES': '2'}):
+            response = self.client.post('/api/text2sql/batch',
+                                        json={'queries': [{'query': f'q{i}'} for i in range(3)]})
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(messages.calls, [])
+
+
+class TestStreamEndpoint(EngineTestCase):
+    """流式端点测试类：NDJSON与SSE两种分帧"""
+
+    security_config = {'allowed_tables': ['users'], 'query_limits': {'max_result_rows': 3}}
+
+    def post_stream(self, query, sse=False):
+        headers = {'Accept': 'text/event-stream'} if sse else {}
+        with patch.dict(os.environ, {'STREAM_CHUNK_ROWS': '2'}):
+            response = self.client.post('/api/text2sql/stream', json={'query': query}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        if not sse:
+            self.assertEqual(response.headers['content-type'], 'application/x-ndjson')
+            return [json.loads(line) for line in response.text.splitlines() if line]
+
+        self.assertTrue(response.headers['content-type'].startswith('text/event-stream'))
+        events = []
+        for frame in response.text.split("\n\n"):
+            if not frame:
+                continue
+            event_line, data_line = frame.split("\n")
+            event = json.loads(data_line[len("data: "):])
+            self.assertEqual(event_line, f"event: {event['type']}")
+            events.append(event)
+        return events
+
+    def test_ndjson_framing_and_truncated_summary(self):
+        """测试NDJSON：头记录、按块的行记录，结尾汇总标记按行数上限截断"""
+        self.use_llm("SELECT id FROM users ORDER BY id")
+
+        events = self.post_stream('list users')
+
+        self.assertEqual([event['type'] for event in events], ['header', 'columns', 'rows', 'rows', 'end'])
+        self.assertEqual(events[0]['sql'], "SELECT id FROM users ORDER BY id LIMIT 3")
+        self.assertEqual([len(event['rows']) for event in events if event['type'] == 'rows'], [2, 1])
+        self.assertEqual((events[-1]['row_count'], events[-1]['truncated']), (3, True))
+
+    def test_sse_framing(self):
+        """测试SSE：每帧event名与数据中的type一致，未截断时汇总truncated为false"""
+        self.use_llm("SELECT id FROM users WHERE id < 2")
+
+        events = self.post_stream('list first users', sse=True)
+
+        self.assertEqual([event['type'] for event in events], ['header', 'columns', 'rows', 'end'])
+        self.assertEqual(events[2]['rows'], [{'id': 0}, {'id': 1}])
+        self.assertEqual((events[-1]['row_count'], events[-1]['truncated']), (2, False))
+
+    def test_error_record_mid_stream(self):
+        """测试已发送部分行后执行出错：以error记录结束，不再发送汇总"""
+        # 第4行计算溢出，SQLite在游标推进到该行时报错（无ORDER BY，不会预先计算全部行）
+        self.use_llm("SELECT id, abs(CASE WHEN id = 3 THEN -9223372036854775808 ELSE id END) AS v FROM users")
+
+        for sse in (False, True):
+            events = self.post_stream('list users', sse=sse)
+
+            self.assertEqual([event['type'] for event in events], ['header', 'columns', 'rows', 'error'])
+            self.assertEqual(events[2]['rows'], [{'id': 0, 'v': 0}, {'id': 1, 'v': 1}])
+            self.assertIn('overflow', events[-1]['error'])
+
+
+class TestResponseFormats(EngineTestCase):
+    """Accept协商测试类：JSON行数组、列式JSON与Arrow IPC"""
+
+    def setUp(self):
+        super().setUp()
+        self.use_llm("SELECT id, email FROM users WHERE id < 3 ORDER BY id")
+        self.expected_rows = [{'id': i, 'email': f'user{i}@example.com'} for i in range(3)]
+
+    def post(self, accept=None):
+        headers = {'Accept': accept} if accept else {}
+        response = self.client.post('/api/text2sql', json={'query': 'list users'}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_arrow_rows(self, response):
+        self.assertEqual(response.headers['content-type'], main.ARROW_STREAM_MEDIA_TYPE)
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.to_pylist(), self.expected_rows)
+        metadata = {key.decode(): json.loads(value) for key, value in table.schema.metadata.items()}
+        self.assertEqual(metadata['sql'], "SELECT id, email FROM users WHERE id < 3 ORDER BY id LIMIT 100")
+        self.assertFalse(metadata['truncated'])
+
+    def test_default_and_json_accept_return_rows(self):
+        """测试未指定或指定application/json时返回行数组"""
+        for accept in (None, 'application/json', '*/*'):
+            response = self.post(accept)
+            self.assertEqual(response.headers['content-type'], 'application/json')
+            self.assertEqual(response.json()['result'], self.expected_rows)
+
+    def test_columnar_json(self):
+        """测试列式JSON：列名与类型、按列的数据数组和行数"""
+        response = self.post(main.COLUMNAR_JSON_MEDIA_TYPE)
+
+        self.assertEqual(response.headers['content-type'], main.COLUMNAR_JSON_MEDIA_TYPE)
+        result = response.json()['result']
+        self.assertEqual(result['columns'], [{'name': 'id', 'type': 'int'}, {'name': 'email', 'type': 'string'}])
+        self.assertEqual(result['data'], [[0, 1, 2], [row['email'] for row in self.expected_rows]])
+        self.assertEqual(result['row_count'], 3)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow未安装")
+    def test_arrow_round_trip(self):
+        """测试Arrow IPC流经pyarrow.ipc读回后与原始行一致（含多个Accept类型时优先Arrow）"""
+        self.assert_arrow_rows(self.post(main.ARROW_STREAM_MEDIA_TYPE))
+        self.assert_arrow_rows(self.post(f"{main.ARROW_STREAM_MEDIA_TYPE}, application/json;q=0.5"))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow未安装")
+    def test_arrow_from_cached_records(self):
+        """测试结果缓存中的行记录转为Arrow后与原始行一致"""
+        self.engine.query_cache = QueryCache(max_bytes=1024 * 1024, ttl_seconds=60)
+        self.engine.cache_results = True
+        self.assertEqual(self.post().json()['result'], self.expected_rows)
+
+        self.assert_arrow_rows(self.post(main.ARROW_STREAM_MEDIA_TYPE))
+        self.assertEqual(len(self.engine.anthropic_client.messages.calls), 1)
+
+    def test_duplicate_column_names_kept(self):
+        """测试JOIN结果含同名列时列式JSON与Arrow都保留全部列"""
+        self.use_llm("SELECT u.id, o.id FROM users u JOIN users o ON o.id = u.id + 1 WHERE u.id < 2 ORDER BY u.id")
+
+        result = self.post(main.COLUMNAR_JSON_MEDIA_TYPE).json()['result']
+        self.assertEqual([column['name'] for column in result['columns']], ['id', 'id'])
+        self.assertEqual(result['data'], [[0, 1], [1, 2]])
+
+        if pyarrow is not None:
+            table = pyarrow.ipc.open_stream(self.post(main.ARROW_STREAM_MEDIA_TYPE).content).read_all()
+            self.assertEqual(table.column_names, ['id', 'id'])
+            self.assertEqual([table.column(i).to_pylist() for i in range(table.num_columns)], [[0, 1], [1, 2]])
+
+    def test_arrow_falls_back_to_columnar_without_pyarrow(self):
+        """测试pyarrow不可用时Arrow请求回退为列式JSON"""
+        with patch.dict(sys.modules, {'pyarrow': None}):
+            response = self.post(main.ARROW_STREAM_MEDIA_TYPE)
+
+        self.assertEqual(response.headers['content-type'], main.COLUMNAR_JSON_MEDIA_TYPE)
+        self.assertEqual(response.json()['result']['row_count'], 3)
+
+
+class TestRequestDeadline(EngineTestCase):
+    """请求时间预算测试类：超时504、语句超时收紧与重试在截止时间前停止"""
+
+    def slow_llm(self, seconds):
+        messages = self.use_llm()
+
+        async def slow_create(**kwargs):
+            messages.calls.append(kwargs)
+            await asyncio.sleep(seconds)
+
+        messages.create = slow_create
+        return messages
+
+    def test_exceeded_budget_returns_504(self):
+        """测试生成超出X-Request-Timeout-Ms时两个端点都返回504，且LLM超时不超过剩余预算"""
+        messages = self.slow_llm(5)
+        for path, endpoint in (('/api/text2sql', 'text2sql'), ('/api/text2sql/stream', 'text2sql_stream')):
+            exceeded_before = metric_value('text2sql_request_deadline_exceeded_total', {'endpoint': endpoint})
+            started = time.monotonic()
+
+            response = self.client.post(path, json={'query': 'list users'}, headers={'X-Request-Timeout-Ms': '200'})
+
+            self.assertEqual(response.status_code, 504)
+            self.assertLess(time.monotonic() - started, 2)
+            self.assertEqual(metric_value('text2sql_request_deadline_exceeded_total', {'endpoint': endpoint}),
+                             exceeded_before + 1)
+        self.assertEqual(len(messages.calls), 2)
+        self.assertTrue(all(call['timeout'] <= 0.2 for call in messages.calls))
+
+    def test_statement_timeout_clamped_to_remaining_budget(self):
+        """测试SET LOCAL statement_timeout取配置值与请求剩余预算中的较小者"""
+        statements = []
+        apply_statement_timeout = self.engine._apply_statement_timeout
+
+        class PostgresSession:
+            bind = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'))
+
+            async def execute(self, statement):
+                statements.append(str(statement))
+
+        async def capture_statement_timeout(session):
+            await apply_statement_timeout(PostgresSession())
+
+        self.engine._apply_statement_timeout = capture_statement_timeout
+        self.engine.statement_timeout_ms = 30000
+
+        response = self.client.post('/api/text2sql', json={'query': 'list users'},
+                                    headers={'X-Request-Timeout-Ms': '2000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(statements), 1)
+        timeout_ms = int(statements[0].rsplit('=', 1)[1])
+        self.assertTrue(0 < timeout_ms <= 2000, timeout_ms)
+
+        # 预算大于配置值时保留配置的语句超时
+        self.engine.statement_timeout_ms = 1500
+        self.client.post('/api/text2sql', json={'query': 'count users'}, headers={'X-Request-Timeout-Ms': '5000'})
+        self.assertEqual(statements[-1], "SET LOCAL statement_timeout = 1500")
+
+    def rate_limited_llm(self, headers):
+        messages = self.use_llm()
+        request = httpx.Request("POST", "http://llm-proxy/v1/messages")
+
+        async def rate_limited(**kwargs):
+            messages.calls.append(kwargs)
+            raise anthropic.RateLimitError("rate limited", body=None,
+                                           response=httpx.Response(429, headers=headers, request=request))
+
+        messages.create = rate_limited
+        return messages
+
+    def test_retry_stops_at_deadline(self):
+        """测试retry-after等待会越过截止时间时不再重试，立即失败"""
+        messages = self.rate_limited_llm({'retry-after': '1'})
+        stopped_before = metric_value('text2sql_llm_retries_total', {'outcome': 'deadline_exceeded'})
+        started = time.monotonic()
+
+        response = self.client.post('/api/text2sql', json={'query': 'list users'},
+                                    headers={'X-Request-Timeout-Ms': '500'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(messages.calls), 1)
+        self.assertEqual(metric_value('text2sql_llm_retries_total', {'outcome': 'deadline_exceeded'}),
+                         stopped_before + 1)
+
+    def test_retry_within_deadline(self):
+        """测试等待落在截止时间之内时按最大尝试次数重试"""
+        messages = self.rate_limited_llm({'retry-after-ms': '10'})
+
+        response = self.client.post('/api/text2sql', json={'query': 'list users'},
+                                    headers={'X-Request-Timeout-Ms': '2000'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(messages.calls), self.engine.llm_max_attempts)
+
+
+class TestCacheAfterExecution(EngineTestCase):
+    """缓存写入时机测试类：只缓存执行成功的SQL"""
+
+    def setUp(self):
+        super().setUp()
+        self.engine.query_cache = QueryCache(max_bytes=1024 * 1024, ttl_seconds=60)
+        self.engine.semantic_cache = FakeSemanticCache()
+
+    def cached(self, query, context=None):
+        cached, _ = asyncio.run(self.engine.query_cache.get(self.engine._cache_key(query, context)))
+        return cached
+
+    def test_successful_query_cached(self):
+        """测试执行成功后写入精确缓存与语义缓存，再次查询不调用LLM"""
+        messages = self.use_llm("SELECT id, email FROM users")
+
+        response = self.client.post('/api/text2sql', json={'query': 'list users'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cached('list users')['sql'], response.json()['sql'])
+        self.assertEqual(self.engine.semantic_cache.stored, [('list users', response.json()['sql'], None)])
+
+        response = self.client.post('/api/text2sql', json={'query': 'List users.'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(messages.calls), 1)
+
+    def test_failed_query_not_cached(self):
+        """测试执行失败（含升级到强模型后仍失败）的SQL不进入任何缓存"""
+        messages = self.use_llm("SELECT missing_column FROM users")
+
+        response = self.client.post('/api/text2sql', json={'query': 'list users'})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(messages.calls), 2)
+        self.assertIsNone(self.cached('list users'))
+        self.assertEqual(self.engine.semantic_cache.stored, [])
+
+    def test_unexecuted_semantic_hit_not_cached(self):
+        """测试语义缓存命中的SQL执行失败时不写入新问题的精确缓存"""
+        self.engine.semantic_cache.hit_sql = "SELECT missing_column FROM users"
+        self.use_llm("SELECT missing_column FROM users")
+
+        response = self.client.post('/api/text2sql', json={'query': 'show every user'})
+        self.assertEqual(response.status_code, 500)
+        self.assertIsNone(self.cached('show every user'))
+
+    def test_semantic_cache_scoped_to_context(self):
+        """测试语义缓存的查找与写入都带上请求上下文"""
+        context = {'region': 'eu'}
+        response = self.client.post('/api/text2sql', json={'query': 'list users', 'context': context})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.engine.semantic_cache.lookups, [context])
+        self.assertEqual(self.engine.semantic_cache.stored, [('list users', response.json()['sql'], context)])
+
+    def test_batch_without_execution_not_cached(self):
+        """测试批量端点execute=false时生成的SQL未执行，不写缓存"""
+        response = self.client.post('/api/text2sql/batch',
+                                    json={'queries': [{'query': 'list users'}], 'execute': False})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.cached('list users'))
+
+
+class TestDbPool(unittest.TestCase):
+    """连接池测试类：池参数、占用/大小指标、取得连接耗时与事务内语句超时"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = main.Text2SQLEngine()
+        self.engine_kwargs = {}
+
+    def tearDown(self):
+        self.engine.vector_executor.shutdown(wait=True)
+        self.tmpdir.cleanup()
+
+    def create_engine(self, pool_label):
+        """记录create_async_engine收到的参数，以本地SQLite库替代asyncpg（asyncpg专用参数不下传）"""
+        database = os.path.join(self.tmpdir.name, 'pool.db')
+
+        def fake_create_async_engine(url, connect_args=None, **kwargs):
+            self.engine_kwargs = dict(kwargs, url=url, connect_args=connect_args)
+            return create_async_engine(f"sqlite+aiosqlite:///{database}", poolclass=AsyncAdaptedQueuePool, **kwargs)
+
+        env = {'DB_POOL_SIZE': '3', 'DB_MAX_OVERFLOW': '2', 'DB_POOL_TIMEOUT_SECONDS': '1.5',
+               'DB_POOL_RECYCLE_SECONDS': '600', 'DB_POOL_PRE_PING': 'false', 'DB_STATEMENT_CACHE_SIZE': '0'}
+        with patch.dict(os.environ, env), patch.object(main, 'create_async_engine', fake_create_async_engine):
+            return self.engine._create_db_engine("postgresql+asyncpg://u:p@db:5432/app", pool_label=pool_label)
+
+    def test_pool_settings_from_env(self):
+        """测试连接池参数与语句缓存大小按环境变量配置，池大小写入指标"""
+        db_engine = self.create_engine('settings')
+        pool = db_engine.sync_engine.pool
+
+        self.assertEqual(self.engine_kwargs['url'],
+                         "postgresql+asyncpg://u:p@db:5432/app?prepared_statement_cache_size=0")
+        self.assertEqual(self.engine_kwargs['connect_args'], {'statement_cache_size': 0})
+        self.assertEqual((pool.size(), pool._max_overflow, pool._timeout, pool._recycle, pool._pre_ping),
+                         (3, 2, 1.5, 600, False))
+        self.assertEqual(metric_value('text2sql_db_pool_size', {'pool': 'settings'}), 3)
+
+    def test_in_use_gauge_and_acquire_time(self):
+        """测试会话持有连接期间占用数为1、归还后为0，每次签出记录一次取得连接耗时"""
+        db_engine = self.create_engine('gauges')
+        session_factory = sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+        labels = {'pool': 'gauges'}
+        acquired_before = metric_value('text2sql_db_connection_acquire_seconds_distribution_count', labels)
+        in_use = []
+
+        async def use_session():
+            async with self.engine._db_session(session_factory, pool_label='gauges') as session:
+                await session.execute(text("SELECT 1"))
+                in_use.append(metric_value('text2sql_db_pool_connections_in_use', labels))
+            await db_engine.dispose()
+
+        asyncio.run(use_session())
+
+        self.assertEqual(in_use, [1])
+        self.assertEqual(metric_value('text2sql_db_pool_connections_in_use', labels), 0)
+        self.assertEqual(metric_value('text2sql_db_connection_acquire_seconds_distribution_count', labels),
+                         acquired_before + 1)
+
+    def test_session_sets_statement_timeout_after_checkout(self):
+        """测试PostgreSQL会话签出连接后在事务内SET LOCAL statement_timeout"""
+        calls = []
+
+        class PostgresSession:
+            bind = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'))
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc_info):
+                calls.append('close')
+
+            async def connection(self):
+                calls.append('connection')
+
+            async def execute(self, statement):
+                calls.append(str(statement))
+
+        async def use_session():
+            async with self.engine._db_session(PostgresSession, pool_label='fake'):
+                calls.append('query')
+
+        self.engine.statement_timeout_ms = 30000
+        asyncio.run(use_session())
+        self.assertEqual(calls, ['connection', 'SET LOCAL statement_timeout = 30000', 'query', 'close'])
+
+        # 语句超时配置为0时不设置
+        calls.clear()
+        self.engine.statement_timeout_ms = 0
+        asyncio.run(use_session())
+        self.assertEqual(calls, ['connection', 'query', 'close'])
+
+
+class TestVectorCalls(unittest.TestCase):
+    """Chroma调用测试类：同步调用在线程池中执行、检索延迟入直方图、集合句柄只解析一次"""
+
+    class SlowSchemaCollection:
+        """每次检索阻塞delay秒的同步集合"""
+
+        metadata = {'schema_hash': 'v1'}
+
+        def __init__(self, delay):
+            self.delay = delay
+            self.threads = set()
+
+        def query(self, query_texts, n_results):
+            self.threads.add(threading.current_thread().name)
+            time.sleep(self.delay)
+            return {'ids': [['users'] for _ in query_texts], 'documents': [[USERS_DDL] for _ in query_texts]}
+
+        def count(self):
+            return 1
+
+    class FakeVectorDB:
+        """记录集合解析调用；get_collection返回带当前元数据的新句柄"""
+
+        def __init__(self, collection):
+            self.collection = collection
+            self.calls = []
+
+        def get_or_create_collection(self, name):
+            self.calls.append(('get_or_create_collection', name))
+            return self.collection
+
+        def get_collection(self, name):
+            self.calls.append(('get_collection', name))
+            return SimpleNamespace(name=name, metadata=dict(self.collection.metadata))
+
+    def setUp(self):
+        self.engine = main.Text2SQLEngine()
+        self.collection = self.SlowSchemaCollection(delay=0.3)
+        self.engine.vector_db = self.FakeVectorDB(self.collection)
+
+    def tearDown(self):
+        self.engine.vector_executor.shutdown(wait=True)
+
+    def test_concurrent_retrievals_not_serialized(self):
+        """测试并发检索在Chroma线程池中并行执行，事件循环不被阻塞，且每次检索都记录延迟"""
+        labels = {'mode': 'single', 'source': 'chroma', 'status': 'success'}
+        observed_before = metric_value('text2sql_schema_retrieval_seconds_count', labels)
+        ticks = []
+
+        async def heartbeat():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def retrieve_concurrently():
+            beat = asyncio.create_task(heartbeat())
+            started = time.monotonic()
+            schemas = await asyncio.gather(*(self.engine._retrieve_schema(f"q{i}") for i in range(4)))
+            elapsed = time.monotonic() - started
+            beat.cancel()
+            return schemas, elapsed
+
+        schemas, elapsed = asyncio.run(retrieve_concurrently())
+
+        self.assertEqual(schemas, [USERS_DDL] * 4)
+        self.assertLess(elapsed, 0.3 * 4 * 0.75)
+        self.assertGreater(len(ticks), 10)
+        self.assertTrue(all(name.startswith('chroma') for name in self.collection.threads))
+        self.assertGreater(len(self.collection.threads), 1)
+        self.assertEqual(metric_value('text2sql_schema_retrieval_seconds_count', labels), observed_before + 4)
+
+    def test_refresh_reuses_cached_collection(self):
+        """测试指纹刷新复用启动时缓存的集合句柄，只读获取最新元数据，元数据变化时指纹随之变化"""
+        asyncio.run(self.engine._get_schema_collection())
+        self.assertEqual(self.engine.vector_db.calls, [('get_or_create_collection', 'db_schema')])
+
+        asyncio.run(self.engine._refresh_schema_fingerprint())
+        first = self.engine.schema_fingerprint
+        self.collection.metadata = {'schema_hash': 'v2'}
+        asyncio.run(self.engine._refresh_schema_fingerprint())
+
+        self.assertNotEqual(self.engine.schema_fingerprint, first)
+        self.assertIs(self.engine.schema_collection, self.collection)
+        self.assertEqual(self.engine.vector_db.calls.count(('get_or_create_collection', 'db_schema')), 1)
+
+
+class TestModelEscalation(EngineTestCase):
+    """模型升级测试类：快速模型结果被拦截、置信度低或执行失败时升级到强模型"""
+
+    def setUp(self):
+        super().setUp()
+        self.fast_model = self.engine.model_router.fast_model
+        self.strong_model = self.engine.model_router.strong_model
+
+    def post_escalated(self, reason, *responses, query='list users'):
+        """按给定的LLM输出发起查询，返回(响应, 调用的模型顺序, 该原因的升级计数增量)"""
+        messages = self.use_llm(*responses)
+        escalations_before = metric_value('text2sql_model_escalations_total', {'reason': reason})
+        response = self.client.post('/api/text2sql', json={'query': query})
+        escalations = metric_value('text2sql_model_escalations_total', {'reason': reason}) - escalations_before
+        return response, [call['model'] for call in messages.calls], escalations
+
+    def test_blocked_output_escalates(self):
+        """测试快速模型生成被拦截的SQL时由强模型重新生成"""
+        response, models, escalations = self.post_escalated(
+            'blocked', "DROP TABLE users", "SELECT id FROM users ORDER BY id"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models, [self.fast_model, self.strong_model])
+        self.assertEqual(escalations, 1)
+        self.assertEqual(response.json()['sql'], "SELECT id FROM users ORDER BY id LIMIT 100")
+
+    def test_low_confidence_output_escalates(self):
+        """测试快速模型结果置信度低于阈值（引用白名单外的表）时由强模型重新生成"""
+        response, models, escalations = self.post_escalated(
+            'low_confidence', "SELECT id FROM orders", "SELECT id FROM users ORDER BY id"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models, [self.fast_model, self.strong_model])
+        self.assertEqual(escalations, 1)
+        self.assertEqual(len(response.json()['result']), self.rows)
+
+    def test_execution_failure_escalates(self):
+        """测试快速模型SQL执行失败时跳过缓存由强模型重新生成并执行"""
+        response, models, escalations = self.post_escalated(
+            'execution_error', "SELECT missing_column FROM users", "SELECT id FROM users ORDER BY id"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models, [self.fast_model, self.strong_model])
+        self.assertEqual(escalations, 1)
+        self.assertEqual(response.json()['result'], [{'id': i} for i in range(self.rows)])
+
+    def test_strong_model_failure_not_escalated(self):
+        """测试强模型生成的SQL执行失败时不再升级"""
+        query = "list every user together with their email address and current status, ordered by id ascending"
+        response, models, escalations = self.post_escalated(
+            'execution_error', "SELECT missing_column FROM users", query=query
+        )
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(models, [self.strong_model])
+        self.assertEqual(escalations, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
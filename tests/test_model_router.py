@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+模型分级路由单元测试
+女娲造物：测则明，试则安
+"""
+
+import sys
+import os
+import unittest
+
+# 添加路径以导入model_router
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from model_router import ModelRouter
+
+FAST = "claude-3-haiku-20240307"
+STRONG = "claude-3-opus-20240229"
+
+
+class TestModelRouter(unittest.TestCase):
+    """模型分级路由测试类"""
+
+    def setUp(self):
+        self.router = ModelRouter(fast_model=FAST, strong_model=STRONG, max_query_chars=40)
+
+    def test_simple_query_routes_to_fast_model(self):
+        """测试短问题且单表时使用快速模型"""
+        self.assertEqual(self.router.choose("count users", {'tables': 1}), (FAST, 'simple'))
+        self.assertEqual(
+            self.router.choose("count users", {'tables': 3, 'mentioned_tables': 1}),
+            (FAST, 'simple')
+        )
+
+    def test_complex_query_routes_to_strong_model(self):
+        """测试长问题或多表时使用强模型"""
+        self.assertEqual(
+            self.router.choose("orders joined with users", {'tables': 3, 'mentioned_tables': 2}),
+            (STRONG, 'complex')
+        )
+        self.assertEqual(
+            self.router.choose("x" * 41, {'tables': 1}),
+            (STRONG, 'complex')
+        )
+
+    def test_cache_near_miss_routes_to_fast_model(self):
+        """测试语义缓存近似命中时使用快速模型"""
+        stats = {'tables': 3, 'mentioned_tables': 0}
+        self.assertEqual(self.router.choose("x" * 100, stats, similarity=0.9), (FAST, 'cache_near_miss'))
+        self.assertEqual(self.router.choose("x" * 100, stats, similarity=0.5), (STRONG, 'complex'))
+
+    def test_escalation_reason(self):
+        """测试快速模型结果的升级判定"""
+        self.assertEqual(self.router.escalation_reason(FAST, {'status': 'BLOCK', 'confidence': 0.0}), 'blocked')
+        self.assertEqual(self.router.escalation_reason(FAST, {'status': 'WARN', 'confidence': 0.75}), 'low_confidence')
+        self.assertIsNone(self.router.escalation_reason(FAST, {'status': 'PASS', 'confidence': 0.95}))
+        self.assertIsNone(self.router.escalation_reason(STRONG, {'status': 'WARN', 'confidence': 0.1}))
+
+    def test_disabled_router_always_uses_strong_model(self):
+        """测试关闭路由时始终使用强模型"""
+        router = ModelRouter(fast_model=FAST, strong_model=STRONG, enabled=False)
+        self.assertEqual(router.choose("count users", {'tables': 1}), (STRONG, 'disabled'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Prompt构建单元测试
+女娲造物：测则明，试则安
+"""
+
+import sys
+import os
+import unittest
+
+# 添加路径以导入prompt_builder
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from prompt_builder import PromptBuilder, approx_tokens, parse_tables, render_compact
+
+SCHEMA = """-- rows: 10,000+; 用户表
+CREATE TABLE users (
+  id integer NOT NULL PRIMARY KEY,
+  email character varying,
+  balance numeric(10,2),
+  org_id integer REFERENCES orgs(id)
+);
+-- rows: 100+
+CREATE TABLE orgs (
+  id integer NOT NULL PRIMARY KEY,
+  name text
+);
+free-form note about the schema"""
+
+
+def wide_table(name, width):
+    columns = ",\n".join(f"  attribute_{i} text" for i in range(width))
+    return f"CREATE TABLE {name} (\n  id integer PRIMARY KEY,\n{columns}\n);"
+
+
+class TestPromptBuilder(unittest.TestCase):
+    """Prompt构建测试类"""
+
+    def test_parse_and_render_compact(self):
+        """测试DDL解析为紧凑表示，括号内逗号不拆分"""
+        tables, leftover = parse_tables(SCHEMA)
+        self.assertEqual([table['name'] for table in tables], ['users', 'orgs'])
+        self.assertEqual(leftover, "free-form note about the schema")
+        self.assertEqual(
+            render_compact(tables[0]),
+            "users(id int PK,email varchar,balance numeric(10,2),org_id int→orgs.id) 10,000+行 -- 用户表"
+        )
+
+    def test_compression_reduces_tokens(self):
+        """测试压缩后token数低于原始prompt"""
+        builder = PromptBuilder(token_budget=4000, count_tokens=approx_tokens)
+        prompt, stats = builder.build("list user emails", SCHEMA, {"tenant": "acme"})
+        self.assertLess(stats['prompt_tokens'], stats['raw_tokens'])
+        self.assertIn("用户查询: list user emails", prompt)
+        self.assertIn('额外上下文: {"tenant":"acme"}', prompt)
+        self.assertEqual((stats['pruned_columns'], stats['dropped_tables']), (0, 0))
+
+    def test_prune_columns_then_drop_tables(self):
+        """测试超预算时先裁剪宽表无关列，再从末尾丢弃表"""
+        schema = wide_table("events", 40) + "\n" + wide_table("logs", 40)
+        builder = PromptBuilder(token_budget=200, count_tokens=approx_tokens, keep_leading_columns=3)
+        prompt, stats = builder.build("events by attribute_30", schema)
+
+        self.assertGreater(stats['pruned_columns'], 0)
+        self.assertIn("attribute_30 text", prompt)
+        self.assertNotIn("attribute_20 text", prompt)
+        self.assertIn("…+", prompt)
+        self.assertLessEqual(stats['prompt_tokens'], 200)
+
+        tight = PromptBuilder(token_budget=60, count_tokens=approx_tokens, keep_leading_columns=3)
+        prompt, stats = tight.build("events by attribute_30", schema)
+        self.assertEqual(stats['dropped_tables'], 1)
+        self.assertNotIn("logs(", prompt)
+
+    def test_context_truncated_to_share(self):
+        """测试上下文被截断到预算份额内"""
+        builder = PromptBuilder(token_budget=100, count_tokens=approx_tokens, context_share=0.2)
+        prompt, _ = builder.build("q", "", {"notes": "x" * 1000})
+        context_line = prompt.split("额外上下文: ")[1].split("\n")[0]
+        self.assertTrue(context_line.endswith("…"))
+        self.assertLessEqual(approx_tokens(context_line[:-1]), 20)
+
+    def test_approx_tokens_counts_cjk_per_character(self):
+        """测试token估计：中文约每字1 token，英文与SQL约4字符/token"""
+        self.assertEqual(approx_tokens("统计每个组织的活跃用户数量"), 13)
+        self.assertEqual(approx_tokens("SELECT id FROM users"), 5)
+        self.assertEqual(approx_tokens("用户表 users"), 3 + 2)
+
+    def test_chinese_prompt_within_budget(self):
+        """测试中文注释的schema与中文问题按字计费，构建结果不超出预算"""
+        schema = "\n".join(
+            f"-- rows: 1000+; {name}表，记录{name}的基本信息与状态变更历史\n" + wide_table(table, 10)
+            for name, table in (("用户", "users"), ("订单", "orders"), ("支付", "payments"))
+        )
+        question = "统计上个月每个用户的订单数量和支付总额，按支付总额降序排列"
+        builder = PromptBuilder(token_budget=220, count_tokens=approx_tokens, keep_leading_columns=3)
+        prompt, stats = builder.build(question, schema)
+
+        self.assertGreaterEqual(approx_tokens(question), len(question))
+        self.assertLessEqual(stats['prompt_tokens'], 220)
+        self.assertGreater(stats['raw_tokens'], 220)
+        self.assertIn(f"用户查询: {question}", prompt)
+
+
+if __name__ == "__main__":
+    unittest.main()
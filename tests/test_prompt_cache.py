@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+提示缓存单元测试
+女娲造物：测则明，试则安
+"""
+
+import sys
+import os
+import json
+import socketserver
+import threading
+import unittest
+import urllib.request
+
+# 添加路径以导入prompt_builder与mock_server
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+sys.path.append(os.path.dirname(__file__))
+
+from prompt_builder import PromptBuilder, StableSchemaPrefix, approx_tokens, parse_tables
+from mock_server import MockHTTPRequestHandler
+
+SCHEMA = """CREATE TABLE users (
+  id integer PRIMARY KEY,
+  email text
+);
+CREATE TABLE orders (
+  id integer PRIMARY KEY,
+  user_id integer REFERENCES users(id)
+);
+CREATE TABLE audit_log (
+  id integer PRIMARY KEY
+);"""
+
+
+class QuietHandler(MockHTTPRequestHandler):
+    prompt_cache = set()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestStableSchemaPrefix(unittest.TestCase):
+    """稳定schema前缀测试类"""
+
+    def setUp(self):
+        self.tables, _ = parse_tables(SCHEMA)
+
+    def test_prefix_selects_frequent_tables_after_warmup(self):
+        """测试预热后按频次选表，且刷新周期内前缀不变"""
+        prefix = StableSchemaPrefix(token_budget=1000, refresh_seconds=3600, warmup_requests=3,
+                                    count_tokens=approx_tokens)
+        for _ in range(3):
+            prefix.record(self.tables[:2])
+        prefix.record(self.tables[2:])
+        self.assertTrue(prefix.maybe_refresh(now=prefix._refreshed_at))
+        self.assertEqual(prefix.tables, frozenset({'users', 'orders', 'audit_log'}))
+        text = prefix.text
+        self.assertTrue(text.startswith("audit_log("))
+
+        prefix.record(self.tables[:1])
+        self.assertFalse(prefix.maybe_refresh(now=prefix._refreshed_at + 10))
+        self.assertEqual(prefix.text, text)
+
+    def test_prefix_respects_budget(self):
+        """测试前缀不超过token预算，优先高频表"""
+        prefix = StableSchemaPrefix(token_budget=12, warmup_requests=1, count_tokens=approx_tokens)
+        prefix.record(self.tables[:1])
+        prefix.record(self.tables)
+        prefix.maybe_refresh()
+        self.assertIn('users', prefix.tables)
+        self.assertLessEqual(approx_tokens(prefix.text), 12)
+
+        prefix.reset()
+        self.assertEqual((prefix.text, prefix.tables), ("", frozenset()))
+
+    def test_builder_moves_prefix_tables_to_system(self):
+        """测试前缀中的表从用户prompt移入可缓存的system块"""
+        builder = PromptBuilder(count_tokens=approx_tokens,
+                                prefix=StableSchemaPrefix(warmup_requests=1, count_tokens=approx_tokens))
+        prompt, _ = builder.build("list users", SCHEMA)
+        blocks = builder.system_blocks("你是一个SQL专家。")
+
+        self.assertEqual(blocks[0]['cache_control'], {'type': 'ephemeral'})
+        self.assertIn("users(", blocks[0]['text'])
+        self.assertNotIn("users(", prompt)
+        self.assertIn("用户查询: list users", prompt)
+
+
+class TestMockPromptCache(unittest.TestCase):
+    """Mock服务器提示缓存计量测试类"""
+
+    def setUp(self):
+        self.server = socketserver.TCPServer(("127.0.0.1", 0), QuietHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/messages"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, payload):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def test_second_request_reads_cache(self):
+        """测试相同前缀首次写入缓存、再次请求读取缓存"""
+        system = [{"type": "text", "text": "你是一个SQL专家。\n\n常用表Schema:\nusers(id int PK)",
+                   "cache_control": {"type": "ephemeral"}}]
+        first = self.post({"system": system, "messages": [{"role": "user", "content": "q1"}]})
+        second = self.post({"system": system, "messages": [{"role": "user", "content": "q2"}]})
+
+        self.assertGreater(first['usage']['cache_creation_input_tokens'], 0)
+        self.assertEqual(first['usage']['cache_read_input_tokens'], 0)
+        self.assertEqual(second['usage']['cache_creation_input_tokens'], 0)
+        self.assertEqual(second['usage']['cache_read_input_tokens'],
+                         first['usage']['cache_creation_input_tokens'])
+        self.assertEqual(second['content'][0]['type'], 'text')
+
+        plain = self.post({"system": "no cache", "messages": [{"role": "user", "content": "q"}]})
+        self.assertEqual(plain['usage']['cache_read_input_tokens'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
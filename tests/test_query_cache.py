@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+查询缓存单元测试
+女娲造物：测则明，试则安
+"""
+
+import asyncio
+import sys
+import os
+import time
+import unittest
+
+# 添加路径以导入query_cache
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from query_cache import LRUCache, QueryCache, CacheBackend, make_cache_key, normalize_query
+
+
+class InMemoryBackend(CacheBackend):
+    """测试用共享后端"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ttl_seconds):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TestQueryCache(unittest.TestCase):
+    """查询缓存测试类"""
+
+    def test_backend_interface_is_abstract(self):
+        """测试共享后端必须实现get/set/delete"""
+        class PartialBackend(CacheBackend):
+            async def get(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            PartialBackend()
+        InMemoryBackend()
+
+    def test_normalize_query(self):
+        """测试查询规范化"""
+        self.assertEqual(normalize_query("  List ALL   users? "), "list all users")
+        self.assertEqual(normalize_query("查询所有用户。"), "查询所有用户")
+
+    def test_cache_key_components(self):
+        """测试缓存键包含上下文、白名单版本与schema指纹"""
+        base = make_cache_key("list users", {"a": 1}, "1.0:abc", "fp1")
+        self.assertEqual(base, make_cache_key("List users ", {"a": 1}, "1.0:abc", "fp1"))
+        self.assertNotEqual(base, make_cache_key("list users", {"a": 2}, "1.0:abc", "fp1"))
+        self.assertNotEqual(base, make_cache_key("list users", {"a": 1}, "1.0:def", "fp1"))
+        self.assertNotEqual(base, make_cache_key("list users", {"a": 1}, "1.0:abc", "fp2"))
+
+    def test_lru_ttl_expiry(self):
+        """测试TTL过期"""
+        evictions = []
+        cache = LRUCache(ttl_seconds=0.01, on_evict=evictions.append)
+        cache.set("k", {"sql": "SELECT 1"})
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(evictions, ['expired'])
+        self.assertEqual(cache.current_bytes, 0)
+
+    def test_lru_byte_budget(self):
+        """测试字节预算淘汰最久未使用条目"""
+        evictions = []
+        cache = LRUCache(max_bytes=100, ttl_seconds=60, on_evict=evictions.append)
+        cache.set("a", {"sql": "x" * 30})
+        cache.set("b", {"sql": "y" * 30})
+        cache.get("a")
+        cache.set("c", {"sql": "z" * 30})
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(evictions, ['capacity'])
+        self.assertLessEqual(cache.current_bytes, 100)
+
+    def test_two_tier_backfill(self):
+        """测试L2命中后回填L1"""
+        async def _test():
+            backend = InMemoryBackend()
+            writer = QueryCache(shared_backend=backend)
+            await writer.set("k", {"sql": "SELECT 1"})
+
+            reader = QueryCache(shared_backend=backend)
+            value, tier = await reader.get("k")
+            self.assertEqual(value, {"sql": "SELECT 1"})
+            self.assertEqual(tier, 'l2')
+
+            value, tier = await reader.get("k")
+            self.assertEqual(tier, 'l1')
+
+            value, tier = await reader.get("missing")
+            self.assertIsNone(value)
+            self.assertIsNone(tier)
+
+        asyncio.run(_test())
+
+
+if __name__ == "__main__":
+    unittest.main()
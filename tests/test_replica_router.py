@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+只读副本路由单元测试
+女娲造物：测则明，试则安
+"""
+
+import asyncio
+import sys
+import os
+import unittest
+
+# 添加路径以导入replica_router
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from replica_router import ReadReplicaRouter
+
+
+class FakeEngine:
+    """测试用引擎：只记录是否被释放"""
+
+    def __init__(self):
+        self.disposed = False
+
+    async def dispose(self):
+        self.disposed = True
+
+
+class TestReadReplicaRouter(unittest.TestCase):
+    """只读副本路由测试类"""
+
+    def setUp(self):
+        self.down = set()
+        self.changes = []
+        self.engines = {'r1': FakeEngine(), 'r2': FakeEngine()}
+
+        async def probe(db_engine):
+            if any(self.engines[name] is db_engine for name in self.down):
+                raise ConnectionError("replica down")
+
+        self.router = ReadReplicaRouter(
+            list(self.engines.items()),
+            failure_threshold=2,
+            probe=probe,
+            on_health_change=lambda name, healthy: self.changes.append((name, healthy))
+        )
+
+    def test_least_connections(self):
+        """测试选择进行中查询最少的副本"""
+        async def _test():
+            async with self.router.route() as first:
+                async with self.router.route() as second:
+                    self.assertNotEqual(first.name, second.name)
+                    first.in_flight += 5
+                    self.assertEqual(self.router.pick().name, second.name)
+                    first.in_flight -= 5
+            self.assertEqual([r.in_flight for r in self.router.replicas], [0, 0])
+
+        asyncio.run(_test())
+
+    def test_failure_threshold_and_recovery(self):
+        """测试连续失败达到阈值才摘除，恢复后重新加入"""
+        async def _test():
+            self.down.add('r2')
+            await self.router.check_health()
+            self.assertTrue(self.router.replicas[1].healthy)
+
+            await self.router.check_health()
+            self.assertFalse(self.router.replicas[1].healthy)
+            self.assertEqual({self.router.pick().name for _ in range(4)}, {'r1'})
+
+            self.down.clear()
+            await self.router.check_health()
+            self.assertTrue(self.router.replicas[1].healthy)
+            self.assertEqual(self.changes[-2:], [('r2', False), ('r2', True)])
+
+        asyncio.run(_test())
+
+    def test_no_healthy_replica_yields_none(self):
+        """测试无健康副本时返回None供调用方回退主库"""
+        async def _test():
+            self.down.update(self.engines)
+            for _ in range(2):
+                await self.router.check_health()
+
+            async with self.router.route() as replica:
+                self.assertIsNone(replica)
+
+            await self.router.close()
+            self.assertTrue(all(engine.disposed for engine in self.engines.values()))
+
+        asyncio.run(_test())
+
+
+if __name__ == "__main__":
+    unittest.main()
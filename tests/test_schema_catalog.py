@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Schema目录模糊检索单元测试
+女娲造物：测则明，试则安
+"""
+
+import os
+import sys
+import unittest
+
+# 添加路径以导入schema_catalog
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from schema_catalog import FuzzyNameIndex, SchemaCatalog, edit_distance
+
+
+class TestSchemaCatalog(unittest.TestCase):
+    """Schema目录测试类"""
+
+    def setUp(self):
+        self.catalog = SchemaCatalog({
+            'users': ['id', 'email', 'stats', 'created_at'],
+            'orders': ['id', 'user_id', 'state', 'created_at'],
+            'sales.orders': ['id', 'amount'],
+            'Audit_Log': ['ID', 'Action'],
+        })
+
+    def test_edit_distance_transposition_and_cutoff(self):
+        """测试相邻换位记为一次编辑，超出上限提前返回"""
+        self.assertEqual(edit_distance('emial', 'email', 2), 1)
+        self.assertEqual(edit_distance('usres', 'users', 2), 1)
+        self.assertEqual(edit_distance('orders', 'order_items', 2), 3)
+        self.assertEqual(edit_distance('orders', 'order_items', 5), 5)
+
+    def test_index_ranks_by_distance_then_similarity(self):
+        """测试按编辑距离排序，过远且三元组相似度低的名字被过滤"""
+        index = FuzzyNameIndex(['user_email', 'user_id', 'user_name', 'invoice_total'])
+        matches = [name for _, _, name in index.search('user_nmae')]
+        self.assertEqual(matches[0], 'user_name')
+        self.assertNotIn('invoice_total', matches)
+        self.assertEqual(index.search('zzz'), [])
+
+    def test_similar_tables_prefers_same_schema(self):
+        """测试表名按裸名检索，同名表优先缺失表所在schema"""
+        self.assertEqual(self.catalog.similar_tables('ordrs')[:2], ['orders', 'sales.orders'])
+        self.assertEqual(self.catalog.similar_tables('sales.ordrs')[:2], ['sales.orders', 'orders'])
+        self.assertEqual(self.catalog.similar_tables('audit_lgo'), ['audit_log'])
+
+    def test_similar_columns_owner_table_first(self):
+        """测试同等编辑距离下缺失列所属表的列优先"""
+        referenced = ['users', 'orders']
+        self.assertEqual(self.catalog.similar_columns('stat', referenced, owner_tables=['orders'])[0], 'state')
+        self.assertEqual(self.catalog.similar_columns('stat', referenced, owner_tables=['users'])[0], 'stats')
+        # 未引用已知表时退回全部列
+        self.assertIn('amount', self.catalog.similar_columns('amount', ['missing_table']))
+        self.assertEqual(self.catalog.resolve(['orders', 'ORDERS']), ['orders', 'orders'])
+
+    def test_from_tables(self):
+        """测试由introspect_schema结果构建目录"""
+        catalog = SchemaCatalog.from_tables([
+            {'name': 'users', 'columns': [{'name': 'id', 'type': 'integer', 'nullable': False}]}
+        ])
+        self.assertEqual(catalog.tables, {'users': ['id']})
+        self.assertEqual(catalog.column_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
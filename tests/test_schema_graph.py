@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+外键关系图单元测试
+女娲造物：测则明，试则安
+"""
+
+import sys
+import os
+import unittest
+
+# 添加路径以导入schema_graph
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from schema_graph import SchemaGraph
+
+COLLECTION_DATA = {
+    'ids': ['users', 'orders', 'order_items', 'products', 'categories', 'audit_log'],
+    'documents': [
+        "CREATE TABLE users (id integer);",
+        "CREATE TABLE orders (id integer, user_id integer REFERENCES users(id));",
+        "CREATE TABLE order_items (order_id integer REFERENCES orders(id), product_id integer REFERENCES products(id));",
+        "CREATE TABLE products (id integer, category_id integer REFERENCES categories(id));",
+        "CREATE TABLE categories (id integer);",
+        "CREATE TABLE audit_log (id integer);",
+    ],
+    'metadatas': [
+        {'table': 'users', 'references': ''},
+        {'table': 'orders', 'references': 'users'},
+        {'table': 'order_items', 'references': 'orders,products'},
+        {'table': 'products', 'references': 'categories'},
+        {'table': 'categories', 'references': ''},
+        {'table': 'audit_log', 'references': ''},
+    ]
+}
+
+
+class TestSchemaGraph(unittest.TestCase):
+    """外键关系图测试类"""
+
+    def setUp(self):
+        self.graph = SchemaGraph.from_collection_data(COLLECTION_DATA)
+
+    def test_shortest_path(self):
+        """测试最短连接路径与跳数上限"""
+        self.assertEqual(self.graph.shortest_path('orders', 'products'), ['orders', 'order_items', 'products'])
+        self.assertEqual(len(self.graph.shortest_path('users', 'categories', max_hops=4)), 5)
+        self.assertIsNone(self.graph.shortest_path('users', 'categories', max_hops=3))
+        self.assertIsNone(self.graph.shortest_path('users', 'audit_log'))
+        self.assertEqual(self.graph.edge_count, 4)
+
+    def test_expand_adds_bridge_table(self):
+        """测试在命中表之间补充桥接表"""
+        expanded = self.graph.expand(['orders', 'products'], token_budget=1000)
+        self.assertEqual(expanded, ['orders', 'products', 'order_items'])
+
+        self.assertEqual(self.graph.expand(['users', 'audit_log'], token_budget=1000), ['users', 'audit_log'])
+
+    def test_expand_respects_token_budget(self):
+        """测试超出token预算时不加入桥接表"""
+        base = self.graph.expand(['orders', 'products'], token_budget=0)
+        self.assertEqual(base, ['orders', 'products'])
+
+        unit = self.graph.expand(['orders', 'products'], token_budget=3, count_tokens=lambda text: 1)
+        self.assertEqual(unit, ['orders', 'products', 'order_items'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+本地Schema索引单元测试
+女娲造物：测则明，试则安
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+
+# 添加路径以导入schema_index
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from schema_index import LocalSchemaIndex
+
+VOCABULARY = ['user', 'order', 'product', 'email', 'price', 'stock']
+
+
+def bag_of_words(texts):
+    """测试用embedding：按固定词表计数"""
+    return [[text.lower().count(word) for word in VOCABULARY] for text in texts]
+
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.get_calls = 0
+
+    def get(self, include=None):
+        self.get_calls += 1
+        return {
+            'ids': [f"chunk-{i}" for i in range(len(self.documents))],
+            'documents': self.documents,
+            'embeddings': bag_of_words(self.documents)
+        }
+
+
+class TestLocalSchemaIndex(unittest.TestCase):
+    """本地Schema索引测试类"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.documents = [
+            "TABLE users: user id, email",
+            "TABLE orders: order id, user id, price",
+            "TABLE products: product id, price, stock",
+        ]
+        self.collection = FakeCollection(self.documents)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_top_k_order(self):
+        """测试按余弦相似度降序返回top-k"""
+        index = LocalSchemaIndex(self.tmp.name, bag_of_words)
+        index.sync_from_collection(self.collection, "fp1")
+
+        ids, results = index.query(["user email", "product stock price"], n_results=2)
+        self.assertEqual(results[0][0], self.documents[0])
+        self.assertEqual(results[1][0], self.documents[2])
+        self.assertEqual(ids[1][0], "chunk-2")
+        self.assertEqual(len(results[0]), 2)
+
+        self.assertEqual(len(index.query(["order"], n_results=10)[1][0]), 3)
+
+    def test_load_from_disk_and_fingerprint(self):
+        """测试mmap加载与指纹校验，指纹不变时不重建"""
+        LocalSchemaIndex(self.tmp.name, bag_of_words).sync_from_collection(self.collection, "fp1")
+
+        index = LocalSchemaIndex(self.tmp.name, bag_of_words)
+        self.assertFalse(index.load("fp2"))
+        self.assertTrue(index.load(None))
+        self.assertTrue(index.ready)
+        self.assertEqual(index.fingerprint, "fp1")
+
+        self.assertFalse(index.sync_from_collection(self.collection, "fp1"))
+        self.assertEqual(self.collection.get_calls, 1)
+
+        self.collection.documents = self.documents[:2]
+        self.assertTrue(index.sync_from_collection(self.collection, "fp2"))
+        self.assertEqual(len(index.documents), 2)
+
+    def test_missing_index(self):
+        """测试无磁盘索引时未就绪"""
+        index = LocalSchemaIndex(os.path.join(self.tmp.name, "absent"), bag_of_words)
+        self.assertFalse(index.load())
+        self.assertFalse(index.ready)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Schema入库单元测试
+女娲造物：测则明，试则安
+"""
+
+import asyncio
+import copy
+import sys
+import os
+import unittest
+
+# 添加路径以导入schema_ingest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from schema_ingest import SchemaIngestor, build_chunks, render_chunk
+
+TABLES = [
+    {
+        'name': 'users',
+        'columns': [
+            {'name': 'id', 'type': 'integer', 'nullable': False},
+            {'name': 'email', 'type': 'text', 'nullable': True},
+        ],
+        'primary_key': ['id'],
+        'foreign_keys': [],
+        'row_estimate': 12345,
+        'comment': '用户表'
+    },
+    {
+        'name': 'orders',
+        'columns': [
+            {'name': 'id', 'type': 'integer', 'nullable': False},
+            {'name': 'user_id', 'type': 'integer', 'nullable': False},
+        ],
+        'primary_key': ['id'],
+        'foreign_keys': [{'columns': ['user_id'], 'ref_table': 'users', 'ref_columns': ['id']}],
+        'row_estimate': 5,
+        'comment': None
+    },
+]
+
+
+class FakeCollection:
+    """测试用Chroma集合：记录写入次数"""
+
+    def __init__(self):
+        self.entries = {}
+        self.metadata = None
+        self.upserted = []
+
+    def get(self, include=None):
+        ids = list(self.entries)
+        return {'ids': ids, 'metadatas': [self.entries[i][1] for i in ids]}
+
+    def upsert(self, ids, documents, metadatas):
+        self.upserted.extend(ids)
+        for entry_id, doc, meta in zip(ids, documents, metadatas):
+            self.entries[entry_id] = (doc, meta)
+
+    def delete(self, ids):
+        for entry_id in ids:
+            self.entries.pop(entry_id, None)
+
+    def modify(self, metadata):
+        self.metadata = metadata
+
+
+class TestSchemaIngest(unittest.TestCase):
+    """Schema入库测试类"""
+
+    def test_render_chunk(self):
+        """测试块内容包含类型、主外键与行数量级"""
+        users, orders = render_chunk(TABLES[0]), render_chunk(TABLES[1])
+        self.assertIn("-- rows: 10,000+; 用户表", users)
+        self.assertIn("id integer NOT NULL PRIMARY KEY", users)
+        self.assertIn("user_id integer NOT NULL REFERENCES users(id)", orders)
+        self.assertIn("-- rows: <10", orders)
+
+    def test_row_estimate_drift_keeps_hash(self):
+        """测试同一数量级内的行数波动不改变内容哈希"""
+        drifted = copy.deepcopy(TABLES)
+        drifted[0]['row_estimate'] = 19000
+        self.assertEqual(
+            build_chunks(TABLES)[0]['metadata']['content_hash'],
+            build_chunks(drifted)[0]['metadata']['content_hash']
+        )
+
+    def test_incremental_sync(self):
+        """测试只upsert变化的块并删除已不存在的表"""
+        async def _test():
+            collection = FakeCollection()
+            counts = []
+            ingestor = SchemaIngestor(collection, on_chunk=lambda outcome, n: counts.append((outcome, n)))
+
+            first = await ingestor.sync(build_chunks(TABLES))
+            self.assertEqual((first['changed'], first['unchanged']), (2, 0))
+            first_hash = collection.metadata['schema_hash']
+
+            second = await ingestor.sync(build_chunks(TABLES))
+            self.assertEqual((second['changed'], second['unchanged']), (0, 2))
+            self.assertEqual(collection.upserted, ['users', 'orders'])
+
+            altered = copy.deepcopy(TABLES[:1])
+            altered[0]['columns'].append({'name': 'status', 'type': 'text', 'nullable': True})
+            third = await ingestor.sync(build_chunks(altered))
+            self.assertEqual((third['changed'], third['deleted']), (1, 1))
+            self.assertEqual(set(collection.entries), {'users'})
+            self.assertNotEqual(collection.metadata['schema_hash'], first_hash)
+            self.assertEqual(counts[-3:], [('changed', 1), ('unchanged', 0), ('deleted', 1)])
+
+        asyncio.run(_test())
+
+    def test_dry_run_writes_nothing(self):
+        """测试dry_run只报告不写入"""
+        async def _test():
+            collection = FakeCollection()
+            stats = await SchemaIngestor(collection).sync(build_chunks(TABLES), dry_run=True)
+            self.assertEqual(stats['changed'], 2)
+            self.assertEqual(collection.entries, {})
+            self.assertIsNone(collection.metadata)
+
+        asyncio.run(_test())
+
+
+if __name__ == "__main__":
+    unittest.main()
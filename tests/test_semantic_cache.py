@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+语义缓存单元测试
+女娲造物：测则明，试则安
+"""
+
+import sys
+import os
+import time
+import unittest
+
+# 添加路径以导入semantic_cache
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from semantic_cache import SemanticQueryCache
+
+
+class FakeCollection:
+    """测试用Chroma集合：按词集合Jaccard相似度模拟余弦距离"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def _similarity(self, a, b):
+        wa, wb = set(a.split()), set(b.split())
+        return len(wa & wb) / len(wa | wb) if wa | wb else 0.0
+
+    def query(self, query_texts, n_results, where=None):
+        conditions = where["$and"] if where else []
+        candidates = [
+            (entry_id, doc, meta) for entry_id, (doc, meta) in self.entries.items()
+            if all(meta.get(k) == v for cond in conditions for k, v in cond.items())
+        ]
+        if not candidates:
+            return {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+        best = max(candidates, key=lambda c: self._similarity(query_texts[0], c[1]))
+        return {
+            'ids': [[best[0]]],
+            'documents': [[best[1]]],
+            'metadatas': [[best[2]]],
+            'distances': [[1.0 - self._similarity(query_texts[0], best[1])]]
+        }
+
+    def upsert(self, ids, documents, metadatas):
+        for entry_id, doc, meta in zip(ids, documents, metadatas):
+            self.entries[entry_id] = (doc, dict(meta))
+
+    def update(self, ids, metadatas):
+        for entry_id, meta in zip(ids, metadatas):
+            self.entries[entry_id][1].update(meta)
+
+    def count(self):
+        return len(self.entries)
+
+    def get(self, include=None):
+        ids = list(self.entries)
+        return {'ids': ids, 'metadatas': [self.entries[i][1] for i in ids]}
+
+    def delete(self, ids):
+        for entry_id in ids:
+            self.entries.pop(entry_id, None)
+
+
+class FakeVectorDB:
+    def __init__(self):
+        self.collection = FakeCollection()
+
+    def get_or_create_collection(self, name, metadata=None):
+        return self.collection
+
+
+class TestSemanticQueryCache(unittest.TestCase):
+    """语义缓存测试类"""
+
+    def setUp(self):
+        self.evictions = []
+        self.cache = SemanticQueryCache(
+            FakeVectorDB(),
+            similarity_threshold=0.6,
+            max_entries=10,
+            on_evict=self.evictions.append
+        )
+
+    def test_lookup_threshold(self):
+        """测试相似度阈值命中与未命中"""
+        self.cache.store("list all user emails", "SELECT email FROM users", "v1", "fp")
+
+        hit = self.cache.lookup("list all users emails", "v1", "fp")
+        self.assertTrue(hit['hit'])
+        self.assertEqual(hit['sql'], "SELECT email FROM users")
+
+        miss = self.cache.lookup("count orders per day", "v1", "fp")
+        self.assertFalse(miss['hit'])
+
+    def test_lookup_scoped_to_versions(self):
+        """测试白名单版本或schema指纹变化后不复用旧SQL"""
+        self.cache.store("list all user emails", "SELECT email FROM users", "v1", "fp")
+        self.assertIsNone(self.cache.lookup("list all user emails", "v2", "fp"))
+        self.assertIsNone(self.cache.lookup("list all user emails", "v1", "fp2"))
+
+    def test_lookup_scoped_to_context(self):
+        """测试不同上下文下的相同问题不复用SQL，上下文键顺序不影响命中"""
+        self.cache.store("list all user emails", "SELECT email FROM users WHERE region = 'eu'", "v1", "fp",
+                         {'region': 'eu', 'team': 'sales'})
+
+        self.assertIsNone(self.cache.lookup("list all user emails", "v1", "fp"))
+        self.assertIsNone(self.cache.lookup("list all user emails", "v1", "fp", {'region': 'us'}))
+        hit = self.cache.lookup("list all user emails", "v1", "fp", {'team': 'sales', 'region': 'eu'})
+        self.assertTrue(hit['hit'])
+        self.assertEqual(hit['sql'], "SELECT email FROM users WHERE region = 'eu'")
+
+    def test_expired_entry_evicted(self):
+        """测试过期条目在查找时淘汰"""
+        self.cache.max_age_seconds = 0
+        self.cache.store("list all user emails", "SELECT email FROM users", "v1", "fp")
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.lookup("list all user emails", "v1", "fp"))
+        self.assertEqual(self.evictions, ['semantic_age'])
+
+    def test_capacity_eviction_keeps_recently_used(self):
+        """测试超出容量时淘汰最近最少使用的条目"""
+        self.cache.store("question 0", "SELECT 0", "v1", "fp")
+        time.sleep(0.01)
+        for i in range(1, 10):
+            self.cache.store(f"question {i}", f"SELECT {i}", "v1", "fp")
+
+        hit = self.cache.lookup("question 0", "v1", "fp")
+        self.cache.touch(hit['id'], hit['hits'])
+        self.cache.store("question 10", "SELECT 10", "v1", "fp")
+
+        self.assertEqual(self.cache.collection.count(), 9)
+        self.assertEqual(self.evictions, ['semantic_capacity', 'semantic_capacity'])
+        docs = {doc for doc, _ in self.cache.collection.entries.values()}
+        self.assertIn("question 0", docs)
+        self.assertNotIn("question 1", docs)
+
+
+if __name__ == "__main__":
+    unittest.main()
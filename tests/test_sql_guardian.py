@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+SQLGuardian 单元测试
+女娲造物：测则明，试则安
+"""
+
+import re
+import sys
+import os
+import unittest
+
+# 添加路径以导入sql_guardian
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'db-gpt'))
+
+from sql_guardian import SQLGuardian, analyze_sql, is_query, probe_sql, scan_partial_sql, statement_end
+
+# 原逐条正则实现的危险规则，用于验证单遍扫描结果一致
+LEGACY_DANGEROUS_PATTERNS = [
+    (r'(?i)\b(drop|delete|update|insert|alter|truncate|create|grant|revoke)\b', 'CRITICAL_OPERATION'),
+    (r'(?i)\b(exec|execute|xp_|sp_)\b', 'SYSTEM_COMMAND'),
+    (r'(?i)(union.*select|select.*union)', 'POSSIBLE_INJECTION'),
+    (r'(?i)(;.*--|--.*)', 'SQL_COMMENT_INJECTION'),
+    (r'(?i)(\|\||&&|concat)', 'STRING_MANIPULATION')
+]
+
+
+def legacy_blocked_reason(sql):
+    for pattern, risk_type in LEGACY_DANGEROUS_PATTERNS:
+        if re.search(pattern, sql, re.IGNORECASE):
+            return risk_type
+    return None
+
+
+class TestSQLGuardian(unittest.TestCase):
+    """SQLGuardian测试类"""
+
+    def setUp(self):
+        self.guardian = SQLGuardian({'allowed_tables': ['users', 'orders']})
+
+    def test_result_shape(self):
+        """测试返回结构与原验证器一致"""
+        result = self.guardian.validate("SELECT id FROM users")
+        self.assertEqual(set(result), {'status', 'risks', 'suggestions', 'confidence', 'blocked_reason'})
+        self.assertEqual(result['status'], 'PASS')
+        self.assertAlmostEqual(result['confidence'], 0.95)
+
+    def test_danger_rules_match_legacy(self):
+        """测试危险规则与原正则实现结果一致（含优先级）"""
+        corpus = [
+            "SELECT id FROM users",
+            "DROP TABLE users",
+            "SELECT * FROM users; DELETE FROM users",
+            "SELECT 1 -- drop",
+            "SELECT drop_date FROM orders",
+            "EXEC xp_cmdshell 'dir'",
+            "SELECT xp_ FROM t",
+            "SELECT id FROM users UNION SELECT password FROM admins",
+            "SELECT id FROM users\nUNION\nSELECT 1",
+            "SELECT a || b FROM users",
+            "SELECT CONCAT(a, b) FROM users",
+            "SELECT group_concat(a) FROM users -- x",
+            "SELECT 1 && 2",
+            "select id from users where name = 'updated'",
+            "SELECT id FROM users WHERE x = 1; --",
+            "SELECT unionized FROM selected",
+        ]
+        for sql in corpus:
+            with self.subTest(sql=sql):
+                expected = legacy_blocked_reason(sql)
+                result = self.guardian.validate(sql)
+                if expected is None:
+                    self.assertNotEqual(result['status'], 'BLOCK')
+                else:
+                    self.assertEqual(result['status'], 'BLOCK')
+                    self.assertEqual(result['blocked_reason'], expected)
+                    self.assertEqual(result['confidence'], 0.0)
+
+    def test_non_select_blocked(self):
+        """测试非SELECT语句被阻断"""
+        result = self.guardian.validate("SHOW search_path")
+        self.assertEqual(result['status'], 'BLOCK')
+        self.assertEqual(result['blocked_reason'], 'NON_SELECT_OPERATION')
+
+        result = self.guardian.validate("SELECT id FROM users; SELECT 2")
+        self.assertEqual(result['status'], 'BLOCK')
+        self.assertEqual(result['blocked_reason'], 'MULTIPLE_STATEMENTS')
+
+    def test_select_suggestions(self):
+        """测试子查询、JOIN与通配符建议"""
+        sql = ("SELECT * FROM users u " + " ".join(f"JOIN orders o{i} ON o{i}.user_id = u.id" for i in range(6))
+               + " WHERE u.id IN (SELECT 1) AND u.id IN (SELECT 2) AND u.id IN (SELECT 3)")
+        result = self.guardian.validate(sql)
+        self.assertEqual(result['suggestions'], [
+            "Deep nested subqueries detected",
+            "Too many JOINs may affect performance",
+            "SELECT * usage - consider specifying columns",
+        ])
+        self.assertAlmostEqual(result['confidence'], 0.75)
+
+    def test_whitelist_warning(self):
+        """测试白名单外的表给出WARN"""
+        result = self.guardian.validate("SELECT id\nFROM\n  payments")
+        self.assertEqual(result['status'], 'WARN')
+        self.assertIn("Table 'payments' not in whitelist", result['risks'])
+
+        result = self.guardian.validate("SELECT id FROM Users")
+        self.assertEqual(result['status'], 'PASS')
+
+    def test_partial_scan(self):
+        """测试流式部分SQL的危险关键字扫描，末尾未写完的词不误判"""
+        self.assertEqual(scan_partial_sql("DROP TABLE "), 'CRITICAL_OPERATION')
+        self.assertEqual(scan_partial_sql("SELECT 1; exec "), 'SYSTEM_COMMAND')
+        self.assertIsNone(scan_partial_sql("SELECT update"))
+        self.assertEqual(scan_partial_sql("SELECT update,"), 'CRITICAL_OPERATION')
+        self.assertIsNone(scan_partial_sql("SELECT updated_at FROM users"))
+
+    def test_statement_end(self):
+        """测试引号外分号识别语句结束"""
+        self.assertIsNone(statement_end("SELECT id FROM users WHERE name = 'a;b"))
+        sql = "SELECT id FROM users WHERE name = 'a;b';\n说明"
+        self.assertEqual(sql[:statement_end(sql)], "SELECT id FROM users WHERE name = 'a;b';")
+
+
+class TestSQLGuardianAnalysis(unittest.TestCase):
+    """AST表/列分析与策略执行测试类"""
+
+    def setUp(self):
+        self.guardian = SQLGuardian({
+            'allowed_tables': ['users', 'orders', 'order_items'],
+            'table_permissions': {
+                'users': {
+                    'allowed_columns': ['id', 'username', 'email'],
+                    'blocked_columns': ['password'],
+                    'max_rows': 1000
+                },
+                'orders': {'allowed_columns': ['*'], 'max_rows': 2000}
+            },
+            'query_limits': {'max_result_rows': 10000}
+        })
+
+    def test_analysis_extracts_all_tables(self):
+        """测试JOIN、CTE与子查询中的表均被提取，CTE名不算表"""
+        analysis = analyze_sql(
+            "WITH recent AS (SELECT id, user_id FROM orders) "
+            "SELECT u.email FROM users u JOIN recent r ON r.user_id = u.id "
+            "WHERE u.id IN (SELECT user_id FROM payments)"
+        )
+        self.assertEqual(analysis['tables'], frozenset({'users', 'orders', 'payments'}))
+        self.assertEqual(analysis['columns']['users'], frozenset({'email', 'id'}))
+
+    def test_analysis_memoized(self):
+        """测试相同SQL不重复解析"""
+        sql = "SELECT id FROM orders WHERE id = 42"
+        self.assertIs(analyze_sql(sql), analyze_sql(sql))
+
+    def test_joined_table_whitelist(self):
+        """测试JOIN的非白名单表同样给出WARN"""
+        result = self.guardian.validate(
+            "SELECT o.id FROM orders o JOIN payments p ON p.order_id = o.id LIMIT 10"
+        )
+        self.assertEqual(result['status'], 'WARN')
+        self.assertIn("Table 'payments' not in whitelist", result['risks'])
+
+    def test_blocked_column(self):
+        """测试黑名单列被阻断（含别名限定与子查询）"""
+        for sql in ("SELECT id, password FROM users",
+                    "SELECT o.id FROM orders o JOIN users u ON u.id = o.user_id WHERE u.password = 'x'",
+                    "SELECT id FROM orders WHERE user_id IN (SELECT id FROM users WHERE password IS NULL)"):
+            with self.subTest(sql=sql):
+                result = self.guardian.validate(sql)
+                self.assertEqual(result['status'], 'BLOCK')
+                self.assertEqual(result['blocked_reason'], 'BLOCKED_COLUMN')
+
+    def test_column_not_allowed(self):
+        """测试不在允许列表中的列被阻断"""
+        result = self.guardian.validate("SELECT id, salt FROM users")
+        self.assertEqual(result['blocked_reason'], 'COLUMN_NOT_ALLOWED')
+
+    def test_limit_rewrite(self):
+        """测试按max_rows追加或收紧LIMIT"""
+        result = self.guardian.validate("SELECT o.id, u.email FROM orders o JOIN users u ON u.id = o.user_id")
+        self.assertEqual(result['fixed_sql'],
+                         "SELECT o.id, u.email FROM orders o JOIN users u ON u.id = o.user_id LIMIT 1000")
+        self.assertIn("LIMIT 1000 applied (max_rows)", result['suggestions'])
+
+        result = self.guardian.validate("SELECT id FROM orders LIMIT 50000")
+        self.assertTrue(result['fixed_sql'].endswith("LIMIT 2000"))
+
+        result = self.guardian.validate("SELECT id FROM orders LIMIT 10")
+        self.assertNotIn('fixed_sql', result)
+
+    def test_limit_appended_without_rerendering(self):
+        """测试仅追加LIMIT时保留原SQL文本（不经sqlglot改写类型转换与函数），末尾分号被去掉"""
+        result = self.guardian.validate("SELECT id::text, now() FROM orders;\n")
+        self.assertEqual(result['fixed_sql'], "SELECT id::text, now() FROM orders LIMIT 2000")
+
+        result = self.guardian.validate("SELECT id FROM orders FETCH FIRST 5 ROWS ONLY")
+        self.assertNotIn('fixed_sql', result)
+
+    def test_probe_sql_fetches_one_extra_row(self):
+        """测试执行用SQL仅在LIMIT恰为行数上限时放宽一行"""
+        self.assertEqual(probe_sql("SELECT id FROM orders LIMIT 2000", 2000), "SELECT id FROM orders LIMIT 2001")
+        self.assertEqual(probe_sql("SELECT id FROM orders LIMIT 10", 2000), "SELECT id FROM orders LIMIT 10")
+        self.assertEqual(probe_sql("SELECT id FROM orders LIMIT 2000", None), "SELECT id FROM orders LIMIT 2000")
+
+    def test_star_expanded_for_restricted_table(self):
+        """测试受限表的SELECT *展开为允许列"""
+        result = self.guardian.validate("SELECT * FROM users LIMIT 5")
+        self.assertEqual(result['status'], 'PASS')
+        self.assertEqual(result['fixed_sql'], "SELECT users.id, users.username, users.email FROM users LIMIT 5")
+
+    def test_cte_query_allowed(self):
+        """测试解析确认为查询的WITH语句允许执行"""
+        result = self.guardian.validate("WITH x AS (SELECT id FROM orders) SELECT id FROM x")
+        self.assertEqual(result['status'], 'PASS')
+
+    def test_is_query_by_statement_type(self):
+        """测试按解析出的语句类型区分查询与写操作"""
+        self.assertTrue(is_query("SELECT id FROM orders"))
+        self.assertTrue(is_query("WITH x AS (SELECT id FROM orders) SELECT id FROM x"))
+        self.assertTrue(is_query("SELECT id FROM orders UNION SELECT id FROM users"))
+        self.assertTrue(is_query("SELECT id FROM orders EXCEPT SELECT id FROM users"))
+        self.assertFalse(is_query("UPDATE orders SET status = 'x'"))
+        self.assertFalse(is_query("WITH x AS (SELECT id FROM orders) DELETE FROM orders WHERE id IN (SELECT id FROM x)"))
+        self.assertFalse(is_query("SELECT 1; SELECT 2"))
+
+
+if __name__ == "__main__":
+    unittest.main()